@@ -1,414 +1,489 @@
-from flask import Flask, render_template, request, jsonify
-import subprocess
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+import collections
 import os
 import json
 from datetime import datetime
 import threading
-import requests
-from urllib.parse import urljoin
-import re
+import tempfile
+import time
 import logging
-
-# Configure logging to file
-logging.basicConfig(
-    filename='/tmp/spotdl-debug.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from library_index import LibraryIndex
+from scheduler import DownloadScheduler
+from navidrome_catalog import NavidromeCatalog
+from subsonic_client import SubsonicClient
+from scan_coordinator import ScanCoordinator, ScanGroup
+from sync_schedule import SyncSchedule
+from events import EventBus
+from progress import SpotdlProgress, STATE_NAMES, SKIPPED, DOWNLOADED, FAILED
+from job_store import JobStore, ACTIVE_STATUSES
+from matcher import LibraryMatcher, EXACT_SCORE, TAG_SCORE, ISRC_SCORE
+import tags
+from file_watcher import FileWatcher
+from shards import AdaptiveConcurrency, ShardedRun, popen_cli
+from spotdl_pool import SpotdlWorkerPool
+from process_io import read_lines
+import retry
+from retry import RetryPolicy, TokenBucket
+from playlist_writer import PlaylistEntry, as_entry, playlist_filename, write_m3u
+from playlist_sync import PlaylistSync
+from metrics import Registry, StageTimer
+import logs
+from logs import job_context
+from textnorm import normalize, artist_keys
+from track_cache import TrackCache, spotify_ref, canonical_url, track_url
+
+# Logging goes through a queue; stdout gets LOG_LEVEL and up, the rotating JSON file everything
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+LOG_FILE = os.environ.get("LOG_FILE", "/tmp/spotdl-debug.log")
+LOG_FILE_LEVEL = os.environ.get("LOG_FILE_LEVEL", "DEBUG").upper()
+LOG_FILE_MAX_BYTES = int(os.environ.get("LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.environ.get("LOG_FILE_BACKUPS", "3"))
+# Debug records allowed per second for each call site, after a burst of LOG_SAMPLE_BURST
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "5"))
+LOG_SAMPLE_BURST = int(os.environ.get("LOG_SAMPLE_BURST", "20"))
+log = logging.getLogger("app")
 
 app = Flask(__name__)
-MUSIC_DIR = "/music"
-downloads = {}
-
-# Verify that MUSIC_DIR is writable on startup
-try:
-    if not os.path.exists(MUSIC_DIR):
-        print(f"[STARTUP] ERROR: MUSIC_DIR does not exist: {MUSIC_DIR}", flush=True)
-    elif not os.access(MUSIC_DIR, os.W_OK):
-        print(f"[STARTUP] ERROR: MUSIC_DIR is not writable: {MUSIC_DIR}", flush=True)
-        stat = os.stat(MUSIC_DIR)
-        print(f"[STARTUP] Directory permissions: {oct(stat.st_mode)}, UID: {stat.st_uid}, GID: {stat.st_gid}", flush=True)
-    else:
-        print(f"[STARTUP] ✓ MUSIC_DIR is writable: {MUSIC_DIR}", flush=True)
-except Exception as e:
-    print(f"[STARTUP] ERROR checking MUSIC_DIR: {str(e)}", flush=True)
+MUSIC_DIR = os.environ.get("MUSIC_DIR", "/music")
+LIBRARY_INDEX_PATH = os.environ.get(
+    "LIBRARY_INDEX_PATH", os.path.expanduser("~/.cache/spotdl-web/library.sqlite"))
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get("MAX_CONCURRENT_DOWNLOADS", "2"))
+JOB_STORE_PATH = os.environ.get(
+    "JOB_STORE_PATH", os.path.expanduser("~/.cache/spotdl-web/jobs.sqlite"))
+JOB_RETENTION_DAYS = int(os.environ.get("JOB_RETENTION_DAYS", "30"))
+JOB_HISTORY_LIMIT = int(os.environ.get("JOB_HISTORY_LIMIT", "1000"))
+TRACK_CACHE_PATH = os.environ.get(
+    "TRACK_CACHE_PATH", os.path.expanduser("~/.cache/spotdl-web/tracks.sqlite"))
+# Seconds a playlist/album track list is trusted before asking Spotify again
+TRACK_CACHE_TTL = int(os.environ.get("TRACK_CACHE_TTL", str(6 * 3600)))
+# Download threads per spotdl process, and spotdl processes across all jobs
+SPOTDL_THREADS = int(os.environ.get("SPOTDL_THREADS", "2"))
+SPOTDL_MAX_PROCESSES = int(os.environ.get("SPOTDL_MAX_PROCESSES", str(max(1, (os.cpu_count() or 2) // SPOTDL_THREADS))))
+# Track URLs handed to each spotdl process of a playlist job
+SPOTDL_SHARD_SIZE = int(os.environ.get("SPOTDL_SHARD_SIZE", "50"))
+# "cli" starts the spotdl CLI for each command; "workers" runs them on warm processes with spotdl's API loaded
+SPOTDL_ENGINE = os.environ.get("SPOTDL_ENGINE", "cli")
+# Warm processes kept (default: SPOTDL_MAX_PROCESSES) and what they run: "spotdl", or "file.py:function" for testing
+SPOTDL_WORKERS = int(os.environ.get("SPOTDL_WORKERS", "0")) or SPOTDL_MAX_PROCESSES
+SPOTDL_WORKER_ENGINE = os.environ.get("SPOTDL_WORKER_ENGINE", "spotdl")
+# spotdl's own retries per song; failed tracks are retried by the app with backoff instead
+SPOTDL_MAX_RETRIES = int(os.environ.get("SPOTDL_MAX_RETRIES", "2"))
+# Runs per batch (first one included), and backoff base in seconds (longer after a rate limit)
+SPOTDL_RETRY_ATTEMPTS = int(os.environ.get("SPOTDL_RETRY_ATTEMPTS", "4"))
+SPOTDL_RETRY_DELAY = float(os.environ.get("SPOTDL_RETRY_DELAY", "5"))
+SPOTDL_RATE_LIMIT_DELAY = float(os.environ.get("SPOTDL_RATE_LIMIT_DELAY", "60"))
+# Retried batches started per second across all jobs, after a burst of SPOTDL_RETRY_BURST
+SPOTDL_RETRY_RATE = float(os.environ.get("SPOTDL_RETRY_RATE", "0.2"))
+SPOTDL_RETRY_BURST = int(os.environ.get("SPOTDL_RETRY_BURST", "5"))
+# "auto" uses inotify when available and polls otherwise; "inotify" or "poll" force one
+FILE_WATCHER = os.environ.get("FILE_WATCHER", "auto")
+# Followed playlists/albums re-synced on a schedule, every SYNC_INTERVAL_HOURS unless set per sync
+SYNC_SCHEDULE_PATH = os.environ.get(
+    "SYNC_SCHEDULE_PATH", os.path.expanduser("~/.cache/spotdl-web/syncs.sqlite"))
+SYNC_INTERVAL_HOURS = float(os.environ.get("SYNC_INTERVAL_HOURS", "24"))
+# Scheduled syncs queue behind downloads submitted by hand (lower values run first)
+SYNC_PRIORITY = int(os.environ.get("SYNC_PRIORITY", "10"))
+# URLs accepted by one POST /download/batch
+MAX_BATCH_URLS = int(os.environ.get("MAX_BATCH_URLS", "1000"))
+# /events streams open at once; each holds a server thread (see gunicorn.conf.py), so keep
+# this well under WEB_THREADS. Browsers turned away poll /list for a while instead
+EVENTS_MAX_STREAMS = int(os.environ.get("EVENTS_MAX_STREAMS", "16"))
+# Seconds before an /events stream is closed; EventSource reconnects from its last event ID
+EVENTS_STREAM_SECONDS = int(os.environ.get("EVENTS_STREAM_SECONDS", "300"))
+# "api" creates playlists through the Subsonic API, "m3u" writes M3U files for Navidrome to import
+PLAYLIST_MODE = os.environ.get("PLAYLIST_MODE", "api")
 
 # Navidrome configuration
-NAVIDROME_URL = "http://navidrome:4533"
-NAVIDROME_USER = "alex"
-NAVIDROME_PASSWORD = "navcube55"
+NAVIDROME_URL = os.environ.get("NAVIDROME_URL", "http://navidrome:4533")
+NAVIDROME_USER = os.environ.get("NAVIDROME_USER", "")
+NAVIDROME_PASSWORD = os.environ.get("NAVIDROME_PASSWORD", "")
+
+# Durable record of every job, opened by create_app(); `downloads` only holds the ones queued or running
+job_store = None
+downloads = {}
+# Last LOG_LINES raw spotdl lines per job as a tuple, joined into "log" only when served
+LOG_LINES = 50
+download_logs = {}
+# Records and log tuples are replaced under this lock, never changed in place, so
+# request threads can read whichever snapshot they got without locking
+records_lock = threading.Lock()
+# Updates that don't change a job's status (progress counts) are written to the
+# job store at most this often per job; the in-memory record is served meanwhile
+PERSIST_INTERVAL = 2.0
+# download_id -> (fields not written yet, time.monotonic() of the last write)
+unsaved_fields = {}
+# Change feed behind /events, so browsers don't have to poll /list
+download_events = EventBus()
+# Number of /events responses being streamed, capped at EVENTS_MAX_STREAMS
+open_event_streams = 0
+event_streams_lock = threading.Lock()
+
+# Served on /metrics in the Prometheus text format
+metrics = Registry()
+job_stage_seconds = metrics.histogram(
+    "spotdl_job_stage_seconds", "Time download jobs spend in each stage", ["stage"])
+jobs_finished = metrics.counter(
+    "spotdl_jobs_finished_total", "Download jobs finished, by final status", ["status"])
+spotdl_retries = metrics.counter(
+    "spotdl_retries_total", "spotdl targets scheduled for another attempt, by failure kind", ["kind"])
+downloaded_bytes = metrics.counter(
+    "spotdl_downloaded_bytes_total", "Bytes of audio files written by spotdl")
+navidrome_request_seconds = metrics.histogram(
+    "navidrome_request_seconds", "Latency of Navidrome API requests", ["endpoint", "outcome"])
+metrics.gauge("spotdl_queue_depth", "Download jobs waiting for a worker",
+              function=lambda: download_scheduler.stats()["queued"])
+metrics.gauge("spotdl_active_workers", "Download jobs currently running",
+              function=lambda: download_scheduler.stats()["running"])
+metrics.gauge("spotdl_processes", "spotdl processes currently running",
+              function=lambda: spotdl_concurrency.running)
+metrics.gauge("spotdl_warm_workers", "Warm spotdl worker processes started",
+              function=lambda: spotdl_workers.stats()["workers"])
+metrics.gauge("spotdl_process_limit", "Current limit on concurrent spotdl processes",
+              function=lambda: spotdl_concurrency.limit)
+metrics.gauge("events_open_streams", "Open /events Server-Sent Events streams",
+              function=lambda: open_event_streams)
+
+# Shared on-disk index of MUSIC_DIR, refreshed incrementally instead of os.walk per call
+library_index = None
+
+# Spotify track ID -> file, so owned tracks are never handed to spotdl again
+track_cache = None
+
+# Grows with idle CPU and shrinks on rate limiting, shared by every job
+spotdl_concurrency = AdaptiveConcurrency(SPOTDL_MAX_PROCESSES)
+
+# Warm spotdl processes, created by create_app(); commands fall back to the CLI when none can start
+spotdl_workers = None
+
+def spotdl_popen(command):
+    """Start a spotdl command line on a warm worker, or as a new process with SPOTDL_ENGINE=cli"""
+    if SPOTDL_ENGINE == "workers":
+        return spotdl_workers.popen(command)
+    return popen_cli(command)
+
+# Backoff for failed spotdl batches; the token bucket spaces out retries from every job
+spotdl_retry = RetryPolicy(
+    TokenBucket(SPOTDL_RETRY_RATE, SPOTDL_RETRY_BURST),
+    max_attempts=SPOTDL_RETRY_ATTEMPTS,
+    base_delay=SPOTDL_RETRY_DELAY,
+    rate_limit_delay=SPOTDL_RATE_LIMIT_DELAY)
+
+# Tells each job which files it wrote, even when several jobs run at once
+file_watcher = None
+
+# Followed playlists, submitted as one batch whenever their syncs come due
+sync_schedule = None
+
+# Pooled client shared by every Navidrome call
+navidrome = SubsonicClient(
+    NAVIDROME_URL, NAVIDROME_USER, NAVIDROME_PASSWORD,
+    on_request=lambda endpoint, seconds, outcome: navidrome_request_seconds.observe(
+        seconds, endpoint=endpoint, outcome=outcome))
+
+# Local copy of the Navidrome song list, built on first lookup
+navidrome_catalog = NavidromeCatalog(navidrome)
+
+# Sends only the differences when a playlist already exists
+playlist_sync = PlaylistSync(navidrome)
+
+# One Navidrome scan at a time, shared by every job that needs one
+scan_coordinator = ScanCoordinator(navidrome, on_complete=navidrome_catalog.mark_stale)
 
 def search_song_in_navidrome(artist, title, retry_count=0):
-    """Search for a song by navigating Artist → Album → Song structure"""
+    """Look up a song ID in the cached Navidrome catalog"""
     try:
-        import time
-        import xml.etree.ElementTree as ET
-
-        print(f"[SEARCH] Looking for: artist='{artist}' title='{title}' (attempt {retry_count + 1})", flush=True)
-
-        # Strategy: Navigate directly through Artist → Album → Song without search
-        print(f"[SEARCH] Strategy: Direct navigation Artist → Album → Song", flush=True)
-
-        # Step 1: Get music folders first
-        print(f"[SEARCH] Step 1: Getting music folders...", flush=True)
-        params_folders = {
-            'u': NAVIDROME_USER,
-            'p': NAVIDROME_PASSWORD,
-            'c': 'spotdl',
-            'v': '1.16.1'
-        }
-        response = requests.get(f"{NAVIDROME_URL}/rest/getMusicFolders.view", params=params_folders, timeout=10)
-        print(f"[SEARCH]   Raw response: {response.text[:500]}", flush=True)
-        root_folders = ET.fromstring(response.text)
-        music_folders = root_folders.findall('.//musicFolder')
-        print(f"[SEARCH]   Found {len(music_folders)} music folders", flush=True)
-        for folder in music_folders:
-            print(f"[SEARCH]   - Folder: {folder.get('name', 'unknown')} ID: {folder.get('id', 'unknown')}", flush=True)
-
-        if not music_folders:
-            print(f"[SEARCH] ✗ No music folders found, cannot proceed", flush=True)
-            return None
+        log.debug("[SEARCH] Looking for: artist=%r title=%r (attempt %d)", artist, title, retry_count + 1)
 
-        # Use first music folder
-        folder_id = music_folders[0].get('id')
-        print(f"[SEARCH]   Using folder ID: {folder_id}", flush=True)
-
-        # Step 2: Get all artists from the music folder
-        print(f"[SEARCH] Step 2: Getting artists from folder...", flush=True)
-        params_root = {
-            'u': NAVIDROME_USER,
-            'p': NAVIDROME_PASSWORD,
-            'c': 'spotdl',
-            'v': '1.16.1',
-            'id': folder_id
-        }
-        response = requests.get(f"{NAVIDROME_URL}/rest/getMusicDirectory.view", params=params_root, timeout=10)
-        root = ET.fromstring(response.text)
-        artists_dirs = root.findall('.//child[@isDir="true"]')
-        print(f"[SEARCH]   Found {len(artists_dirs)} artists", flush=True)
-
-        # Step 3: Find matching artist
-        print(f"[SEARCH] Step 3: Finding artist '{artist}'...", flush=True)
-        for artist_dir in artists_dirs:
-            artist_name = artist_dir.get('title', '')
-            artist_id = artist_dir.get('id', '')
-            artist_lower = artist.lower().strip()
-            artist_name_lower = artist_name.lower()
-
-            # Exact or partial match
-            if artist_lower == artist_name_lower or artist_lower in artist_name_lower or artist_name_lower in artist_lower:
-                print(f"[SEARCH]   ✓ Found artist: '{artist_name}' (ID: {artist_id})", flush=True)
-
-                # Step 4: Get all albums for this artist
-                print(f"[SEARCH] Step 4: Getting albums for {artist_name}...", flush=True)
-                params_artist = {
-                    'u': NAVIDROME_USER,
-                    'p': NAVIDROME_PASSWORD,
-                    'c': 'spotdl',
-                    'v': '1.16.1',
-                    'id': artist_id
-                }
-                resp_artist = requests.get(f"{NAVIDROME_URL}/rest/getMusicDirectory.view", params=params_artist, timeout=10)
-                root_artist = ET.fromstring(resp_artist.text)
-                albums = root_artist.findall('.//child[@isDir="true"]')
-                print(f"[SEARCH]   Found {len(albums)} albums", flush=True)
-
-                # Step 5: For each album, get songs and look for match
-                print(f"[SEARCH] Step 5: Searching for song '{title}' in albums...", flush=True)
-                for album in albums:
-                    album_name = album.get('title', '')
-                    album_id = album.get('id', '')
-
-                    # Get songs from this album
-                    params_album = {
-                        'u': NAVIDROME_USER,
-                        'p': NAVIDROME_PASSWORD,
-                        'c': 'spotdl',
-                        'v': '1.16.1',
-                        'id': album_id
-                    }
-                    resp_album = requests.get(f"{NAVIDROME_URL}/rest/getMusicDirectory.view", params=params_album, timeout=10)
-                    root_album = ET.fromstring(resp_album.text)
-                    songs = root_album.findall('.//child[@isDir="false"]')
-
-                    # Look for matching song
-                    for song in songs:
-                        song_title = song.get('title', '').lower()
-                        song_name = song.get('name', '').lower()
-                        search_title = title.lower().strip()
-
-                        # Try title match first, then name (filename)
-                        if search_title == song_title or search_title in song_title or song_title in search_title:
-                            song_id = song.get('id')
-                            print(f"[SEARCH] ✓✓✓ FOUND! Artist: {artist_name}, Album: {album_name}, Song: {song_title}, ID: {song_id}", flush=True)
-                            return song_id
-                        elif search_title == song_name or search_title in song_name or song_name in search_title:
-                            song_id = song.get('id')
-                            print(f"[SEARCH] ✓✓✓ FOUND (by filename)! Artist: {artist_name}, Album: {album_name}, Name: {song_name}, ID: {song_id}", flush=True)
-                            return song_id
-
-        print(f"[SEARCH] Song not found in library navigation", flush=True)
-
-        # Retry with wait
-        if retry_count < 2:
-            print(f"[SEARCH] Retrying in 15 seconds... (attempt {retry_count + 1}/3)", flush=True)
-            time.sleep(15)
+        song_id = navidrome_catalog.lookup(artist, title)
+        if song_id:
+            log.debug("[SEARCH] ✓ Found: %s - %s, ID: %s", artist, title, song_id)
+            return song_id
+
+        log.debug("[SEARCH] Song not found in catalog (%d songs)", len(navidrome_catalog))
+
+        # A scan in flight may be about to index it: wait for that scan, not a fixed delay
+        if retry_count == 0 and scan_coordinator.is_scanning():
+            log.info("[SEARCH] Waiting for the running scan before retrying...")
+            scan_coordinator.wait_current()
             return search_song_in_navidrome(artist, title, retry_count + 1)
-        else:
-            print(f"[SEARCH] ✗ NOT FOUND after {retry_count + 1} attempts", flush=True)
 
+        log.debug("[SEARCH] ✗ Not found after %d attempts: %s - %s", retry_count + 1, artist, title)
         return None
     except Exception as e:
-        print(f"[SEARCH ERROR] Exception: {e}", flush=True)
-        import traceback
-        print(f"[SEARCH ERROR] Traceback: {traceback.format_exc()}", flush=True)
+        log.exception(f"[SEARCH ERROR] Exception: {e}")
         return None
 
-def find_all_available_audio_files():
-    """Find all audio files currently available in the music directory"""
-    all_files = []
-    audio_extensions = ('.mp3', '.m4a', '.flac', '.wav', '.ogg')
-
+def resolve_songs_in_navidrome(song_info_list):
+    """Resolve a whole list of (artist, title) tuples to Navidrome song IDs in one pass"""
     try:
-        for root, dirs, files in os.walk(MUSIC_DIR):
-            for file in files:
-                if file.lower().endswith(audio_extensions):
-                    all_files.append(file)
-
-        print(f"[M3U] Scanned directory, found {len(all_files)} total audio files", flush=True)
-        return all_files
+        song_ids = navidrome_catalog.resolve_many(song_info_list)
+        found = sum(1 for song_id in song_ids if song_id)
+        log.info(f"[SEARCH] Resolved {found}/{len(song_info_list)} songs from catalog")
+        return song_ids
     except Exception as e:
-        print(f"[M3U ERROR] Error scanning directory: {e}", flush=True)
-        return []
-
-def create_playlist_in_navidrome(playlist_name, downloaded_files, spotdl_output=None):
-    """Create M3U playlist file and let Navidrome import it automatically"""
+        log.error(f"[SEARCH ERROR] Catalog lookup failed: {e}")
+        return [None] * len(song_info_list)
+
+def sync_playlist_in_navidrome(playlist_name, playlist_files, append=False):
+    """Create or update the playlist through the Subsonic API with the Navidrome IDs of its files.
+
+    Songs are resolved by the "Artist - Title" of each entry in one catalog
+    pass; ones Navidrome doesn't know are left out.
+    """
+    songs = []
+    for entry in map(as_entry, playlist_files):
+        artist, _, title = entry.title.partition(' - ')
+        songs.append((artist, title) if title else ('', artist))
+
+    song_ids = [song_id for song_id in resolve_songs_in_navidrome(songs) if song_id]
+    if len(song_ids) < len(songs):
+        log.info(f"[PLAYLIST SYNC] {len(songs) - len(song_ids)} songs not found in Navidrome")
+    if not song_ids:
+        return False, f"None of the {len(songs)} songs of '{playlist_name}' found in Navidrome"
+
+    result = playlist_sync.sync(playlist_name, song_ids, append=append)
+    if result['created']:
+        return True, f"Playlist '{playlist_name}' created - {len(song_ids)} songs"
+    if not result['added'] and not result['removed']:
+        return True, f"Playlist '{playlist_name}' already up to date"
+    return True, f"Playlist '{playlist_name}' updated (+{result['added']} -{result['removed']})"
+
+def playlist_entries(playlist_files):
+    """PlaylistEntry for each item; bare paths get their duration and "Artist - Title" from the tag cache"""
+    paths = [item for item in playlist_files if not isinstance(item, PlaylistEntry)]
+    known = {}
+    if paths:
+        try:
+            library_index.refresh()
+            library_index.refresh_tags(tags.read_many)
+            known = library_index.tags_of(paths)
+        except Exception as e:
+            log.warning(f"[M3U] Could not read tags, writing entries without durations: {e}")
+    entries = []
+    for item in playlist_files:
+        entry = as_entry(item)
+        if entry.path in known:
+            artist, title, album, isrc, duration = known[entry.path]
+            entry = PlaylistEntry(entry.path, duration,
+                                  f"{artist} - {title}" if artist and title else entry.title)
+        entries.append(entry)
+    return entries
+
+def create_playlist_in_navidrome(playlist_name, playlist_files, append=False):
+    """Write the playlist as an M3U file in MUSIC_DIR and let Navidrome import it.
+
+    playlist_files are paths relative to MUSIC_DIR or PlaylistEntry tuples; paths
+    get the duration and title of their tags. With append=True, files already in
+    the playlist are kept and only new ones are added. Navidrome only rescans
+    when the file actually changed.
+    """
     try:
-        import os
-
-        print(f"[M3U] Creating M3U playlist: {playlist_name}", flush=True)
-        print(f"[M3U] Newly downloaded files: {len(downloaded_files)} files", flush=True)
-
-        # Use only the files that were downloaded in this session
-        # If downloaded_files is empty, fall back to all available files
-        if downloaded_files and len(downloaded_files) > 0:
-            files_to_include = downloaded_files
-            print(f"[M3U] Using {len(files_to_include)} newly downloaded files for playlist", flush=True)
-        else:
-            # Fallback: if no files detected as downloaded, use all available
-            # This handles cases where file timestamps don't match expectations
-            all_available_files = find_all_available_audio_files()
-            files_to_include = all_available_files
-            print(f"[M3U] No recently downloaded files detected, using all {len(files_to_include)} available files", flush=True)
+        log.info(f"[M3U] Creating M3U playlist: {playlist_name} ({len(playlist_files)} files)")
 
-        print(f"[M3U] Total files to include in playlist: {len(files_to_include)}", flush=True)
+        if not playlist_files:
+            log.info(f"[M3U] No files for playlist '{playlist_name}', not writing it")
+            return False, f"No files found for playlist '{playlist_name}'"
 
-        # Create M3U content with file paths
-        m3u_lines = ['#EXTM3U']
-
-        for filename in files_to_include:
-            # Add the filename as a relative path in the M3U
-            m3u_lines.append(filename)
-
-        m3u_content = '\n'.join(m3u_lines)
-        print(f"[M3U] M3U playlist will contain {len(files_to_include)} songs", flush=True)
-
-        # Define M3U file path and filename
-        m3u_filename = f"{playlist_name}.m3u"
+        m3u_filename = f"{playlist_filename(playlist_name)}.m3u"
         m3u_path = os.path.join(MUSIC_DIR, m3u_filename)
 
-        # Write M3U file to music directory
-        print(f"[M3U] Writing M3U file to: {m3u_path}", flush=True)
-        with open(m3u_path, 'w', encoding='utf-8') as f:
-            f.write(m3u_content)
+        log.info(f"[M3U] Writing M3U file to: {m3u_path}")
+        changed, count = write_m3u(m3u_path, playlist_name, playlist_entries(playlist_files), append=append)
 
-        print(f"[M3U] ✓ M3U file created successfully with {len(files_to_include)} songs", flush=True)
+        if not changed:
+            log.info(f"[M3U] ✓ Playlist '{playlist_name}' unchanged ({count} songs), no scan needed")
+            return True, f"Playlist '{playlist_name}' already up to date (M3U file: {m3u_filename}) - {count} songs"
+
+        log.info(f"[M3U] ✓ M3U file written with {count} songs")
 
         # Trigger Navidrome scan to import the M3U (runs in background)
-        print(f"[M3U] Triggering Navidrome scan to import M3U...", flush=True)
+        log.info("[M3U] Triggering Navidrome scan to import M3U...")
         start_navidrome_scan()
 
-        print(f"[M3U] ✓✓✓ SUCCESS! Playlist '{playlist_name}' will be created from M3U", flush=True)
-        return True, f"Playlist '{playlist_name}' created (M3U file: {m3u_filename}) - {len(files_to_include)} songs"
+        log.info(f"[M3U] ✓✓✓ SUCCESS! Playlist '{playlist_name}' will be created from M3U")
+        return True, f"Playlist '{playlist_name}' created (M3U file: {m3u_filename}) - {count} songs"
 
     except PermissionError as e:
-        print(f"[M3U ERROR] Permission Denied: {str(e)}", flush=True)
-        print(f"[M3U ERROR] Check MUSIC_DIR permissions: {MUSIC_DIR}", flush=True)
-        import os
+        log.exception(f"[M3U ERROR] Permission Denied: {str(e)}")
+        log.error(f"[M3U ERROR] Check MUSIC_DIR permissions: {MUSIC_DIR}")
         try:
             stat = os.stat(MUSIC_DIR)
-            print(f"[M3U ERROR] Directory mode: {oct(stat.st_mode)}, UID: {stat.st_uid}, GID: {stat.st_gid}", flush=True)
+            log.error(f"[M3U ERROR] Directory mode: {oct(stat.st_mode)}, UID: {stat.st_uid}, GID: {stat.st_gid}")
         except:
             pass
-        import traceback
-        print(f"[M3U ERROR] Traceback: {traceback.format_exc()}", flush=True)
         return False, f"Permission denied writing to {MUSIC_DIR}: {str(e)}"
     except Exception as e:
-        print(f"[M3U ERROR] Exception: {str(e)}", flush=True)
-        import traceback
-        print(f"[M3U ERROR] Traceback: {traceback.format_exc()}", flush=True)
+        log.exception(f"[M3U ERROR] Exception: {str(e)}")
         return False, f"Error creating M3U playlist: {str(e)}"
 
 def extract_playlist_info(output_lines):
     """Extract playlist name and song information from spotdl output"""
-    playlist_name = None
-    song_info_list = []  # List of (artist, title) tuples
-
+    progress = SpotdlProgress()
     for line in output_lines:
-        # Try to detect playlist name - look for patterns like "Found X songs in PlaylistName (Playlist)"
-        match = re.search(r'Found\s+\d+\s+songs?\s+in\s+(.+?)\s+\((Playlist|Album)\)', line)
-        if match:
-            playlist_name = match.group(1).strip()
-            print(f"[EXTRACT] Found playlist name: {playlist_name}", flush=True)
-
-        # SpotDL output format: "artist - title" or "Downloading: artist - title"
-        # Also handles: "✓ artist - title" (already exists)
-        # Also handles: "Downloaded: artist - title"
-
-        # Pattern 1: "Downloading: artist - title" or similar action lines
-        match = re.search(r'(?:Downloading|Processing|Downloaded|Saved)[:\s]+(.+?)\s+-\s+(.+?)(?:\s+\(|$)', line, re.IGNORECASE)
-        if match:
-            artist = match.group(1).strip()
-            title = match.group(2).strip()
-            song_info = (artist, title)
-            if song_info not in song_info_list:
-                song_info_list.append(song_info)
-                print(f"[EXTRACT] Found song: {artist} - {title}", flush=True)
-            continue
-
-        # Pattern 2: Lines with checkmark "✓ artist - title" (file already exists)
-        match = re.search(r'✓\s+(.+?)\s+-\s+(.+?)(?:\s+\(|$)', line)
-        if match:
-            artist = match.group(1).strip()
-            title = match.group(2).strip()
-            song_info = (artist, title)
-            if song_info not in song_info_list:
-                song_info_list.append(song_info)
-                print(f"[EXTRACT] Found existing song: {artist} - {title}", flush=True)
-            continue
-
-        # Pattern 3: "Skipping artist - title" lines (when file already exists)
-        if 'Skipping' in line and ' - ' in line:
-            match = re.search(r'Skipping\s+(.+?)\s+-\s+(.+?)(?:\s+\(|$)', line)
-            if match:
-                artist = match.group(1).strip()
-                title = match.group(2).strip()
-                song_info = (artist, title)
-                if song_info not in song_info_list:
-                    song_info_list.append(song_info)
-                    print(f"[EXTRACT] Found skipped song: {artist} - {title}", flush=True)
-            continue
-
-    return playlist_name, song_info_list
+        progress.feed(line)
+    song_info_list = progress.song_info_list()  # List of (artist, title) tuples
+
+    log.info(f"[EXTRACT] Playlist name: {progress.playlist_name}, songs: {len(song_info_list)}")
+    return progress.playlist_name, song_info_list
+
+_library_matcher = (None, None)
+MATCH_KINDS = {ISRC_SCORE: "isrc", TAG_SCORE: "tags", EXACT_SCORE: "exact"}
+
+def get_library_matcher():
+    """Matcher over the current library and its tags, rebuilt only when the index changed"""
+    global _library_matcher
+    library_index.refresh()
+    # Only files that are new or rewritten since the last call are parsed
+    library_index.refresh_tags(tags.read_many)
+    version, matcher = _library_matcher
+    if matcher is None or version != library_index.version:
+        matcher = LibraryMatcher(library_index.tagged_files())
+        _library_matcher = (library_index.version, matcher)
+        log.info(f"[SEARCH] Built matcher index over {len(matcher)} files")
+    return matcher
 
 def find_songs_by_info(song_info_list):
-    """Find actual music files based on artist/title information"""
-    found_files = []
-    audio_extensions = ('.mp3', '.m4a', '.flac', '.wav', '.ogg')
-
-    print(f"[SEARCH] Looking for {len(song_info_list)} songs in library...", flush=True)
+    """Find the library files for (artist, title) pairs, returns paths relative to MUSIC_DIR"""
+    log.info(f"[SEARCH] Looking for {len(song_info_list)} songs in library...")
 
-    # Build a map of all audio files in the library
-    all_files = {}
     try:
-        for root, dirs, files in os.walk(MUSIC_DIR):
-            for file in files:
-                if file.lower().endswith(audio_extensions):
-                    # Normalize filename for matching
-                    file_lower = file.lower()
-                    all_files[file_lower] = file
+        matcher = get_library_matcher()
     except Exception as e:
-        print(f"[SEARCH ERROR] Error scanning directory: {e}", flush=True)
+        log.error(f"[SEARCH ERROR] Error scanning directory: {e}")
         return []
 
-    # For each song from SpotDL output, try to find matching file
-    for artist, title in song_info_list:
-        # SpotDL typically saves files as "Artist - Title.mp3"
-        # Try different combinations to find the file
-
-        found_match = False
-
-        # Pattern 1: Exact match "Artist - Title.ext"
-        for ext in audio_extensions:
-            filename = f"{artist} - {title}{ext}"
-            filename_lower = filename.lower()
-            if filename_lower in all_files:
-                found_files.append(all_files[filename_lower])
-                print(f"[SEARCH] ✓ Found (exact): {all_files[filename_lower]}", flush=True)
-                found_match = True
-                break
-
-        if found_match:
+    # Whole list in one call, each file used at most once
+    found_files = []
+    for doc, score in matcher.match_many(song_info_list):
+        if doc is None:
             continue
+        found_files.append(matcher.paths[doc])
+        kind = MATCH_KINDS.get(score, f"fuzzy {score:.2f}")
+        log.debug("[SEARCH] ✓ Found (%s): %s", kind, matcher.names[doc])
 
-        # Pattern 2: Fuzzy match - find files containing both artist and title
-        # This handles cases where SpotDL output has shortened titles
-        artist_lower = artist.lower()
-        title_lower = title.lower()
-
-        # Split title into words for better matching
-        title_words = [w for w in title_lower.split() if len(w) > 2]  # Skip short words like "a", "the"
-
-        best_match = None
-        best_score = 0
-
-        for file_lower, original_file in all_files.items():
-            if original_file in found_files:
-                continue
-
-            # Check if artist is in filename
-            if artist_lower not in file_lower:
-                continue
-
-            # Count how many title words are in the filename
-            score = sum(1 for word in title_words if word in file_lower)
-
-            # If we find a file with artist and most title words, it's probably the right one
-            if score > best_score and score >= len(title_words) * 0.5:  # At least 50% of words
-                best_score = score
-                best_match = original_file
+    log.info(f"[SEARCH] Total found: {len(found_files)}/{len(song_info_list)} songs")
+    return found_files
 
-        if best_match:
-            found_files.append(best_match)
-            print(f"[SEARCH] ✓ Found (fuzzy {best_score}/{len(title_words)}): {best_match}", flush=True)
+def fetch_spotify_tracks(url, download_id):
+    """Track list of a Spotify URL from `spotdl save`, which only queries Spotify, not YouTube"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        save_file = os.path.join(tmp_dir, "tracks.spotdl")
+        process = spotdl_popen(["spotdl", "save", url, "--save-file", save_file])
+        download_scheduler.add_cancel_callback(download_id, process.terminate)
+        # Only the end of the output is worth keeping, for the error message
+        tail = collections.deque(read_lines(process), maxlen=5)
+        process.wait()
+        if process.returncode != 0 or not os.path.exists(save_file):
+            log.warning(f"[CACHE] spotdl save failed with code {process.returncode}: {' | '.join(tail)[-300:]}")
+            return None
+        with open(save_file) as f:
+            songs = json.load(f)
+
+    tracks = [{
+        'id': song['song_id'],
+        'artist': ', '.join(song.get('artists') or [song.get('artist', '')]),
+        'title': song['name'],
+        'album': song.get('album_name'),
+        'duration': song.get('duration'),
+        'isrc': song.get('isrc'),
+    } for song in songs if song.get('song_id')]
+    if not tracks:
+        return None
+    name = next((song['list_name'] for song in songs if song.get('list_name')), None)
+    if name is None and spotify_ref(url)[0] == 'album':
+        name = tracks[0]['album']
+    return name, tracks
+
+def find_tracks_in_library(tracks):
+    """{track_id: relative path} for tracks already in the library by ISRC, tags or "Artist - Title" filename"""
+    matcher = get_library_matcher()
+    found, used = {}, set()
+    for track in tracks:
+        doc, score = matcher.match(track['artist'], track['title'], used, track.get('isrc'))
+        if doc is not None and score >= EXACT_SCORE:
+            found[track['id']] = matcher.paths[doc]
+            used.add(doc)
+    return found
+
+def plan_download(url, download_id, refresh=False):
+    """Split the tracks of a Spotify URL into owned ones and ones to download.
+
+    Returns (name, tracks, {track_id: relative path} of the owned ones), or None
+    when the track list can't be resolved and spotdl has to get the whole URL.
+    refresh=True always asks Spotify and records what changed since the last
+    known track list as the job's "changes".
+    """
+    if spotify_ref(url) is None:
+        return None
+    listing = None if refresh else track_cache.listing(url)
+    if listing is None:
+        previous = track_cache.listing(url, expired=True) if refresh else None
+        listing = fetch_spotify_tracks(url, download_id)
+        if listing is None:
+            return None
+        track_cache.save_listing(url, *listing)
+        if previous is not None:
+            known = {track['id'] for track in previous[1]}
+            current = {track['id'] for track in listing[1]}
+            changes = {"added": len(current - known), "removed": len(known - current)}
+            update_download(download_id, changes=changes)
+            log.info(f"[SYNC] {url}: +{changes['added']} -{changes['removed']} tracks since the last sync")
+    else:
+        log.info(f"[CACHE] Track list of {url} served from cache")
+    name, tracks = listing
 
-    print(f"[SEARCH] Total found: {len(found_files)}/{len(song_info_list)} songs", flush=True)
-    return found_files
+    owned = track_cache.owned(track['id'] for track in tracks)
+    unknown = [track for track in tracks if track['id'] not in owned]
+    if unknown:
+        # Files that were already in the library before the cache knew about them
+        try:
+            in_library = find_tracks_in_library(unknown)
+        except Exception as e:
+            log.warning(f"[CACHE] Library lookup failed: {e}")
+            in_library = {}
+        remember_tracks(unknown, in_library)
+        owned.update(in_library)
+    log.info(f"[CACHE] {url}: {len(owned)}/{len(tracks)} tracks already owned")
+    return name, tracks, owned
+
+def locate_downloaded_tracks(tracks, job_files):
+    """{track_id: relative path} for downloaded tracks, from the files this job wrote or the library"""
+    by_stem = {normalize(os.path.splitext(os.path.basename(path))[0]): path for path in job_files}
+    found = {}
+    for track in tracks:
+        path = by_stem.get(normalize(f"{track['artist']} - {track['title']}"))
+        if path is not None:
+            found[track['id']] = path
+    # spotdl skipped these, so they were already on disk under a name the cache didn't know
+    rest = [track for track in tracks if track['id'] not in found]
+    if rest:
+        found.update(find_tracks_in_library(rest))
+    remember_tracks(tracks, found)
+    return found
+
+def remember_tracks(tracks, paths):
+    track_cache.remember(
+        (track['id'], paths[track['id']], track['artist'], track['title'], track.get('album'))
+        for track in tracks if track['id'] in paths)
 
 def find_recently_modified_files(since_time, limit_count=None):
     """Find music files modified after the given time"""
-    from pathlib import Path
-    import time
-
-    recently_modified = []
-    audio_extensions = ('.mp3', '.m4a', '.flac', '.wav', '.ogg')
-
     try:
-        print(f"[FILES] Looking for files modified after {since_time}", flush=True)
-        for root, dirs, files in os.walk(MUSIC_DIR):
-            for file in files:
-                if file.lower().endswith(audio_extensions):
-                    filepath = os.path.join(root, file)
-                    try:
-                        mtime = os.path.getmtime(filepath)
-                        if mtime > since_time:
-                            recently_modified.append({
-                                'path': filepath,
-                                'mtime': mtime,
-                                'filename': file
-                            })
-                            print(f"[FILES]   Found: {file}", flush=True)
-                    except:
-                        pass
-
-        # Sort by modification time, most recent first
-        recently_modified.sort(key=lambda x: x['mtime'], reverse=True)
-        print(f"[FILES] Total files found: {len(recently_modified)}", flush=True)
+        log.info(f"[FILES] Looking for files modified after {since_time}")
+        # Files overwritten in place leave their directory's mtime alone, so stat them all
+        library_index.refresh(recheck_all=True)
+        # Already sorted by modification time, most recent first
+        recently_modified = library_index.modified_since(since_time)
+        for item in recently_modified:
+            log.debug("[FILES]   Found: %s", item['filename'])
+
+        log.info(f"[FILES] Total files found: {len(recently_modified)}")
         if limit_count is None:
             return recently_modified
         return recently_modified[:limit_count]
     except Exception as e:
-        print(f"[FILES ERROR] {e}", flush=True)
+        log.error(f"[FILES ERROR] {e}")
         return []
 
 def match_songs_in_navidrome(filenames):
@@ -417,171 +492,442 @@ def match_songs_in_navidrome(filenames):
     return filenames
 
 def wait_for_navidrome_scan():
-    """Wait for Navidrome to finish scanning and indexing the library"""
-    import time
-    max_wait = 120  # Max 120 seconds (increased from 60)
-    start = time.time()
-
-    # First, wait for scanning to complete
-    while time.time() - start < max_wait:
-        try:
-            params = {
-                'u': NAVIDROME_USER,
-                'p': NAVIDROME_PASSWORD,
-                'c': 'spotdl',
-                'v': '1.16.1'
-            }
-            response = requests.get(f"{NAVIDROME_URL}/rest/getScanStatus.view", params=params, timeout=5)
-            import xml.etree.ElementTree as ET
-            root = ET.fromstring(response.text)
-
-            # Check if scanning
-            scan_status = root.find('.//scanStatus')
-            if scan_status is not None:
-                scanning = scan_status.get('scanning') == 'true'
-                if not scanning:
-                    print(f"[SCAN] Scanning completed, waiting for full indexing...", flush=True)
-                    # Wait additional time for indexing to complete (increased from 5 to 15 seconds)
-                    time.sleep(15)
-                    print(f"[SCAN] Indexing complete, proceeding with search", flush=True)
-                    return True
-
-            time.sleep(2)
-        except Exception as e:
-            logging.warning(f"SCAN: Exception while waiting: {e}")
-            time.sleep(2)
-
-    logging.warning("SCAN: Max wait time exceeded")
-    return False
+    """Request a Navidrome scan (shared with other jobs) and wait until it has finished"""
+    log.info("[SCAN] Waiting for Navidrome scan...")
+    completed = scan_coordinator.scan_and_wait()
+    if not completed:
+        log.warning("[SCAN] Scan did not complete")
+    return completed
 
 def start_navidrome_scan():
-    """Tell Navidrome to scan the music library"""
-    try:
-        params = {
-            'u': NAVIDROME_USER,
-            'p': NAVIDROME_PASSWORD,
-            'c': 'spotdl',
-            'v': '1.16.1'
-        }
-        requests.get(f"{NAVIDROME_URL}/rest/startScan.view", params=params, timeout=10)
-    except:
-        pass
-
-def run_spotdl(url, download_id):
-    try:
-        downloads[download_id]["status"] = "downloading"
-        downloads[download_id]["started"] = datetime.now().isoformat()
+    """Tell Navidrome to scan the music library without waiting for it"""
+    scan_coordinator.request_scan()
+
+def update_download(download_id, **fields):
+    """Update a job record, persist it and push the changed fields to event stream clients.
+
+    Status changes are written at once, together with anything still unsaved;
+    other updates wait for the next write, at most PERSIST_INTERVAL seconds.
+    """
+    now = time.monotonic()
+    with records_lock:
+        downloads[download_id] = {**downloads[download_id], **fields}
+        pending, saved_at = unsaved_fields.get(download_id, ({}, 0))
+        pending = {**pending, **fields}
+        if "status" in fields or now - saved_at >= PERSIST_INTERVAL:
+            unsaved_fields[download_id] = ({}, now)
+            # Under the lock, so writes for one job can't land out of order
+            job_store.update(download_id, pending)
+        else:
+            unsaved_fields[download_id] = (pending, saved_at)
+    download_events.publish('update', download_id, fields)
+
+def append_download_log(download_id, line):
+    """Append a line to a job's log tail and push it to event stream clients"""
+    with records_lock:
+        download_logs[download_id] = download_logs[download_id][1 - LOG_LINES:] + (line,)
+    download_events.publish('log', download_id, {"line": line})
+
+def download_record(download_id):
+    """Copy of a job record with its log joined for JSON responses, or None if unknown"""
+    record = downloads.get(download_id)
+    if record is None:
+        return job_store.get(download_id)
+    record = dict(record)
+    record["log"] = "\n".join(download_logs.get(download_id, ()))
+    return record
+
+def finish_download(download_id, progress=None):
+    """Persist the log and track results of a finished job and drop it from memory"""
+    if progress is not None:
+        job_store.save_tracks(download_id, [
+            (artist, title, STATE_NAMES[state]) for (artist, title), state in progress.tracks.items()
+        ])
+    with records_lock:
+        pending, _ = unsaved_fields.pop(download_id, ({}, 0))
+        job_store.update(download_id, {**pending, "log": "\n".join(download_logs.get(download_id, ()))})
+    downloads.pop(download_id, None)
+    download_logs.pop(download_id, None)
+    job_store.purge()
+
+def run_spotdl(url, download_id, cancel_event=None, scan_group=None, refresh=False):
+    if cancel_event is None:
+        cancel_event = threading.Event()
+    progress = SpotdlProgress()
+    watch = None
+    # Seconds per stage, kept in the job record as "timings"
+    stages = StageTimer(job_stage_seconds, on_stage=lambda timings: update_download(download_id, timings=timings))
+    # Set when the playlist step waits for the scan of the job's batch and finishes on another thread
+    deferred = False
+
+    def finalize():
+        stages.stop()
+        if watch is not None and not watch.closed:
+            watch.close()
+        if scan_group is not None:
+            scan_group.leave(download_id)
+        jobs_finished.inc(status=downloads[download_id].get("status"))
+        finish_download(download_id, progress)
+
+    def after_batch_scan(completed):
+        with job_context(download_id):
+            try:
+                if not completed:
+                    log.warning("[SCAN] Scan did not complete")
+                update_download(download_id, status="creating_playlist")
+                append_download_log(download_id, "Escaneo completado. Creando playlist...")
+                write_playlist()
+                update_download(download_id, finished=datetime.now().isoformat())
+            except Exception as e:
+                update_download(download_id, status="error", error=str(e))
+            finally:
+                finalize()
 
-        # Record the files BEFORE downloading
-        import time
+    try:
+        update_download(download_id, status="downloading", started=datetime.now().isoformat())
+
+        # Tracks already in the library are not handed to spotdl at all
+        targets = [url]
+        stages.start("plan")
+        plan = plan_download(url, download_id, refresh)
+        if plan is not None:
+            plan_name, plan_tracks, track_paths = plan
+            progress.playlist_name = plan_name
+            progress.total = len(plan_tracks)
+            for track in plan_tracks:
+                if track['id'] in track_paths:
+                    progress.mark(track['artist'], track['title'], SKIPPED)
+            missing_tracks = [track for track in plan_tracks if track['id'] not in track_paths]
+            targets = [track_url(track['id']) for track in missing_tracks]
+            update_download(download_id, progress=progress.summary())
+            append_download_log(download_id, f"{len(track_paths)} de {len(plan_tracks)} canciones ya están en la biblioteca")
+        if cancel_event.is_set():
+            targets = []
+
+        # Files spotdl finishes from now on are reported to this job
         start_time = time.time()
-
-        # Get a snapshot of current files before download
-        existing_files_before = set()
-        try:
-            audio_extensions = ('.mp3', '.m4a', '.flac', '.wav', '.ogg')
-            for root, dirs, files in os.walk(MUSIC_DIR):
-                for file in files:
-                    if file.lower().endswith(audio_extensions):
-                        existing_files_before.add(file)
-            print(f"[SNAPSHOT] Found {len(existing_files_before)} files BEFORE download", flush=True)
-        except Exception as e:
-            print(f"[SNAPSHOT] Error taking snapshot: {e}", flush=True)
-
-        cmd = ["spotdl", url, "--output", MUSIC_DIR, "--add-unavailable", "--max-retries", "10", "--threads", "2"]
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True
-        )
-
-        output = []
-        for line in process.stdout:
-            line_stripped = line.strip()
-            output.append(line_stripped)
-            downloads[download_id]["log"] = "\n".join(output[-50:])  # Keep last 50 lines
-            # Print SpotDL output to container logs for debugging
-            print(f"[SPOTDL] {line_stripped}", flush=True)
-
-        process.wait()
-
-        if process.returncode == 0:
+        watch = file_watcher.start_session(download_id)
+
+        returncode = 0
+        if targets:
+            stages.start("spotdl")
+            # Track URLs are split over several spotdl processes; a whole URL is a single batch
+            tracks_by_url = {track_url(track['id']): track for track in missing_tracks} if plan is not None else None
+            shard_run = ShardedRun(
+                targets,
+                lambda batch: ["spotdl"] + batch + ["--output", MUSIC_DIR, "--add-unavailable",
+                                                    "--max-retries", str(SPOTDL_MAX_RETRIES),
+                                                    "--threads", str(SPOTDL_THREADS)],
+                spotdl_concurrency,
+                SPOTDL_SHARD_SIZE,
+                on_change=lambda stats: update_download(download_id, shards=stats),
+                retry=spotdl_retry,
+                # Only the tracks a batch didn't finish are run again
+                remaining=(lambda batch: unfinished_targets(batch, tracks_by_url, progress)) if tracks_by_url else None,
+                on_retry=lambda kind, count: spotdl_retries.inc(count, kind=kind),
+                popen=spotdl_popen
+            )
+            # Cancelling the job kills every spotdl process, which ends the loop below
+            download_scheduler.add_cancel_callback(download_id, shard_run.cancel)
+
+            # Parse lines as they arrive instead of keeping the whole output
+            for line in shard_run.lines():
+                line_stripped = line.strip()
+                append_download_log(download_id, line_stripped)
+                if progress.feed(line_stripped):
+                    update_download(download_id, progress=progress.summary())
+                # Sampled, and only on stdout with LOG_LEVEL=DEBUG
+                log.debug("[SPOTDL] %s", line_stripped)
+
+            returncode = shard_run.returncode
+            if shard_run.failed:
+                append_download_log(download_id, f"{len(shard_run.failed)} canciones no se pudieron descargar tras reintentarlo")
+
+        # Files finished while other jobs also ran belong to whichever job downloaded that song
+        stages.start("collect")
+        expected = {normalize(f"{artist} - {title}") for artist, title in progress.song_info_list()}
+        job_files = watch.close(
+            claim=lambda path: normalize(os.path.splitext(os.path.basename(path))[0]) in expected)
+        if plan is not None and missing_tracks and not cancel_event.is_set():
+            track_paths.update(locate_downloaded_tracks(missing_tracks, job_files))
+        job_bytes = sum(_file_size(os.path.join(MUSIC_DIR, path)) for path in job_files)
+        if job_bytes:
+            downloaded_bytes.inc(job_bytes)
+            update_download(download_id, downloaded_bytes=job_bytes)
+        stages.stop()
+
+        # Songs spotdl gave up on make the job "partial", or "failed" if nothing came of it
+        states = progress.tracks.values()
+        incomplete = returncode != 0 or FAILED in states
+        obtained = bool(job_files) or any(state in (DOWNLOADED, SKIPPED) for state in states)
+        done_status = "partial" if incomplete else "completed"
+
+        if cancel_event.is_set():
+            log.info(f"[QUEUE] Job {download_id} cancelled")
+            update_download(download_id, status="cancelled")
+        elif incomplete and not obtained:
+            log.warning(f"[QUEUE] Job {download_id}: no song could be downloaded (exit code {returncode})")
+            update_download(download_id, status="failed")
+        else:
             # Check if it's a playlist or album URL (create playlist for both)
             if "playlist" in url.lower() or "album" in url.lower():
-                downloads[download_id]["status"] = "creating_playlist"
+                update_download(download_id, status="creating_playlist")
 
-                # Extract playlist/album name and song info from SpotDL output
-                playlist_name, song_info_list = extract_playlist_info(output)
+                # Playlist/album name and song info parsed from SpotDL output
+                playlist_name = progress.playlist_name
+                song_info_list = progress.song_info_list()
                 if not playlist_name:
                     playlist_name = "Downloaded Content"
 
-                print(f"[PLAYLIST] Playlist: {playlist_name}, Songs detected: {len(song_info_list)}", flush=True)
+                log.info(f"[PLAYLIST] Playlist: {playlist_name}, Songs detected: {len(song_info_list)}")
 
-                # Compare files AFTER download with files BEFORE download to find new files
-                existing_files_after = set()
-                try:
-                    audio_extensions = ('.mp3', '.m4a', '.flac', '.wav', '.ogg')
-                    for root, dirs, files in os.walk(MUSIC_DIR):
-                        for file in files:
-                            if file.lower().endswith(audio_extensions):
-                                existing_files_after.add(file)
-                    print(f"[SNAPSHOT] Found {len(existing_files_after)} files AFTER download", flush=True)
-                except Exception as e:
-                    print(f"[SNAPSHOT] Error after download: {e}", flush=True)
+                # Files the watcher attributed to this job are the new ones
+                new_files = []
+                if watch.complete:
+                    new_files = job_files
+                else:
+                    log.info("[SNAPSHOT] File watcher missed events, matching by song info instead")
 
-                # New files are the difference
-                new_files_snapshot = existing_files_after - existing_files_before
-                print(f"[SNAPSHOT] Difference (new files): {len(new_files_snapshot)} files", flush=True)
+                log.info(f"[SNAPSHOT] Difference (new files): {len(new_files)} files")
 
                 # Strategy:
-                # 1. If we have new files from snapshot, use those (actually downloaded new)
+                # 0. If the track list came from Spotify, write the whole playlist in its order
+                # 1. If we have new files from snapshot, add those (actually downloaded new)
                 # 2. If we have song info from SpotDL, search for those songs (already existed)
                 # 3. Fallback to recently modified files
-                downloaded_filenames = []
-
-                if new_files_snapshot and len(new_files_snapshot) > 0:
+                # Without the full track list, files are added to the playlist instead of replacing it
+                playlist_files = []
+                stages.start("match")
+
+                if plan is not None:
+                    # Every track of the playlist, in playlist order, whether new or already owned
+                    playlist_files = [
+                        PlaylistEntry(track_paths[track['id']], track.get('duration'),
+                                      f"{track['artist']} - {track['title']}")
+                        for track in plan_tracks if track['id'] in track_paths
+                    ]
+                    log.info(f"[PLAYLIST] Using {len(playlist_files)}/{len(plan_tracks)} files from the track cache")
+                elif new_files:
                     # New files were downloaded
-                    downloaded_filenames = list(new_files_snapshot)
-                    print(f"[PLAYLIST] Using {len(downloaded_filenames)} NEW files from snapshot", flush=True)
+                    playlist_files = new_files
+                    log.info(f"[PLAYLIST] Using {len(playlist_files)} NEW files from snapshot")
                 elif song_info_list and len(song_info_list) > 0:
                     # Songs already existed, search for them by artist/title
-                    downloaded_filenames = find_songs_by_info(song_info_list)
-                    print(f"[PLAYLIST] Using {len(downloaded_filenames)} EXISTING files found by song info", flush=True)
+                    playlist_files = find_songs_by_info(song_info_list)
+                    log.info(f"[PLAYLIST] Using {len(playlist_files)} EXISTING files found by song info")
                 else:
                     # Fallback: Find recently modified files
                     recently_modified = find_recently_modified_files(start_time)
-                    downloaded_filenames = [item['filename'] for item in recently_modified] if recently_modified else []
-                    print(f"[PLAYLIST] Using {len(downloaded_filenames)} recently modified files (fallback)", flush=True)
-
-                print(f"[PLAYLIST] Creating playlist '{playlist_name}' with {len(downloaded_filenames)} files...", flush=True)
+                    playlist_files = [os.path.relpath(item['path'], MUSIC_DIR) for item in recently_modified]
+                    log.info(f"[PLAYLIST] Using {len(playlist_files)} recently modified files (fallback)")
+
+                log.info(f"[PLAYLIST] Creating playlist '{playlist_name}' with {len(playlist_files)} files...")
+
+                def write_playlist():
+                    # Try to create playlist with downloaded files
+                    stages.start("playlist")
+                    success = False
+                    if PLAYLIST_MODE == "api" and playlist_files:
+                        try:
+                            success, message = sync_playlist_in_navidrome(playlist_name, playlist_files, append=plan is None)
+                        except Exception as e:
+                            log.warning(f"[PLAYLIST SYNC ERROR] {e}")
+                        if not success:
+                            log.info("[PLAYLIST] Falling back to an M3U file")
+                    if not success:
+                        success, message = create_playlist_in_navidrome(playlist_name, playlist_files, append=plan is None)
+                    stages.stop()
+
+                    if success:
+                        update_download(download_id, status=done_status, playlist_created=True,
+                                        playlist_name=playlist_name)
+                    else:
+                        update_download(download_id, status="completed_no_playlist", playlist_error=message)
+
+                # Navidrome only needs to index new songs before the playlist refers to them
+                if new_files or not watch.complete:
+                    stages.start("scan")
+                    append_download_log(download_id, "Escaneando biblioteca de Navidrome...")
+                    if scan_group is not None:
+                        # The batch scans once, after its last job gets here; this worker moves on meanwhile
+                        update_download(download_id, status="waiting_scan")
+                        deferred = True
+                        scan_group.defer(download_id, after_batch_scan)
+                        return
+                    wait_for_navidrome_scan()
+                    append_download_log(download_id, "Escaneo completado. Creando playlist...")
+                write_playlist()
+            else:
+                update_download(download_id, status=done_status)
 
-                # Start Navidrome scan and wait for it to complete
-                downloads[download_id]["log"] += "\nEscaneando biblioteca de Navidrome..."
-                start_navidrome_scan()
-                wait_for_navidrome_scan()
-                downloads[download_id]["log"] += "\nEscaneo completado. Creando playlist..."
+        update_download(download_id, finished=datetime.now().isoformat())
 
-                # Try to create playlist with downloaded files
-                success, message = create_playlist_in_navidrome(playlist_name, downloaded_filenames, output)
+    except Exception as e:
+        update_download(download_id, status="error", error=str(e))
+    finally:
+        if not deferred:
+            finalize()
+
+def unfinished_targets(batch, tracks_by_url, progress):
+    """Track URLs of an ended spotdl batch that were neither downloaded nor failed for good"""
+    reported = {}
+    for (artist, title), state in progress.tracks.items():
+        reported.setdefault(normalize(title), []).append(
+            (set(artist_keys(artist)), state, progress.errors.get((artist, title))))
+    left = []
+    for url in batch:
+        track = tracks_by_url.get(url)
+        wanted = set(artist_keys(track['artist'])) if track else set()
+        found = next(((state, error) for keys, state, error in reported.get(normalize(track['title']), ())
+                      if keys & wanted), None) if track else None
+        if found is None:
+            # Never reported: the process stopped before reaching it
+            left.append(url)
+            continue
+        state, error = found
+        if state in (DOWNLOADED, SKIPPED):
+            continue
+        if state == FAILED and error and retry.classify(error) == retry.PERMANENT:
+            continue
+        left.append(url)
+    return left
 
-                if success:
-                    downloads[download_id]["status"] = "completed"
-                    downloads[download_id]["playlist_created"] = True
-                    downloads[download_id]["playlist_name"] = playlist_name
-                else:
-                    downloads[download_id]["status"] = "completed_no_playlist"
-                    downloads[download_id]["playlist_error"] = message
-            else:
-                downloads[download_id]["status"] = "completed"
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def run_download_job(download_id, cancel_event):
+    """Scheduler entry point: run the queued download with the given ID"""
+    record = downloads[download_id]
+    with job_context(download_id):
+        run_spotdl(record["url"], download_id, cancel_event,
+                   scan_group=scan_groups.pop(download_id, None), refresh=record.get("refresh", False))
+
+# Worker threads running the queued jobs, started by create_app()
+download_scheduler = None
+# Makes the duplicate check and job creation in /download atomic
+submit_lock = threading.Lock()
+# Queued jobs of a batch -> the ScanGroup they share, taken when the job starts
+scan_groups = {}
+
+def submit_downloads(urls, priority=0, **fields):
+    """Queue one job per URL; jobs of the same call share a single Navidrome scan.
+
+    Returns one {"url", "download_id", "queue_position"} dict per URL. A URL that
+    is already queued or running (or repeated in urls) gets the existing job,
+    marked "duplicate", and is not queued again. Extra fields are stored in
+    each new job record.
+    """
+    created, results = [], []
+    with submit_lock:
+        active = {canonical_url(record["url"]): existing_id for existing_id, record in list(downloads.items())
+                  if record["status"] in ACTIVE_STATUSES}
+        for url in urls:
+            key = canonical_url(url)
+            if key in active:
+                log.info(f"[QUEUE] {url} is already job {active[key]}, not queued again")
+                results.append({"url": url, "download_id": active[key], "duplicate": True})
+                continue
+            download_id = job_store.create(url, priority)
+            if fields:
+                job_store.update(download_id, fields)
+            record = job_store.get(download_id)
+            del record["id"], record["log"]
+            downloads[download_id] = record
+            download_logs[download_id] = ()
+            active[key] = download_id
+            created.append(download_id)
+            results.append({"url": url, "download_id": download_id})
+        if len(created) > 1:
+            group = ScanGroup(scan_coordinator, created)
+            for download_id in created:
+                scan_groups[download_id] = group
+    for download_id in created:
+        download_events.publish('created', download_id, download_record(download_id))
+    for download_id in created:
+        download_scheduler.submit(download_id, priority)
+    for result in results:
+        result["queue_position"] = download_scheduler.position(result["download_id"])
+    if len(created) > 1:
+        log.info(f"[QUEUE] Batch of {len(created)} jobs queued ({len(urls) - len(created)} duplicates)")
+    return results
+
+def submit_scheduled_syncs(urls):
+    """SyncSchedule callback: queue due syncs as one batch, returns {url: job ID}"""
+    results = submit_downloads(urls, SYNC_PRIORITY, refresh=True)
+    return {result["url"]: result["download_id"] for result in results}
+
+def resume_interrupted_downloads():
+    """Queue again the jobs a restart cut short; spotdl skips the files already on disk"""
+    job_store.purge()
+    for record in job_store.interrupted():
+        download_id = record.pop("id")
+        saved_log = record.pop("log")
+        record["status"] = "queued"
+        # Runs on a startup thread while /download may already be taking requests
+        with submit_lock:
+            downloads[download_id] = record
+            download_logs[download_id] = tuple(saved_log.split("\n")[-LOG_LINES:]) if saved_log else ()
+        job_store.update(download_id, {"status": "queued"})
+        append_download_log(download_id, "Reanudando descarga interrumpida por un reinicio...")
+        download_scheduler.submit(download_id, record.get("priority", 0))
+        log.info(f"[JOBS] Resumed interrupted job {download_id}: {record['url']}")
+
+def check_music_dir():
+    """Log whether MUSIC_DIR exists and is writable"""
+    try:
+        if not os.path.exists(MUSIC_DIR):
+            log.error(f"[STARTUP] ERROR: MUSIC_DIR does not exist: {MUSIC_DIR}")
+        elif not os.access(MUSIC_DIR, os.W_OK):
+            log.error(f"[STARTUP] ERROR: MUSIC_DIR is not writable: {MUSIC_DIR}")
+            stat = os.stat(MUSIC_DIR)
+            log.error(f"[STARTUP] Directory permissions: {oct(stat.st_mode)}, UID: {stat.st_uid}, GID: {stat.st_gid}")
         else:
-            downloads[download_id]["status"] = "error"
-
-        downloads[download_id]["finished"] = datetime.now().isoformat()
-
+            log.info(f"[STARTUP] ✓ MUSIC_DIR is writable: {MUSIC_DIR}")
     except Exception as e:
-        downloads[download_id]["status"] = "error"
-        downloads[download_id]["error"] = str(e)
+        log.error(f"[STARTUP] ERROR checking MUSIC_DIR: {str(e)}")
+
+_startup_lock = threading.Lock()
+_started = False
+
+def start_background_tasks():
+    resume_interrupted_downloads()
+    # Started after resuming, so a sync due now sees the jobs that are already queued again
+    sync_schedule.start()
+
+def create_app():
+    """Set up logging, open the stores and resume interrupted jobs; returns the Flask app.
+
+    Only the first call does anything, so every server thread shares one set of
+    stores, one scheduler and one event bus. Importing the module starts no
+    threads or processes; all of them are started here. Nothing slow runs here: the library
+    index, the Navidrome catalog and the job history purge are all deferred to
+    their first use or to a background thread.
+    """
+    global _started, job_store, library_index, track_cache, file_watcher, sync_schedule
+    global download_scheduler, spotdl_workers
+    with _startup_lock:
+        if _started:
+            return app
+        logs.configure(LOG_LEVEL, LOG_FILE, LOG_FILE_LEVEL, LOG_FILE_MAX_BYTES, LOG_FILE_BACKUPS,
+                       LOG_FORMAT, LOG_SAMPLE_RATE, LOG_SAMPLE_BURST)
+        check_music_dir()
+        if not NAVIDROME_USER or not NAVIDROME_PASSWORD:
+            log.warning("[STARTUP] NAVIDROME_USER / NAVIDROME_PASSWORD not set, Navidrome calls will fail")
+        job_store = JobStore(JOB_STORE_PATH, JOB_RETENTION_DAYS, JOB_HISTORY_LIMIT)
+        library_index = LibraryIndex(MUSIC_DIR, LIBRARY_INDEX_PATH)
+        track_cache = TrackCache(MUSIC_DIR, TRACK_CACHE_PATH, TRACK_CACHE_TTL)
+        file_watcher = FileWatcher(MUSIC_DIR, FILE_WATCHER)
+        sync_schedule = SyncSchedule(SYNC_SCHEDULE_PATH, submit_scheduled_syncs, SYNC_INTERVAL_HOURS * 3600)
+        spotdl_workers = SpotdlWorkerPool(SPOTDL_WORKERS, SPOTDL_WORKER_ENGINE)
+        if SPOTDL_ENGINE == "workers":
+            spotdl_workers.warm()
+        download_scheduler = DownloadScheduler(run_download_job, MAX_CONCURRENT_DOWNLOADS)
+        threading.Thread(target=start_background_tasks, name="startup", daemon=True).start()
+        _started = True
+    return app
 
 @app.route('/')
 def index():
@@ -595,28 +941,195 @@ def download():
     if not url:
         return jsonify({"error": "URL is required"}), 400
     
-    download_id = str(len(downloads) + 1)
-    downloads[download_id] = {
-        "url": url,
-        "status": "queued",
-        "log": ""
-    }
-    
-    thread = threading.Thread(target=run_spotdl, args=(url, download_id))
-    thread.start()
-    
-    return jsonify({"download_id": download_id})
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer"}), 400
+
+    # The same URL already queued or running: hand back that job instead of a second one
+    result = submit_downloads([url], priority)[0]
+    del result["url"]
+    return jsonify(result)
+
+@app.route('/download/batch', methods=['POST'])
+def download_batch():
+    """Queue many URLs at once; their playlists wait for one shared Navidrome scan"""
+    data = request.get_json() or {}
+    urls = data.get('urls')
+    if not isinstance(urls, list) or not all(isinstance(url, str) for url in urls):
+        return jsonify({"error": "urls must be a list of URLs"}), 400
+    urls = [url.strip() for url in urls if url.strip()]
+    if not urls:
+        return jsonify({"error": "urls is empty"}), 400
+    if len(urls) > MAX_BATCH_URLS:
+        return jsonify({"error": f"at most {MAX_BATCH_URLS} URLs per batch"}), 400
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer"}), 400
+    return jsonify({"downloads": submit_downloads(urls, priority)})
+
+@app.route('/syncs', methods=['GET', 'POST', 'DELETE'])
+def syncs():
+    """List, add/update (`{"url", "interval_hours"}`) or remove (`?url=`) scheduled syncs"""
+    if request.method == 'GET':
+        return jsonify({"syncs": sync_schedule.list()})
+    if request.method == 'DELETE':
+        if not sync_schedule.unfollow(request.args.get('url', '')):
+            return jsonify({"error": "Sync not found"}), 404
+        return jsonify({"removed": True})
+
+    data = request.get_json() or {}
+    url = (data.get('url') or '').strip()
+    ref = spotify_ref(url)
+    if ref is None or ref[0] == 'track':
+        return jsonify({"error": "url must be a Spotify playlist or album"}), 400
+    try:
+        interval_hours = float(data.get('interval_hours') or SYNC_INTERVAL_HOURS)
+    except (TypeError, ValueError):
+        return jsonify({"error": "interval_hours must be a number"}), 400
+    if interval_hours <= 0:
+        return jsonify({"error": "interval_hours must be positive"}), 400
+    return jsonify(sync_schedule.follow(url, interval_hours * 3600))
+
+@app.route('/syncs/run', methods=['POST'])
+def run_syncs():
+    """Run one sync (`{"url": ...}`) or every sync now, as one batch"""
+    url = (request.get_json(silent=True) or {}).get('url')
+    count = sync_schedule.run_now(url)
+    if url and not count:
+        return jsonify({"error": "Sync not found"}), 404
+    return jsonify({"due": count})
 
 @app.route('/status/<download_id>')
 def status(download_id):
-    if download_id not in downloads:
+    result = download_record(download_id)
+    if result is None:
         return jsonify({"error": "Download not found"}), 404
     
-    return jsonify(downloads[download_id])
+    if result["status"] == "queued":
+        result["queue_position"] = download_scheduler.position(download_id)
+    if request.args.get('tracks'):
+        result["tracks"] = job_store.tracks(download_id)
+    return jsonify(result)
+
+@app.route('/cancel/<download_id>', methods=['POST'])
+def cancel(download_id):
+    if download_id not in downloads:
+        if job_store.get(download_id) is None:
+            return jsonify({"error": "Download not found"}), 404
+        return jsonify({"error": "Download is not queued or running"}), 409
+
+    where = download_scheduler.cancel(download_id)
+    if where is None:
+        return jsonify({"error": "Download is not queued or running"}), 409
+    if where == 'queued':
+        # A batch doesn't wait for a job that will never run
+        group = scan_groups.pop(download_id, None)
+        if group is not None:
+            group.leave(download_id)
+        update_download(download_id, status="cancelled", finished=datetime.now().isoformat())
+        finish_download(download_id)
+    return jsonify({"download_id": download_id, "cancelled": where})
+
+@app.route('/workers', methods=['GET', 'POST'])
+def workers():
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            max_workers = int(data.get('max_workers'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "max_workers must be an integer"}), 400
+        if max_workers < 1:
+            return jsonify({"error": "max_workers must be at least 1"}), 400
+        download_scheduler.resize(max_workers)
+    return jsonify(download_scheduler.stats())
+
+@app.route('/healthz')
+def healthz():
+    """Liveness/readiness probe; never touches Navidrome or the disk"""
+    return jsonify({"status": "ok", **download_scheduler.stats()})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.content_type)
 
 @app.route('/list')
 def list_downloads():
-    return jsonify(downloads)
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(500, max(1, int(request.args.get('limit', 50))))
+    except ValueError:
+        return jsonify({"error": "offset and limit must be integers"}), 400
+
+    statuses = [s for s in request.args.get('status', '').split(',') if s]
+
+    # Read the event position first so nothing that changes while we copy is lost
+    last_event_id = download_events.last_id
+    records, total = job_store.list(offset, limit, statuses, request.args.get('q'))
+    page = {}
+    for record in records:
+        # Jobs still running have a fresher log in memory
+        page[record["id"]] = download_record(record["id"]) if record["id"] in downloads else record
+    return jsonify({
+        "downloads": page,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "last_event_id": last_event_id
+    })
+
+@app.route('/events')
+def events():
+    """Server-Sent Events stream of job changes, resumable with Last-Event-ID.
+
+    At most EVENTS_MAX_STREAMS are open at once; past that the client gets a
+    single "busy" event. Each stream ends after EVENTS_STREAM_SECONDS and the
+    browser reconnects, so a server thread is never held for good.
+    """
+    global open_event_streams
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id', 0))
+    except ValueError:
+        last_id = 0
+
+    with event_streams_lock:
+        busy = open_event_streams >= EVENTS_MAX_STREAMS
+        if not busy:
+            open_event_streams += 1
+    if busy:
+        return Response("retry: 60000\nevent: busy\ndata: {}\n\n", mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache'})
+
+    def release():
+        global open_event_streams
+        with event_streams_lock:
+            open_event_streams -= 1
+
+    def stream():
+        after_id = last_id
+        deadline = time.monotonic() + EVENTS_STREAM_SECONDS
+        yield "retry: 3000\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            batch = download_events.wait(after_id, timeout=min(15, remaining))
+            if not batch:
+                # Heartbeat keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, event_type, download_id, data in batch:
+                payload = json.dumps({"id": download_id, "data": data})
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+                after_id = event_id
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the stream ends or the client goes away, even before the first chunk
+    response.call_on_close(release)
+    return response
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    # Development server; the container runs gunicorn (see gunicorn.conf.py)
+    create_app().run(host='0.0.0.0', port=5000, debug=False, threaded=True)
@@ -0,0 +1,637 @@
+"""Load test for the web endpoints, with a latency report that can gate on a baseline.
+
+Starts the app (under gunicorn with gunicorn.conf.py when it is installed,
+otherwise Flask's threaded server) against tools/fake_spotdl.py and
+tools/fake_navidrome.py, queues --jobs downloads, then runs a mix of simulated
+clients for --duration seconds:
+
+- submitters POST /download with a new playlist URL every --submit-interval seconds
+- pollers act like browser tabs without SSE: GET /list and GET /status/<id>
+  every --poll-interval seconds (a random value between the two given)
+- streamers act like browser tabs with SSE: GET /list once, then hold /events
+  open and reconnect from the last event ID when the stream drops
+
+It reports p50/p95/p99 latency, errors and throughput per endpoint, plus the
+serving process' RSS and threads sampled over the run. Results are written as
+JSON; --compare fails when a run is worse than a stored one:
+
+    python bench/load.py --jobs 300 --pollers 40 --streamers 10 --duration 60 --output load.json
+    python bench/load.py --jobs 300 --pollers 40 --streamers 10 --duration 60 --compare load.json
+"""
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from run import ROOT, TOOLS_DIR, git_commit, write_spotdl_shim
+
+# Latency changes smaller than this are noise, whatever the ratio (1 ms vs 2 ms)
+LATENCY_NOISE_MS = 5
+# Same for memory growth over a run
+MEMORY_NOISE_KB = 8 * 1024
+PERCENTILES = (50, 95, 99)
+# A percentile is only compared with enough requests behind it: 20 for p95, 100 for p99
+MIN_REQUESTS = {p: 100 // (100 - p) for p in PERCENTILES}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_http(port, path, process, timeout):
+    """Wait until GET path answers 200, or fail if the process exits first"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[1]} exited with code {process.returncode}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', path)
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+            conn.close()
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"nothing answered on port {port} after {timeout}s")
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+# ---------------------------------------------------------------------------
+# Recording
+
+
+class Recorder:
+    """Latencies per endpoint, shared by every client thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.events = 0
+        self.reconnects = 0
+        self.started = time.monotonic()
+
+    def add(self, endpoint, seconds, ok=True):
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((time.monotonic() - self.started, seconds))
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def count_events(self, count):
+        with self.lock:
+            self.events += count
+
+    def summary(self, duration):
+        endpoints = {}
+        with self.lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+            errors = dict(self.errors)
+        for name, values in sorted(samples.items()):
+            latencies = sorted(seconds * 1000 for _, seconds in values)
+            endpoints[name] = {
+                'requests': len(latencies),
+                'errors': errors.get(name, 0),
+                'rps': round(len(latencies) / duration, 2),
+                **{f"p{p}_ms": round(percentile(latencies, p), 2) for p in PERCENTILES},
+                'max_ms': round(latencies[-1], 2),
+            }
+        return endpoints
+
+    def timeline(self, interval, end):
+        """Requests and p95 of every endpoint but /events, per `interval` seconds"""
+        with self.lock:
+            values = [sample for name, samples in self.samples.items() if name != 'GET /events'
+                      for sample in samples]
+        windows = []
+        start = 0.0
+        while start < end:
+            latencies = sorted(seconds * 1000 for at, seconds in values if start <= at < start + interval)
+            windows.append({'t': round(start, 1), 'requests': len(latencies),
+                            'p95_ms': round(percentile(latencies, 95), 2) if latencies else None})
+            start += interval
+        return windows
+
+
+class MemorySampler:
+    """RSS and thread count of the serving process, sampled on a background thread"""
+
+    def __init__(self, pid_function, interval):
+        self.pid_function = pid_function
+        self.interval = interval
+        self.samples = []
+        self.started = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="memory-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        self._sample()
+        while not self._stop.wait(self.interval):
+            self._sample()
+        # One more at the very end of the run
+        self._sample()
+
+    def _sample(self):
+        status = read_status(self.pid_function())
+        if status:
+            self.samples.append({'t': round(time.monotonic() - self.started, 1),
+                                 'rss_kb': status['VmRSS'], 'threads': status['Threads']})
+
+    def summary(self):
+        if not self.samples:
+            return {}
+        rss = [sample['rss_kb'] for sample in self.samples]
+        elapsed = self.samples[-1]['t'] - self.samples[0]['t']
+        return {
+            'start_kb': rss[0],
+            'end_kb': rss[-1],
+            'peak_kb': max(rss),
+            'growth_kb': rss[-1] - rss[0],
+            'growth_kb_per_min': round(slope(self.samples) * 60, 1) if elapsed else 0,
+            'peak_threads': max(sample['threads'] for sample in self.samples),
+            'samples': self.samples,
+        }
+
+
+def slope(samples):
+    """Least-squares RSS growth in KiB per second"""
+    n = len(samples)
+    mean_t = sum(s['t'] for s in samples) / n
+    mean_rss = sum(s['rss_kb'] for s in samples) / n
+    variance = sum((s['t'] - mean_t) ** 2 for s in samples)
+    if not variance:
+        return 0.0
+    return sum((s['t'] - mean_t) * (s['rss_kb'] - mean_rss) for s in samples) / variance
+
+
+def read_status(pid):
+    """VmRSS (KiB) and Threads from /proc/<pid>/status, or None"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return {'VmRSS': int(fields['VmRSS'].split()[0]), 'Threads': int(fields['Threads'])}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+# ---------------------------------------------------------------------------
+# Clients
+
+
+class Client:
+    """One keep-alive HTTP connection, reopened after an error"""
+
+    def __init__(self, port, recorder):
+        self.port = port
+        self.recorder = recorder
+        self.conn = None
+
+    def request(self, method, path, endpoint, body=None):
+        """Send a request and record its latency; returns the decoded JSON body or None"""
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        started = time.perf_counter()
+        while True:
+            reused = self.conn is not None
+            try:
+                if self.conn is None:
+                    self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+                self.conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                self.close()
+                # The server closed the idle keep-alive connection; browsers retry on a new one too
+                if not reused:
+                    self.recorder.add(endpoint, time.perf_counter() - started, ok=False)
+                    return None
+        self.recorder.add(endpoint, time.perf_counter() - started, ok=response.status < 500)
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class LoadTest:
+    def __init__(self, port, args):
+        self.port = port
+        self.args = args
+        self.recorder = Recorder()
+        self.stop = threading.Event()
+        self.job_ids = []
+        self.ids_lock = threading.Lock()
+        self.streams = set()
+        self.streams_lock = threading.Lock()
+        self.run_id = f"{int(time.time()):x}"
+
+    def remember(self, job_ids):
+        with self.ids_lock:
+            self.job_ids.extend(job_ids)
+
+    def random_job(self):
+        with self.ids_lock:
+            return random.choice(self.job_ids) if self.job_ids else None
+
+    def url(self, n):
+        return f"https://open.spotify.com/playlist/load{self.run_id}n{n}"
+
+    def preload(self, count):
+        """Queue `count` jobs before the clients start, through /download/batch"""
+        client = Client(self.port, Recorder())
+        for start in range(0, count, 500):
+            urls = [self.url(n) for n in range(start, min(count, start + 500))]
+            reply = client.request('POST', '/download/batch', 'POST /download/batch', {'urls': urls}) or {}
+            self.remember(job['download_id'] for job in reply.get('downloads', ()))
+        client.close()
+
+    def submitter(self, index):
+        client = Client(self.port, self.recorder)
+        n = 0
+        while not self.stop.wait(self.args.submit_interval):
+            n += 1
+            reply = client.request('POST', '/download', 'POST /download',
+                                   {'url': self.url(f"s{index}x{n}")}) or {}
+            if 'download_id' in reply:
+                self.remember([reply['download_id']])
+        client.close()
+
+    def poller(self, index):
+        client = Client(self.port, self.recorder)
+        low, high = self.args.poll_interval
+        # Tabs don't open in the same millisecond
+        if self.stop.wait(random.uniform(0, high)):
+            return
+        while True:
+            client.request('GET', '/list', 'GET /list')
+            job_id = self.random_job()
+            if job_id:
+                client.request('GET', f"/status/{job_id}", 'GET /status/<id>')
+            if self.stop.wait(random.uniform(low, high)):
+                break
+        client.close()
+
+    def streamer(self, index):
+        client = Client(self.port, self.recorder)
+        snapshot = client.request('GET', '/list', 'GET /list') or {}
+        client.close()
+        last_id = snapshot.get('last_event_id', 0)
+        while not self.stop.is_set():
+            last_id = self._stream(last_id)
+            if not self.stop.is_set():
+                with self.recorder.lock:
+                    self.recorder.reconnects += 1
+                self.stop.wait(1)
+
+    def _stream(self, last_id):
+        """Follow /events until it drops or the test ends, returns the last event ID seen"""
+        started = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        sock = None
+        try:
+            conn.request('GET', f"/events?last_event_id={last_id}")
+            # The connection lets go of its socket when the response will end with a close
+            sock = conn.sock
+            response = conn.getresponse()
+            # Time to the headers: how long a tab waits for its stream to open
+            self.recorder.add('GET /events', time.perf_counter() - started, ok=response.status == 200)
+            if response.status != 200:
+                return last_id
+            with self.streams_lock:
+                self.streams.add(sock)
+            if self.stop.is_set():
+                return last_id
+            events = 0
+            for line in response:
+                if line.startswith(b'id: '):
+                    last_id = int(line[4:])
+                    events += 1
+                    if events == 100:
+                        self.recorder.count_events(events)
+                        events = 0
+            self.recorder.count_events(events)
+        except (OSError, http.client.HTTPException, ValueError):
+            if not self.stop.is_set():
+                self.recorder.add('GET /events', time.perf_counter() - started, ok=False)
+        finally:
+            with self.streams_lock:
+                self.streams.discard(sock)
+            conn.close()
+        return last_id
+
+    def run(self, duration):
+        roles = ([(self.submitter, i) for i in range(self.args.submitters)]
+                 + [(self.poller, i) for i in range(self.args.pollers)]
+                 + [(self.streamer, i) for i in range(self.args.streamers)])
+        threads = [threading.Thread(target=target, args=(i,), name=f"{target.__name__}-{i}", daemon=True)
+                   for target, i in roles]
+        self.recorder.started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        self.stop.wait(duration)
+        self.stop.set()
+        # Streams only end when the server closes them; cut them from this side
+        with self.streams_lock:
+            for sock in self.streams:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        for thread in threads:
+            thread.join(timeout=35)
+
+
+# ---------------------------------------------------------------------------
+# App under test
+
+
+def start_services(work_dir, args):
+    """Start the fake Navidrome and the app, returns (processes, app port, serving pid function)"""
+    music_dir = os.path.join(work_dir, 'music')
+    state_dir = os.path.join(work_dir, 'state')
+    bin_dir = os.path.join(work_dir, 'bin')
+    for directory in (music_dir, state_dir, bin_dir):
+        os.makedirs(directory, exist_ok=True)
+    write_spotdl_shim(bin_dir)
+
+    navidrome_port = free_port()
+    navidrome = subprocess.Popen(
+        [sys.executable, os.path.join(TOOLS_DIR, 'fake_navidrome.py'), '--port', str(navidrome_port),
+         '--music-dir', music_dir, '--scan-seconds', str(args.scan_seconds)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    processes = [navidrome]
+
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'PATH': bin_dir + os.pathsep + env.get('PATH', ''),
+        'MUSIC_DIR': music_dir,
+        'LIBRARY_INDEX_PATH': os.path.join(state_dir, 'library.sqlite'),
+        'JOB_STORE_PATH': os.path.join(state_dir, 'jobs.sqlite'),
+        'TRACK_CACHE_PATH': os.path.join(state_dir, 'tracks.sqlite'),
+        'SYNC_SCHEDULE_PATH': os.path.join(state_dir, 'syncs.sqlite'),
+        'LOG_FILE': os.path.join(state_dir, 'app.log'),
+        'LOG_LEVEL': 'WARNING',
+        'NAVIDROME_URL': f"http://127.0.0.1:{navidrome_port}",
+        'NAVIDROME_USER': 'admin',
+        'NAVIDROME_PASSWORD': 'admin',
+        'SPOTDL_ENGINE': args.engine,
+        'SPOTDL_WORKER_ENGINE': f"{os.path.join(TOOLS_DIR, 'fake_spotdl.py')}:main",
+        'FAKE_SPOTDL_TRACKS': str(args.tracks),
+        'FAKE_SPOTDL_DELAY': str(args.track_seconds),
+        'BIND': f"127.0.0.1:{port}",
+        'PYTHONDONTWRITEBYTECODE': '1',
+    })
+    if args.web_threads:
+        env['WEB_THREADS'] = str(args.web_threads)
+
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:create_app()']
+    else:
+        command = [sys.executable, '-c',
+                   f"import app; app.create_app().run(host='127.0.0.1', port={port}, threaded=True)"]
+    server_log = open(os.path.join(state_dir, 'server.log'), 'wb')
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=server_log, stderr=subprocess.STDOUT)
+    server_log.close()
+    processes.append(server)
+
+    def serving_pid():
+        if args.server != 'gunicorn':
+            return server.pid
+        # The gunicorn worker; its own children are spotdl workers
+        children = child_pids(server.pid)
+        return children[0] if children else None
+
+    try:
+        wait_for_http(navidrome_port, '/rest/ping?u=admin&p=admin&f=json', navidrome, 30)
+        wait_for_http(port, '/healthz', server, 60)
+    except Exception:
+        stop_services(processes)
+        raise
+    return processes, port, serving_pid
+
+
+def stop_services(processes):
+    for process in reversed(processes):
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def wait_for_queue(port, timeout):
+    """Wait until no job is queued or running, returns False on timeout"""
+    client = Client(port, Recorder())
+    deadline = time.monotonic() + timeout
+    try:
+        while time.monotonic() < deadline:
+            stats = client.request('GET', '/healthz', 'GET /healthz') or {}
+            if not stats.get('queued') and not stats.get('running'):
+                return True
+            time.sleep(0.5)
+        return False
+    finally:
+        client.close()
+
+
+# ---------------------------------------------------------------------------
+# Report
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<22} {'requests':>9} {'errors':>7} {'rps':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, result in report['endpoints'].items():
+        print(f"{name:<22} {result['requests']:>9} {result['errors']:>7} {result['rps']:>8.2f} "
+              f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['max_ms']:>9.2f}")
+    streams = report['streams']
+    print(f"\nSSE: {streams['events']} events delivered, {streams['reconnects']} reconnects")
+    memory = report['memory']
+    if memory:
+        print(f"RSS: {memory['start_kb'] / 1024:.1f} -> {memory['end_kb'] / 1024:.1f} MiB "
+              f"(peak {memory['peak_kb'] / 1024:.1f} MiB, {memory['growth_kb_per_min'] / 1024:+.2f} MiB/min), "
+              f"peak {memory['peak_threads']} threads")
+    print(f"\n{'t':>7} {'requests':>9} {'p95 ms':>9} {'rss MiB':>9}")
+    rss = {int(sample['t']): sample['rss_kb'] for sample in memory.get('samples', ())}
+    for window in report['timeline']:
+        window_rss = [kb for t, kb in rss.items() if window['t'] <= t < window['t'] + report['parameters']['window']]
+        p95 = f"{window['p95_ms']:.2f}" if window['p95_ms'] is not None else '-'
+        mib = f"{window_rss[-1] / 1024:.1f}" if window_rss else '-'
+        print(f"{window['t']:>7.1f} {window['requests']:>9} {p95:>9} {mib:>9}")
+
+
+def compare(baseline, current, threshold):
+    """Print the metrics that got worse than the baseline by more than threshold, returns them"""
+    violations = []
+    for name, result in current['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        for p in PERCENTILES:
+            if min(result['requests'], before['requests']) < MIN_REQUESTS[p]:
+                continue
+            key = f"p{p}_ms"
+            limit = max(before[key] * (1 + threshold), before[key] + LATENCY_NOISE_MS)
+            if result[key] > limit:
+                violations.append(f"{name} {key} {result[key]:.2f} > {limit:.2f} (baseline {before[key]:.2f})")
+        error_rate = result['errors'] / result['requests']
+        before_rate = before['errors'] / before['requests'] if before['requests'] else 0
+        if error_rate > before_rate:
+            violations.append(f"{name} error rate {error_rate:.2%} > baseline {before_rate:.2%}")
+        if result['rps'] < before['rps'] * (1 - threshold):
+            violations.append(f"{name} throughput {result['rps']:.2f} rps < baseline {before['rps']:.2f} rps")
+
+    growth = current['memory'].get('growth_kb')
+    before_growth = baseline.get('memory', {}).get('growth_kb')
+    if growth is not None and before_growth is not None:
+        limit = max(before_growth, 0) * (1 + threshold) + MEMORY_NOISE_KB
+        if growth > limit:
+            violations.append(f"RSS growth {growth / 1024:.1f} MiB > {limit / 1024:.1f} MiB "
+                              f"(baseline {before_growth / 1024:.1f} MiB)")
+
+    if baseline.get('parameters', {}).get('clients') != current['parameters']['clients']:
+        print("[LOAD] Note: the baseline was recorded with a different client mix", flush=True)
+    for violation in violations:
+        print(f"[LOAD] WORSE THAN BASELINE: {violation}", flush=True)
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=60, help='seconds the clients run for')
+    parser.add_argument('--jobs', type=int, default=200, help='jobs queued before the clients start')
+    parser.add_argument('--submitters', type=int, default=1)
+    parser.add_argument('--submit-interval', type=float, default=1.0, help='seconds between a submitter\'s jobs')
+    parser.add_argument('--pollers', type=int, default=30, help='browser tabs polling /list and /status')
+    parser.add_argument('--poll-interval', type=float, nargs=2, default=[2.0, 3.0], metavar=('MIN', 'MAX'),
+                        help='seconds between a poller\'s rounds, picked at random in this range')
+    parser.add_argument('--streamers', type=int, default=10, help='browser tabs following /events')
+    parser.add_argument('--tracks', type=int, default=10, help='tracks the fake spotdl downloads per job')
+    parser.add_argument('--track-seconds', type=float, default=0.05, help='fake spotdl time per track')
+    parser.add_argument('--scan-seconds', type=float, default=0.5, help='fake Navidrome scan duration')
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'flask'), default='auto',
+                        help='auto uses gunicorn when it is installed')
+    parser.add_argument('--web-threads', type=int, help='gunicorn threads (WEB_THREADS); each SSE client holds one')
+    parser.add_argument('--engine', choices=('workers', 'cli'), default='cli', help='SPOTDL_ENGINE')
+    parser.add_argument('--window', type=float, default=5.0, help='seconds per timeline row and memory sample')
+    parser.add_argument('--drain', action='store_true', help='after the run, wait for the queue to empty')
+    parser.add_argument('--work-dir', help='where to keep the app state (default: a temporary directory)')
+    parser.add_argument('--keep', action='store_true', help='keep the work directory')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file; exit with status 1 when this run is worse')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed latency increase / throughput drop against the baseline (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    if args.server == 'auto':
+        args.server = 'gunicorn' if importlib.util.find_spec('gunicorn') else 'flask'
+        if args.server == 'flask':
+            print("[LOAD] gunicorn is not installed, using Flask's server instead", flush=True)
+
+    base_dir = args.work_dir or tempfile.mkdtemp(prefix='spotdl-web-load-')
+    clients = {'submitters': args.submitters, 'pollers': args.pollers, 'streamers': args.streamers}
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'duration': args.duration, 'jobs': args.jobs, 'clients': clients,
+                       'poll_interval': args.poll_interval, 'submit_interval': args.submit_interval,
+                       'tracks': args.tracks, 'track_seconds': args.track_seconds,
+                       'server': args.server, 'engine': args.engine, 'window': args.window},
+    }
+    try:
+        processes, port, serving_pid = start_services(base_dir, args)
+        try:
+            test = LoadTest(port, args)
+            started = time.perf_counter()
+            test.preload(args.jobs)
+            print(f"[LOAD] {len(test.job_ids)} jobs queued in {time.perf_counter() - started:.1f}s, "
+                  f"running {clients} for {args.duration:g}s on {args.server}", flush=True)
+
+            sampler = MemorySampler(serving_pid, args.window)
+            sampler.start()
+            test.run(args.duration)
+            sampler.stop()
+
+            if args.drain:
+                drained = wait_for_queue(port, 600)
+                print(f"[LOAD] Queue {'drained' if drained else 'still busy after 600s'}", flush=True)
+            crashed = processes[-1].poll() is not None
+        finally:
+            stop_services(processes)
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    report['endpoints'] = test.recorder.summary(args.duration)
+    report['streams'] = {'events': test.recorder.events, 'reconnects': test.recorder.reconnects}
+    report['memory'] = sampler.summary()
+    report['timeline'] = test.recorder.timeline(args.window, args.duration)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[LOAD] Results written to {args.output}", flush=True)
+
+    if crashed:
+        print("[LOAD] The app exited during the run", flush=True)
+        return 1
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        violations = compare(baseline, report, args.threshold)
+        if violations:
+            print(f"\n[LOAD] {len(violations)} metric(s) worse than baseline by more than "
+                  f"{args.threshold:.0%}", flush=True)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,413 @@
+"""Benchmarks for the library scan, matching and playlist pipeline.
+
+Generates a synthetic music tree per size, then runs every stage in its own
+Python process against it, with spotdl replaced by tools/fake_spotdl.py and
+Navidrome by tools/fake_navidrome.py. Each stage reports wall time, peak RSS
+and syscall counts; results are written as JSON and can be compared with a
+previous run:
+
+    python bench/run.py --sizes 10000 100000 --output bench.json
+    python bench/run.py --sizes 10000 --compare bench.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+TOOLS_DIR = os.path.join(ROOT, 'tools')
+
+STAGES = (
+    'walk_snapshot',
+    'index_cold',
+    'index_warm',
+    'extract_playlist_info',
+    'find_songs_by_info',
+    'create_playlist',
+    'run_spotdl',
+)
+RESULT_MARKER = 'BENCH_RESULT '
+# Python-level filesystem/process events counted through an audit hook
+AUDIT_EVENTS = ('open', 'os.scandir', 'os.listdir', 'os.remove', 'os.rename',
+                'sqlite3.connect', 'subprocess.Popen', 'socket.connect')
+
+
+def read_proc_io():
+    try:
+        with open('/proc/self/io') as f:
+            return {k: int(v) for k, v in (line.split(': ') for line in f)}
+    except OSError:
+        return {}
+
+
+def read_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+# ---------------------------------------------------------------------------
+# Child side: one stage in a fresh interpreter
+
+
+class StageContext:
+    def __init__(self, work_dir, options):
+        self.work_dir = work_dir
+        self.music_dir = os.path.join(work_dir, 'music')
+        self.state_dir = os.path.join(work_dir, 'state')
+        self.index_path = os.path.join(self.state_dir, 'library.sqlite')
+        self.options = options
+        with open(os.path.join(work_dir, 'workload.json')) as f:
+            workload = json.load(f)
+        self.tracks = [tuple(t) for t in workload['tracks']]
+        self.queries = [tuple(q) for q in workload['queries']]
+        self._app = None
+
+    @property
+    def app(self):
+        """The app module, pointed at the synthetic tree"""
+        if self._app is None:
+            sys.path.insert(0, ROOT)
+            import app
+            from library_index import LibraryIndex
+            from track_cache import TrackCache
+            app.MUSIC_DIR = self.music_dir
+            app.create_app()
+            app.library_index = LibraryIndex(self.music_dir, self.index_path)
+            app.track_cache = TrackCache(self.music_dir, os.path.join(self.state_dir, 'tracks.sqlite'))
+            self._app = app
+        return self._app
+
+    def warm_index(self):
+        if self.app.library_index.count() == 0:
+            self.app.library_index.refresh()
+
+    def use_fake_navidrome(self):
+        """Point the app at an in-process fake Navidrome with instant scans"""
+        sys.path.insert(0, TOOLS_DIR)
+        import fake_navidrome
+        from subsonic_client import SubsonicClient
+        from navidrome_catalog import NavidromeCatalog
+        from scan_coordinator import ScanCoordinator
+        app = self.app
+        server, url = fake_navidrome.start_in_thread(scan_seconds=self.options.get('scan_seconds', 0.05))
+        app.navidrome = SubsonicClient(url, 'admin', 'admin')
+        app.navidrome_catalog = NavidromeCatalog(app.navidrome)
+        app.scan_coordinator = ScanCoordinator(app.navidrome, on_complete=app.navidrome_catalog.mark_stale)
+        return server
+
+
+def prepare_walk_snapshot(ctx):
+    audio_extensions = ('.mp3', '.m4a', '.flac', '.wav', '.ogg')
+
+    def walk():
+        # The full-tree snapshot run_spotdl took before and after each download
+        snapshot = set()
+        for root, dirs, files in os.walk(ctx.music_dir):
+            for file in files:
+                if file.lower().endswith(audio_extensions):
+                    snapshot.add(file)
+        return {'files': len(snapshot)}
+    return walk
+
+
+def prepare_index_cold(ctx):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(ctx.index_path + suffix):
+            os.remove(ctx.index_path + suffix)
+    sys.path.insert(0, ROOT)
+    from library_index import LibraryIndex
+    index = LibraryIndex(ctx.music_dir, ctx.index_path)
+
+    def refresh():
+        added, modified, removed = index.refresh()
+        return {'added': len(added)}
+    return refresh
+
+
+def prepare_index_warm(ctx):
+    ctx.warm_index()
+
+    def refresh():
+        added, modified, removed = ctx.app.library_index.refresh()
+        return {'changed': len(added) + len(modified) + len(removed)}
+    return refresh
+
+
+def prepare_extract_playlist_info(ctx):
+    sys.path.insert(0, BENCH_DIR)
+    import workload
+    lines = workload.spotdl_log(ctx.queries)
+    app = ctx.app
+
+    def extract():
+        name, songs = app.extract_playlist_info(lines)
+        return {'lines': len(lines), 'songs': len(songs)}
+    return extract
+
+
+def prepare_find_songs_by_info(ctx):
+    ctx.warm_index()
+    app = ctx.app
+
+    def find():
+        found = app.find_songs_by_info(ctx.queries)
+        return {'queries': len(ctx.queries), 'found': len(found)}
+    return find
+
+
+def prepare_create_playlist(ctx):
+    ctx.warm_index()
+    ctx.use_fake_navidrome()
+    app = ctx.app
+    files = [path for path, name in app.library_index.all_files()[:len(ctx.queries)]]
+
+    def create():
+        success, message = app.create_playlist_in_navidrome('Benchmark Playlist', files)
+        return {'success': success, 'entries': len(files)}
+    return create
+
+
+def prepare_run_spotdl(ctx):
+    ctx.warm_index()
+    ctx.use_fake_navidrome()
+    app = ctx.app
+    client = app.app.test_client()
+    # A new URL each run, so the fake spotdl writes new files every time
+    url = f"https://open.spotify.com/playlist/bench{int(time.time() * 1000)}"
+
+    def run():
+        download_id = client.post('/download', json={'url': url}).get_json()['download_id']
+        while True:
+            record = app.download_record(download_id)
+            if record['status'] not in ('queued', 'downloading', 'creating_playlist'):
+                break
+            time.sleep(0.01)
+        return {'status': record['status'], 'progress': record.get('progress')}
+    return run
+
+
+def run_child(stage, work_dir, options):
+    ctx = StageContext(work_dir, options)
+    fn = globals()[f"prepare_{stage}"](ctx)
+
+    counts = dict.fromkeys(AUDIT_EVENTS, 0)
+    measuring = [False]
+
+    def audit(event, args):
+        if measuring[0] and event in counts:
+            counts[event] += 1
+    sys.addaudithook(audit)
+
+    rss_before = read_rss_kb()
+    io_before = read_proc_io()
+    measuring[0] = True
+    started = time.perf_counter()
+    detail = fn()
+    wall = time.perf_counter() - started
+    measuring[0] = False
+    io_after = read_proc_io()
+
+    result = {
+        'wall_s': round(wall, 4),
+        'rss_before_kb': rss_before,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'syscalls': {
+            'read': io_after.get('syscr', 0) - io_before.get('syscr', 0),
+            'write': io_after.get('syscw', 0) - io_before.get('syscw', 0),
+        },
+        'audit': {k: v for k, v in counts.items() if v},
+        'detail': detail,
+    }
+    sys.stdout.write(RESULT_MARKER + json.dumps(result) + '\n')
+    sys.stdout.flush()
+    # Skip interpreter teardown (daemon threads, sqlite handles)
+    os._exit(0)
+
+
+# ---------------------------------------------------------------------------
+# Parent side
+
+
+def parse_strace_summary(path):
+    counts = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            # % time, seconds, usecs/call, calls, [errors], syscall
+            if len(parts) >= 5 and parts[-1] != 'syscall' and parts[3].isdigit():
+                counts[parts[-1]] = int(parts[3])
+    return counts
+
+
+def run_stage(stage, work_dir, args):
+    bin_dir = os.path.join(work_dir, 'bin')
+    env = dict(os.environ)
+    env.update({
+        'PATH': bin_dir + os.pathsep + env.get('PATH', ''),
+        'LIBRARY_INDEX_PATH': os.path.join(work_dir, 'state', 'app-import.sqlite'),
+        'JOB_STORE_PATH': os.path.join(work_dir, 'state', f"jobs-{stage}.sqlite"),
+        'TRACK_CACHE_PATH': os.path.join(work_dir, 'state', 'app-tracks.sqlite'),
+        'FAKE_SPOTDL_TRACKS': str(args.new_tracks),
+        'LOG_FILE': os.path.join(work_dir, 'state', f"app-{stage}.log"),
+        'PYTHONDONTWRITEBYTECODE': '1',
+    })
+    options = json.dumps({'scan_seconds': args.scan_seconds})
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', stage, '--work-dir', work_dir,
+           '--child-options', options]
+    strace_out = None
+    if args.strace:
+        strace_out = os.path.join(work_dir, 'state', f"strace-{stage}.txt")
+        cmd = ['strace', '-f', '-c', '-o', strace_out] + cmd
+
+    proc = subprocess.run(cmd, env=env, capture_output=True, text=True)
+    lines = [l for l in proc.stdout.splitlines() if l.startswith(RESULT_MARKER)]
+    if proc.returncode != 0 or not lines:
+        tail = (proc.stdout + proc.stderr).strip().splitlines()[-15:]
+        return {'error': f"exit {proc.returncode}", 'output': tail}
+    result = json.loads(lines[-1][len(RESULT_MARKER):])
+    if strace_out and os.path.exists(strace_out):
+        # Whole process, including interpreter start-up and imports
+        result['strace'] = parse_strace_summary(strace_out)
+    return result
+
+
+def write_spotdl_shim(bin_dir):
+    """A `spotdl` executable in bin_dir that runs tools/fake_spotdl.py"""
+    shim = os.path.join(bin_dir, 'spotdl')
+    with open(shim, 'w') as f:
+        f.write(f"#!/bin/sh\nexec \"{sys.executable}\" \"{os.path.join(TOOLS_DIR, 'fake_spotdl.py')}\" \"$@\"\n")
+    os.chmod(shim, 0o755)
+
+
+def prepare_work_dir(base_dir, size, args):
+    sys.path.insert(0, BENCH_DIR)
+    import workload
+    work_dir = os.path.join(base_dir, f"files-{size}")
+    music_dir = os.path.join(work_dir, 'music')
+    if os.path.exists(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(os.path.join(work_dir, 'state'))
+    os.makedirs(os.path.join(work_dir, 'bin'))
+
+    started = time.perf_counter()
+    tracks = workload.generate_tree(music_dir, size)
+    print(f"[BENCH] Generated {size} files in {time.perf_counter() - started:.1f}s", flush=True)
+    queries = workload.song_queries(tracks, args.songs)
+    with open(os.path.join(work_dir, 'workload.json'), 'w') as f:
+        json.dump({'tracks': tracks, 'queries': queries}, f)
+
+    write_spotdl_shim(os.path.join(work_dir, 'bin'))
+    return work_dir
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(baseline, current, threshold):
+    """Print wall time ratios against a baseline, returns the stages that regressed"""
+    regressions = []
+    print(f"\n{'size':>9} {'stage':<24} {'baseline':>10} {'current':>10} {'ratio':>7}")
+    for size, stages in current['results'].items():
+        for stage, result in stages.items():
+            before = baseline.get('results', {}).get(size, {}).get(stage, {})
+            if 'wall_s' not in result or 'wall_s' not in before:
+                continue
+            ratio = result['wall_s'] / before['wall_s'] if before['wall_s'] else float('inf')
+            flag = ''
+            if ratio > 1 + threshold:
+                regressions.append((size, stage, ratio))
+                flag = '  REGRESSION'
+            print(f"{size:>9} {stage:<24} {before['wall_s']:>10.4f} {result['wall_s']:>10.4f} {ratio:>7.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000],
+                        help='library sizes (number of files) to generate')
+    parser.add_argument('--songs', type=int, default=1000, help='songs per playlist for matching/log stages')
+    parser.add_argument('--new-tracks', type=int, default=50, help='tracks the fake spotdl downloads per job')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--scan-seconds', type=float, default=0.05, help='fake Navidrome scan duration')
+    parser.add_argument('--work-dir', help='where to build the trees (default: a temporary directory)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated trees')
+    parser.add_argument('--strace', action='store_true', help='also count syscalls with strace -c')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare wall times against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown against the baseline before failing (0.25 = 25%%)')
+    parser.add_argument('--child', choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument('--child-options', default='{}', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.work_dir, json.loads(args.child_options))
+        return 0
+
+    if args.strace and not shutil.which('strace'):
+        parser.error('--strace needs strace installed')
+
+    base_dir = args.work_dir or tempfile.mkdtemp(prefix='spotdl-web-bench-')
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': {'songs': args.songs, 'new_tracks': args.new_tracks},
+        'results': {},
+    }
+    try:
+        for size in args.sizes:
+            work_dir = prepare_work_dir(base_dir, size, args)
+            results = report['results'][str(size)] = {}
+            for stage in args.stages:
+                result = run_stage(stage, work_dir, args)
+                results[stage] = result
+                if 'error' in result:
+                    print(f"[BENCH] {size:>8} {stage:<24} FAILED {result['error']}", flush=True)
+                    for line in result['output']:
+                        print(f"[BENCH]     {line}", flush=True)
+                else:
+                    print(f"[BENCH] {size:>8} {stage:<24} {result['wall_s']:>9.4f}s "
+                          f"peak {result['peak_rss_kb'] / 1024:>7.1f} MiB "
+                          f"syscr {result['syscalls']['read']:>8} syscw {result['syscalls']['write']:>8}", flush=True)
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Results written to {args.output}", flush=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print(f"\n[BENCH] {len(regressions)} stage(s) slower than baseline by more than "
+                  f"{args.threshold:.0%}", flush=True)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
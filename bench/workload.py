@@ -0,0 +1,68 @@
+"""Synthetic music trees, song lists and spotdl logs for the benchmarks."""
+import os
+import random
+
+WORDS = (
+    'love night fire heart dream blue city rain gold star summer river light '
+    'shadow ocean wild home road sky time dance lost young forever stone '
+    'angel storm silver echo midnight sun moon paradise thunder velvet'
+).split()
+
+TRACKS_PER_ALBUM = 10
+ALBUMS_PER_ARTIST = 5
+
+
+def track_name(index, rng):
+    artist = f"Artist {index // (TRACKS_PER_ALBUM * ALBUMS_PER_ARTIST)}"
+    title = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {index}"
+    return artist, title
+
+
+def generate_tree(music_dir, files, seed=1):
+    """Create `files` empty tracks as Artist/Album/Artist - Title.mp3, returns the (artist, title) list"""
+    rng = random.Random(seed)
+    tracks = []
+    created_dirs = set()
+    for index in range(files):
+        artist, title = track_name(index, rng)
+        album = f"Album {index // TRACKS_PER_ALBUM}"
+        directory = os.path.join(music_dir, artist, album)
+        if directory not in created_dirs:
+            os.makedirs(directory, exist_ok=True)
+            created_dirs.add(directory)
+        extension = '.flac' if index % 10 == 0 else '.mp3'
+        open(os.path.join(directory, f"{artist} - {title}{extension}"), 'wb').close()
+        tracks.append((artist, title))
+    return tracks
+
+
+def song_queries(tracks, count, seed=2):
+    """(artist, title) queries against a library: 60% exact, 30% altered titles, 10% missing"""
+    rng = random.Random(seed)
+    queries = []
+    for i in range(count):
+        artist, title = rng.choice(tracks)
+        kind = i % 10
+        if kind < 6:
+            queries.append((artist, title))
+        elif kind < 9:
+            words = title.split()
+            queries.append((artist, ' '.join(words[:-1]) + ' - Remastered ' + words[-1]))
+        else:
+            queries.append((f"Unknown Artist {i}", f"Missing Song {i}"))
+    return queries
+
+
+def spotdl_log(queries, noise_every=3):
+    """spotdl-style output for the given songs, with progress noise in between"""
+    lines = [f"Found {len(queries)} songs in Benchmark Playlist (Playlist)"]
+    for i, (artist, title) in enumerate(queries):
+        if i % noise_every == 0:
+            lines.append(f"Processing query: {artist} {title}")
+        if i % 4 == 0:
+            lines.append(f"Skipping {artist} - {title} (file already exists) (duplicate)")
+        elif i % 25 == 0:
+            lines.append(f"LookupError: No results found for song: {artist} - {title}")
+        else:
+            lines.append(f'Downloaded "{artist} - {title}": https://music.youtube.com/watch?v={i:011d}')
+    return lines
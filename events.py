@@ -0,0 +1,71 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+
+class EventBus:
+    """Numbered stream of per-job change events for Server-Sent Events clients.
+
+    The last `history` events are kept so a reconnecting client can resume from
+    its Last-Event-ID. A client that fell further behind gets a single "reset"
+    event and should reload the /list snapshot. Events of the `volatile` types
+    (log lines) go to a ring of their own of `volatile_history` events, so a
+    chatty job can't push state changes out; a client that missed log lines
+    only loses them, it isn't reset.
+    """
+
+    def __init__(self, history=2000, volatile=('log',), volatile_history=500):
+        self._cond = threading.Condition()
+        self._events = collections.deque(maxlen=history)
+        self._volatile = collections.deque(maxlen=volatile_history)
+        self._volatile_types = frozenset(volatile)
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        # Newest state event that fell out of the history
+        self._dropped_id = 0
+
+    @property
+    def last_id(self):
+        with self._cond:
+            return self._last_id
+
+    def publish(self, event_type, download_id, data):
+        with self._cond:
+            self._last_id = next(self._ids)
+            if event_type in self._volatile_types:
+                ring = self._volatile
+            else:
+                ring = self._events
+                if len(ring) == ring.maxlen:
+                    self._dropped_id = ring[0][0]
+            ring.append((self._last_id, event_type, download_id, data))
+            self._cond.notify_all()
+
+    def wait(self, after_id, timeout=15):
+        """Return events newer than after_id, blocking up to timeout seconds for one"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if after_id > self._last_id:
+                # Client is ahead of us: the process restarted since it connected
+                return [(self._last_id, 'reset', None, {})]
+            while self._last_id <= after_id:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            if self._dropped_id > after_id:
+                return [(self._last_id, 'reset', None, {})]
+            return list(heapq.merge(_newer(self._events, after_id), _newer(self._volatile, after_id)))
+
+
+def _newer(ring, after_id):
+    """Events of a ring with an ID above after_id, oldest first"""
+    events = []
+    for event in reversed(ring):
+        if event[0] <= after_id:
+            break
+        events.append(event)
+    events.reverse()
+    return events
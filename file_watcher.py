@@ -0,0 +1,283 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from library_index import AUDIO_EXTENSIONS, RACY_WINDOW_NS
+
+log = logging.getLogger(__name__)
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_audio(name):
+    return name.lower().endswith(AUDIO_EXTENSIONS)
+
+
+class _InotifyBackend:
+    """Reports audio files closed after writing or renamed into place"""
+
+    def __init__(self, music_dir):
+        self.music_dir = music_dir
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._add_watch_fn = libc.inotify_add_watch
+        self._add_watch_fn.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._dirs = {}
+        self._pending = []
+        self._add_watch('')
+
+    def _add_watch(self, rel_dir):
+        abs_dir = os.path.join(self.music_dir, rel_dir) if rel_dir else self.music_dir
+        wd = self._add_watch_fn(self._fd, os.fsencode(abs_dir), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), abs_dir)
+        self._dirs[wd] = rel_dir
+
+    def _watch_new_dir(self, rel_dir):
+        """Watch a directory created after start, reporting what landed in it before the watch"""
+        try:
+            self._add_watch(rel_dir)
+            abs_dir = os.path.join(self.music_dir, rel_dir)
+            with os.scandir(abs_dir) as entries:
+                for entry in entries:
+                    rel_path = os.path.join(rel_dir, entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        self._watch_new_dir(rel_path)
+                    elif is_audio(entry.name):
+                        self._pending.append(rel_path)
+        except OSError as e:
+            log.warning(f"[WATCH] Cannot watch {rel_dir}: {e}")
+
+    def wait(self, timeout):
+        select.select([self._fd], [], [], timeout)
+
+    def poll(self):
+        """Return (relative paths of finished audio files, whether events were lost)"""
+        lost = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    lost = True
+                    continue
+                if mask & IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+                rel_dir = self._dirs.get(wd)
+                if rel_dir is None or not name:
+                    continue
+                name = os.fsdecode(name)
+                rel_path = os.path.join(rel_dir, name) if rel_dir else name
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self._watch_new_dir(rel_path)
+                elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and is_audio(name):
+                    self._pending.append(rel_path)
+        paths, self._pending = self._pending, []
+        return paths, lost
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingBackend:
+    """Fallback that relists watched directories whose mtime changed"""
+
+    def __init__(self, music_dir, interval):
+        self.music_dir = music_dir
+        self.interval = interval
+        # rel_dir -> (mtime_ns, {name: (size, mtime_ns, inode)}, subdirs)
+        self._dirs = {}
+        self._dirs[''] = self._list('')
+
+    def _list(self, rel_dir):
+        abs_dir = os.path.join(self.music_dir, rel_dir) if rel_dir else self.music_dir
+        mtime_ns = os.stat(abs_dir).st_mtime_ns
+        files, subdirs = {}, set()
+        with os.scandir(abs_dir) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.add(entry.name)
+                    elif is_audio(entry.name):
+                        st = entry.stat()
+                        files[entry.name] = (st.st_size, st.st_mtime_ns, st.st_ino)
+                except OSError:
+                    pass
+        # Don't trust an mtime that could still change within the same tick
+        if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+            mtime_ns = -1
+        return mtime_ns, files, subdirs
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, self.interval))
+
+    def poll(self):
+        paths = []
+        queue = list(self._dirs)
+        while queue:
+            rel_dir = queue.pop()
+            previous_mtime, previous_files, previous_subdirs = self._dirs[rel_dir]
+            abs_dir = os.path.join(self.music_dir, rel_dir) if rel_dir else self.music_dir
+            try:
+                if os.stat(abs_dir).st_mtime_ns == previous_mtime:
+                    continue
+                listing = self._list(rel_dir)
+            except OSError:
+                if rel_dir:
+                    del self._dirs[rel_dir]
+                continue
+            self._dirs[rel_dir] = listing
+            mtime_ns, files, subdirs = listing
+            for name, signature in files.items():
+                if previous_files.get(name) != signature:
+                    paths.append(os.path.join(rel_dir, name) if rel_dir else name)
+            # Directories created since start are watched from empty, so all their files count
+            for name in subdirs - previous_subdirs:
+                rel_path = os.path.join(rel_dir, name) if rel_dir else name
+                self._dirs[rel_path] = (None, {}, set())
+                queue.append(rel_path)
+        return paths, False
+
+    def close(self):
+        pass
+
+
+class WatchSession:
+    """Files finished under the music directory while one job was running"""
+
+    def __init__(self, watcher, job_id):
+        self.job_id = job_id
+        self.complete = True
+        self.closed = False
+        self._watcher = watcher
+        self._files = {}
+        self._shared = {}
+
+    def close(self, claim=None):
+        """Stop watching, returns the job's relative paths in the order they were finished.
+
+        Files finished while other jobs were running as well are only returned if
+        `claim(path)` accepts them. `complete` is False if events were lost.
+        """
+        self._watcher._close_session(self)
+        self.closed = True
+        files = dict(self._files)
+        claimed = [path for path in self._shared if claim is not None and claim(path)]
+        files.update(dict.fromkeys(claimed))
+        log.info(f"[WATCH] Job {self.job_id}: {len(files)} new files "
+                 f"({len(claimed)} of {len(self._shared)} shared claimed)")
+        return list(files)
+
+
+class FileWatcher:
+    """Attributes audio files written under music_dir to the jobs running at the time.
+
+    spotdl writes into the top of the music directory, so only that directory
+    and the directories created while watching are watched; nothing is scanned.
+    Uses inotify where available, otherwise relists the watched directories
+    every poll_interval seconds. The backend only runs while a session is open.
+    """
+
+    def __init__(self, music_dir, backend='auto', poll_interval=1.0):
+        self.music_dir = music_dir
+        self.backend_name = backend
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._sessions = []
+        self._backend = None
+
+    def start_session(self, job_id):
+        session = WatchSession(self, job_id)
+        with self._lock:
+            if self._backend is None:
+                try:
+                    self._backend = self._open_backend()
+                except OSError as e:
+                    log.warning(f"[WATCH] Cannot watch {self.music_dir}: {e}")
+                    session.complete = False
+                    return session
+                threading.Thread(target=self._run, args=(self._backend,), daemon=True).start()
+            elif not self._sessions:
+                # The backend outlives the last session by up to a second; what it saw
+                # meanwhile belongs to no job
+                try:
+                    self._backend.poll()
+                except OSError as e:
+                    log.error(f"[WATCH] Error reading events: {e}")
+            self._sessions.append(session)
+        return session
+
+    def _open_backend(self):
+        if self.backend_name in ('auto', 'inotify'):
+            try:
+                return _InotifyBackend(self.music_dir)
+            except (OSError, AttributeError) as e:
+                if self.backend_name == 'inotify':
+                    raise OSError(f"inotify unavailable: {e}")
+                log.warning(f"[WATCH] inotify unavailable ({e}), polling every {self.poll_interval}s")
+        return _PollingBackend(self.music_dir, self.poll_interval)
+
+    def _run(self, backend):
+        while True:
+            backend.wait(1.0)
+            with self._lock:
+                if not self._sessions:
+                    backend.close()
+                    self._backend = None
+                    return
+                try:
+                    self._dispatch(*backend.poll())
+                except OSError as e:
+                    log.error(f"[WATCH] Error reading events: {e}")
+                    self._dispatch([], True)
+
+    def _dispatch(self, paths, lost):
+        if lost:
+            log.warning("[WATCH] Event queue overflowed, file lists are incomplete")
+            for session in self._sessions:
+                session.complete = False
+        for path in paths:
+            if len(self._sessions) == 1:
+                self._sessions[0]._files[path] = None
+            else:
+                for session in self._sessions:
+                    session._shared[path] = None
+
+    def _close_session(self, session):
+        with self._lock:
+            if session not in self._sessions:
+                return
+            # Pick up events for files finished just before the job ended
+            try:
+                self._dispatch(*self._backend.poll())
+            except OSError as e:
+                log.error(f"[WATCH] Error reading events: {e}")
+                session.complete = False
+            self._sessions.remove(session)
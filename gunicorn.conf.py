@@ -0,0 +1,16 @@
+# gunicorn settings for the container: `gunicorn -c gunicorn.conf.py "app:create_app()"`
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+# Jobs, the scheduler and the /events bus live in the process, so there is exactly
+# one worker; its threads serve requests, and each open /events stream holds one.
+# The app caps open streams (EVENTS_MAX_STREAMS, default 16) and closes each after
+# EVENTS_STREAM_SECONDS, so at least WEB_THREADS - EVENTS_MAX_STREAMS threads are
+# always left for /download, /status and /list
+workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", "32"))
+# gthread only restarts a worker whose main loop stops; long /events streams are fine
+timeout = 60
+graceful_timeout = 30
+accesslog = "-" if os.environ.get("ACCESS_LOG") else None
@@ -0,0 +1,164 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlite_db import open_db
+
+log = logging.getLogger(__name__)
+
+# Jobs in these states were cut short if found at startup
+ACTIVE_STATUSES = ('queued', 'downloading', 'waiting_scan', 'creating_playlist')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    data TEXT NOT NULL DEFAULT '{}',
+    log TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+CREATE INDEX IF NOT EXISTS jobs_updated ON jobs(updated);
+CREATE TABLE IF NOT EXISTS tracks (
+    job_id INTEGER NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    artist TEXT NOT NULL,
+    title TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+
+class JobStore:
+    """SQLite (WAL) store of download jobs and their per-track results.
+
+    Job IDs come from the database, so they keep increasing across restarts.
+    Fields other than url/status/priority are kept as a JSON document.
+    """
+
+    def __init__(self, db_path, retention_days=30, max_finished=1000):
+        self.retention_days = retention_days
+        self.max_finished = max_finished
+        self._lock = threading.Lock()
+        self._conn = open_db(db_path, SCHEMA, foreign_keys=True)
+
+    def create(self, url, priority=0, status='queued'):
+        """Insert a new job, returns its ID as a string"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (url, status, priority, created, updated) VALUES (?, ?, ?, ?, ?)",
+                (url, status, priority, now, now))
+            self._conn.commit()
+            return str(cursor.lastrowid)
+
+    def update(self, job_id, fields):
+        """Merge fields into a job; status is also kept in its own indexed column"""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (int(job_id),)).fetchone()
+            if row is None:
+                return
+            data = json.loads(row[0])
+            data.update({k: v for k, v in fields.items() if k not in ('url', 'status', 'priority', 'log')})
+            assignments = ["data = ?", "updated = ?"]
+            values = [json.dumps(data), time.time()]
+            for column in ('status', 'priority', 'log'):
+                if column in fields:
+                    assignments.append(f"{column} = ?")
+                    values.append(fields[column])
+            values.append(int(job_id))
+            self._conn.execute(f"UPDATE jobs SET {', '.join(assignments)} WHERE id = ?", values)
+            self._conn.commit()
+
+    def save_tracks(self, job_id, tracks):
+        """Replace the track results of a job with a list of (artist, title, state)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM tracks WHERE job_id = ?", (int(job_id),))
+            self._conn.executemany(
+                "INSERT INTO tracks (job_id, position, artist, title, state) VALUES (?, ?, ?, ?, ?)",
+                ((int(job_id), position, artist, title, state)
+                 for position, (artist, title, state) in enumerate(tracks)))
+            self._conn.commit()
+
+    def tracks(self, job_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT artist, title, state FROM tracks WHERE job_id = ? ORDER BY position",
+                (int(job_id),)).fetchall()
+        return [{'artist': artist, 'title': title, 'state': state} for artist, title, state in rows]
+
+    def get(self, job_id):
+        """Return a job record, or None"""
+        try:
+            job_id = int(job_id)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, url, status, priority, created, data, log FROM jobs WHERE id = ?",
+                (job_id,)).fetchone()
+        return _record(row) if row else None
+
+    def list(self, offset=0, limit=50, status=None, query=None):
+        """Return (records newest first, total matching) filtered by status and URL substring"""
+        where, values = [], []
+        if status:
+            statuses = status if isinstance(status, (list, tuple)) else [status]
+            where.append(f"status IN ({', '.join('?' * len(statuses))})")
+            values.extend(statuses)
+        if query:
+            where.append("url LIKE ?")
+            values.append(f"%{query}%")
+        clause = f"WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM jobs {clause}", values).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT id, url, status, priority, created, data, log FROM jobs {clause} "
+                f"ORDER BY id DESC LIMIT ? OFFSET ?", values + [limit, offset]).fetchall()
+        return [_record(row) for row in rows], total
+
+    def interrupted(self):
+        """Jobs that were queued or running when the process stopped, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, url, status, priority, created, data, log FROM jobs "
+                f"WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))}) ORDER BY id",
+                ACTIVE_STATUSES).fetchall()
+        return [_record(row) for row in rows]
+
+    def purge(self):
+        """Apply the retention policy to finished jobs, returns how many were deleted"""
+        cutoff = time.time() - self.retention_days * 86400
+        active = ', '.join('?' * len(ACTIVE_STATUSES))
+        with self._lock:
+            deleted = self._conn.execute(
+                f"DELETE FROM jobs WHERE status NOT IN ({active}) AND updated < ?",
+                ACTIVE_STATUSES + (cutoff,)).rowcount
+            deleted += self._conn.execute(
+                f"DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE status NOT IN ({active}) "
+                f"ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                ACTIVE_STATUSES + (self.max_finished,)).rowcount
+            self._conn.commit()
+        if deleted:
+            log.info(f"[JOBS] Retention removed {deleted} finished jobs")
+        return deleted
+
+
+def _record(row):
+    job_id, url, status, priority, created, data, log = row
+    record = json.loads(data)
+    record.update({
+        'id': str(job_id),
+        'url': url,
+        'status': status,
+        'priority': priority,
+        'created': datetime.fromtimestamp(created).isoformat(),
+        'log': log,
+    })
+    return record
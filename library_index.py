@@ -0,0 +1,280 @@
+import logging
+import os
+import threading
+import time
+
+from sqlite_db import open_db
+
+log = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.flac', '.wav', '.ogg')
+
+# Directories modified this recently are rescanned on the next refresh, because
+# a file created in the same mtime tick would not bump the directory mtime again
+RACY_WINDOW_NS = 2_000_000_000
+# Known files re-stat'ed per refresh, in path order, to catch files rewritten in place
+RECHECK_FILES = 2000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    inode INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE INDEX IF NOT EXISTS files_mtime ON files(mtime);
+CREATE INDEX IF NOT EXISTS files_inode ON files(inode, mtime);
+CREATE TABLE IF NOT EXISTS tags (
+    inode INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    artist TEXT,
+    title TEXT,
+    album TEXT,
+    isrc TEXT,
+    duration REAL,
+    PRIMARY KEY (inode, mtime)
+);
+"""
+
+
+class LibraryIndex:
+    """SQLite index of the audio files under a music directory.
+
+    Paths are stored relative to the music directory. A refresh only lists
+    directories whose mtime changed since the previous refresh; unchanged
+    directories cost a single stat() each. A file rewritten in place does not
+    touch its directory mtime and is picked up the next time that directory is
+    listed, or when its turn comes among the `recheck_files` known files that
+    every refresh re-stats.
+
+    Embedded tags are cached by (inode, mtime), so a renamed file keeps its
+    tags and only new or rewritten files are parsed again.
+    """
+
+    def __init__(self, music_dir, db_path, recheck_files=RECHECK_FILES):
+        self.music_dir = music_dir
+        self.db_path = db_path
+        self.recheck_files = recheck_files
+        # Path after which the next refresh continues re-stat'ing known files
+        self._recheck_after = ''
+        self._lock = threading.Lock()
+        # Bumped whenever a refresh changes anything, so callers can cache derived data
+        self.version = 0
+        self._conn = open_db(db_path, SCHEMA)
+        # Indexes created before first_seen was dropped
+        if any(row[1] == 'first_seen' for row in self._conn.execute("PRAGMA table_info(files)")):
+            self._conn.execute("DROP INDEX IF EXISTS files_first_seen")
+            self._conn.execute("ALTER TABLE files DROP COLUMN first_seen")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def refresh(self, recheck_all=False):
+        """Bring the index up to date, returns (added, modified, removed) relative paths.
+
+        recheck_all re-stats every known file instead of the next batch of them.
+        """
+        with self._lock:
+            started = time.time()
+            added, modified, removed = [], [], []
+            known_dirs = dict(self._conn.execute("SELECT path, mtime_ns FROM dirs"))
+            seen_dirs = set()
+            rescanned = 0
+            stack = ['']
+
+            while stack:
+                rel_dir = stack.pop()
+                abs_dir = os.path.join(self.music_dir, rel_dir) if rel_dir else self.music_dir
+                try:
+                    dir_mtime_ns = os.stat(abs_dir).st_mtime_ns
+                except OSError:
+                    continue
+                seen_dirs.add(rel_dir)
+
+                if known_dirs.get(rel_dir) == dir_mtime_ns:
+                    # Listing unchanged, only its subdirectories need checking
+                    stack.extend(row[0] for row in self._conn.execute(
+                        "SELECT path FROM dirs WHERE parent = ?", (rel_dir,)))
+                    continue
+
+                rescanned += 1
+                subdirs, files = self._scan_dir(abs_dir, rel_dir)
+                self._apply_dir(rel_dir, files, added, modified, removed)
+
+                # Don't trust an mtime that could still change within the same tick
+                if time.time_ns() - dir_mtime_ns < RACY_WINDOW_NS:
+                    dir_mtime_ns = -1
+                parent = os.path.dirname(rel_dir) if rel_dir else None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)",
+                    (rel_dir, parent, dir_mtime_ns))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO dirs (path, parent, mtime_ns) VALUES (?, ?, -1)",
+                    ((subdir, rel_dir) for subdir in subdirs))
+                stack.extend(subdirs)
+
+            # Directories that disappeared take their files with them
+            for rel_dir in set(known_dirs) - seen_dirs:
+                gone = [row[0] for row in self._conn.execute(
+                    "SELECT path FROM files WHERE dir = ?", (rel_dir,))]
+                removed.extend(gone)
+                self._conn.execute("DELETE FROM files WHERE dir = ?", (rel_dir,))
+                self._conn.execute("DELETE FROM dirs WHERE path = ?", (rel_dir,))
+            rechecked = self._recheck(None if recheck_all else self.recheck_files, added, modified)
+            self._conn.commit()
+            if added or modified or removed:
+                self.version += 1
+
+            log.info(f"[INDEX] Refreshed in {time.time() - started:.2f}s: {len(seen_dirs)} dirs checked, "
+                     f"{rescanned} rescanned, {rechecked} files rechecked, +{len(added)} ~{len(modified)} -{len(removed)} files")
+            return added, modified, removed
+
+    def _scan_dir(self, abs_dir, rel_dir):
+        subdirs = []
+        files = {}
+        try:
+            with os.scandir(abs_dir) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(os.path.join(rel_dir, entry.name) if rel_dir else entry.name)
+                        elif entry.name.lower().endswith(AUDIO_EXTENSIONS) and entry.is_file():
+                            st = entry.stat()
+                            rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                            files[rel_path] = (entry.name, st.st_size, st.st_mtime, st.st_ino)
+                    except OSError:
+                        pass
+        except OSError as e:
+            log.error(f"[INDEX ERROR] Cannot list {abs_dir}: {e}")
+        return subdirs, files
+
+    def _recheck(self, limit, added, modified):
+        """Re-stat known files (the next `limit` of them, or all), returns how many"""
+        if limit is None:
+            rows = self._conn.execute("SELECT path, size, mtime, inode FROM files").fetchall()
+        else:
+            rows = self._conn.execute(
+                "SELECT path, size, mtime, inode FROM files WHERE path > ? ORDER BY path LIMIT ?",
+                (self._recheck_after, limit)).fetchall()
+            # Start over from the first path once the end is reached
+            self._recheck_after = rows[-1][0] if len(rows) == limit else ''
+        just_scanned = set(added) | set(modified)
+        for rel_path, size, mtime, inode in rows:
+            if rel_path in just_scanned:
+                continue
+            try:
+                st = os.stat(os.path.join(self.music_dir, rel_path))
+            except OSError:
+                # Deleting a file changes its directory, whose listing catches it
+                continue
+            if (st.st_size, st.st_mtime, st.st_ino) != (size, mtime, inode):
+                modified.append(rel_path)
+                self._conn.execute(
+                    "UPDATE files SET size = ?, mtime = ?, inode = ? WHERE path = ?",
+                    (st.st_size, st.st_mtime, st.st_ino, rel_path))
+        return len(rows)
+
+    def _apply_dir(self, rel_dir, files, added, modified, removed):
+        indexed = {
+            row[0]: row[1:] for row in self._conn.execute(
+                "SELECT path, size, mtime, inode FROM files WHERE dir = ?", (rel_dir,))
+        }
+        for rel_path, (name, size, mtime, inode) in files.items():
+            previous = indexed.pop(rel_path, None)
+            if previous is None:
+                added.append(rel_path)
+                self._conn.execute(
+                    "INSERT INTO files (path, dir, name, size, mtime, inode) VALUES (?, ?, ?, ?, ?, ?)",
+                    (rel_path, rel_dir, name, size, mtime, inode))
+            elif previous != (size, mtime, inode):
+                modified.append(rel_path)
+                self._conn.execute(
+                    "UPDATE files SET size = ?, mtime = ?, inode = ? WHERE path = ?",
+                    (size, mtime, inode, rel_path))
+        if indexed:
+            removed.extend(indexed)
+            self._conn.executemany("DELETE FROM files WHERE path = ?", ((p,) for p in indexed))
+
+    def refresh_tags(self, read_many):
+        """Parse the tags of files not cached yet with read_many(absolute paths), returns how many"""
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT f.path, f.inode, f.mtime FROM files f "
+                "LEFT JOIN tags t ON t.inode = f.inode AND t.mtime = f.mtime "
+                "WHERE t.inode IS NULL").fetchall()
+        if not pending:
+            return 0
+
+        # Parsing happens outside the lock; a file that changed meanwhile is re-read next time
+        started = time.time()
+        results = read_many([os.path.join(self.music_dir, path) for path, inode, mtime in pending])
+        with self._lock:
+            # Unreadable files get an empty row too, so they aren't parsed on every refresh
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tags (inode, mtime, artist, title, album, isrc, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((inode, mtime) + (tuple(tags) if tags else (None,) * 5)
+                 for (path, inode, mtime), tags in zip(pending, results)))
+            # Rows of files that were deleted or rewritten since
+            self._conn.execute(
+                "DELETE FROM tags WHERE NOT EXISTS "
+                "(SELECT 1 FROM files f WHERE f.inode = tags.inode AND f.mtime = tags.mtime)")
+            self._conn.commit()
+            self.version += 1
+        log.info(f"[INDEX] Read tags of {len(pending)} files in {time.time() - started:.2f}s")
+        return len(pending)
+
+    def tagged_files(self):
+        """Return (relative path, filename, artist, title, album, isrc, duration) for every file.
+
+        Tag fields are None for files whose tags weren't read or don't have them.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT f.path, f.name, t.artist, t.title, t.album, t.isrc, t.duration FROM files f "
+                "LEFT JOIN tags t ON t.inode = f.inode AND t.mtime = f.mtime").fetchall()
+
+    def tags_of(self, paths):
+        """Return {relative path: (artist, title, album, isrc, duration)} for those of paths with tags read"""
+        paths = list(dict.fromkeys(paths))
+        found = {}
+        with self._lock:
+            # Stays under SQLite's limit on bound parameters
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                found.update((row[0], row[1:]) for row in self._conn.execute(
+                    "SELECT f.path, t.artist, t.title, t.album, t.isrc, t.duration FROM files f "
+                    "JOIN tags t ON t.inode = f.inode AND t.mtime = f.mtime "
+                    f"WHERE f.path IN ({', '.join('?' * len(chunk))})", chunk))
+        return found
+
+    def all_files(self):
+        """Return (relative path, filename) for every indexed audio file"""
+        with self._lock:
+            return self._conn.execute("SELECT path, name FROM files").fetchall()
+
+    def modified_since(self, since_time):
+        """Return files whose mtime is after since_time, most recent first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, name, mtime FROM files WHERE mtime > ? ORDER BY mtime DESC",
+                (since_time,)).fetchall()
+        return [
+            {'path': os.path.join(self.music_dir, path), 'mtime': mtime, 'filename': name}
+            for path, name, mtime in rows
+        ]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
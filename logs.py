@@ -0,0 +1,155 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# Job whose code is running on this thread, stamped on every record as job_id
+_current_job = contextvars.ContextVar('job_id', default=None)
+
+
+@contextlib.contextmanager
+def job_context(job_id):
+    """Tag every record logged inside the block with job_id"""
+    token = _current_job.set(str(job_id))
+    try:
+        yield
+    finally:
+        _current_job.reset(token)
+
+
+class JobFilter(logging.Filter):
+    """Copies the current job ID onto records before they leave the logging thread"""
+
+    def filter(self, record):
+        record.job_id = _current_job.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Rate-limits records below `max_level` per call site with a token bucket.
+
+    Each message template (logger, format string) may log `burst` records at
+    once and `rate` per second after that. The next record let through from a
+    throttled site carries the number of records dropped in between as
+    `suppressed`.
+    """
+
+    def __init__(self, rate=5.0, burst=20, max_level=logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_level = max_level
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, dropped = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if dropped:
+            record.suppressed = dropped
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    """`time LEVEL [job N] message` lines for docker logs"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        job_id = getattr(record, 'job_id', None)
+        if job_id:
+            prefix_end = line.index(record.levelname) + len(record.levelname)
+            line = f"{line[:prefix_end]} [job {job_id}]{line[prefix_end:]}"
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            line += f" ({suppressed} similar messages suppressed)"
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log files and collectors"""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'job_id': getattr(record, 'job_id', None),
+            'message': record.getMessage(),
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+_listener = None
+
+
+def configure(level='INFO', log_file=None, file_level='DEBUG', max_bytes=10 * 1024 * 1024, backups=3,
+              log_format='text', sample_rate=5.0, sample_burst=20):
+    """Route all logging through a queue drained by a background thread.
+
+    Callers only pay for putting the record on the queue; formatting, stdout
+    and the rotating JSON log file are handled by the listener thread. DEBUG
+    records are sampled per call site. Calling it again replaces the setup.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setLevel(level)
+    console.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+    handlers = [console]
+    if log_file:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        file_handler.setLevel(file_level)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(JobFilter())
+    queue_handler.addFilter(SamplingFilter(sample_rate, sample_burst))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    # Records nobody will write are dropped before any formatting
+    root.setLevel(min(handler.level for handler in handlers))
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown():
+    """Flush the queue; registered to run at exit"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,125 @@
+import difflib
+import os
+
+from textnorm import normalize, artist_keys
+
+# Title words this short ("a", "of") carry no signal, as in the original matcher
+MIN_TITLE_WORD = 3
+# Share of the title words a fuzzy candidate must contain
+MIN_TITLE_COVERAGE = 0.5
+# Fuzzy scores stay below 1.1, so an exact filename match always ranks first
+EXACT_SCORE = 2.0
+# Artist and title tags equal after normalization, even if the file was renamed
+TAG_SCORE = 2.5
+# Same ISRC: the same recording, whatever the names say
+ISRC_SCORE = 3.0
+
+
+class LibraryMatcher:
+    """Token inverted index over normalized filenames and tags for artist/title lookups.
+
+    Built once from (relative path, filename) pairs, optionally followed by the
+    file's (artist, title, album, isrc, duration) tags. Lookups try the ISRC,
+    then exact tags, then the exact filename, and only then score the files
+    that contain the rarest token of the artist, instead of scanning the whole
+    library per song.
+    """
+
+    def __init__(self, entries):
+        self.paths = []
+        self.names = []
+        self._stems = []
+        self._tokens = []
+        self._exact = {}
+        self._postings = {}
+        self._isrc = {}
+        self._tag_titles = {}
+        for entry in entries:
+            self._add(*entry)
+
+    def _add(self, rel_path, filename, artist=None, title=None, album=None, isrc=None, duration=None):
+        doc = len(self.paths)
+        stem = normalize(os.path.splitext(filename)[0])
+        tokens = set(stem.split())
+        if title:
+            tag_title = normalize(title)
+            tokens.update(tag_title.split())
+            if artist:
+                tokens.update(normalize(artist).split())
+                self._tag_titles.setdefault(tag_title, []).append((doc, frozenset(artist_keys(artist))))
+        if isrc:
+            self._isrc.setdefault(isrc.strip().upper(), []).append(doc)
+        tokens = frozenset(tokens)
+        self.paths.append(rel_path)
+        self.names.append(filename)
+        self._stems.append(stem)
+        self._tokens.append(tokens)
+        self._exact.setdefault(stem, []).append(doc)
+        for token in tokens:
+            self._postings.setdefault(token, []).append(doc)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def match(self, artist, title, used=None, isrc=None):
+        """Return (doc, score) of the best file for artist/title (or ISRC), or (None, 0)"""
+        used = used if used is not None else set()
+
+        if isrc:
+            for doc in self._isrc.get(isrc.strip().upper(), ()):
+                if doc not in used:
+                    return doc, ISRC_SCORE
+
+        # Title tag equal and at least one credited artist in common
+        wanted_artists = set(artist_keys(artist))
+        for doc, tag_artists in self._tag_titles.get(normalize(title), ()):
+            if doc not in used and wanted_artists & tag_artists:
+                return doc, TAG_SCORE
+
+        # Pattern 1: "Artist - Title.ext", compared after normalization
+        for doc in self._exact.get(normalize(f"{artist} - {title}"), ()):
+            if doc not in used:
+                return doc, EXACT_SCORE
+
+        # Pattern 2: every artist token plus most of the title words
+        artist_tokens = set(normalize(artist).split())
+        title_tokens = {w for w in normalize(title).split() if len(w) >= MIN_TITLE_WORD}
+        if not artist_tokens:
+            return None, 0
+        postings = [self._postings.get(token) for token in artist_tokens]
+        if not all(postings):
+            return None, 0
+        candidates = min(postings, key=len)
+
+        wanted = f"{normalize(artist)} {normalize(title)}"
+        best_doc, best_score = None, 0
+        for doc in candidates:
+            if doc in used:
+                continue
+            tokens = self._tokens[doc]
+            if not artist_tokens <= tokens:
+                continue
+            if title_tokens:
+                coverage = len(title_tokens & tokens) / len(title_tokens)
+                if coverage < MIN_TITLE_COVERAGE:
+                    continue
+            else:
+                coverage = 1.0
+            # Coverage decides; string similarity breaks ties (e.g. "Song" vs "Song (Live)")
+            score = coverage + 0.1 * difflib.SequenceMatcher(None, wanted, self._stems[doc]).ratio()
+            if score > best_score:
+                best_doc, best_score = doc, score
+        return best_doc, best_score
+
+    def match_many(self, song_info_list):
+        """Resolve a list of (artist, title[, isrc]), each file used at most once; returns (doc, score) pairs"""
+        used = set()
+        results = []
+        for song in song_info_list:
+            artist, title = song[:2]
+            isrc = song[2] if len(song) > 2 else None
+            doc, score = self.match(artist, title, used, isrc)
+            if doc is not None:
+                used.add(doc)
+            results.append((doc, score))
+        return results
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import threading
+import time
+
+from subsonic_client import AsyncSubsonicClient
+from textnorm import normalize, artist_keys, credit_overlaps
+
+log = logging.getLogger(__name__)
+
+# search3 page size when building the whole catalog
+PAGE_SIZE = 500
+# Deletions are only noticed by a full rebuild, do one at least this often
+FULL_REBUILD_INTERVAL = 24 * 3600
+
+
+class NavidromeCatalog:
+    """In-memory copy of the Navidrome song list indexed by normalized artist and title.
+
+    The catalog is built with paged search3 calls on first use. After a scan it
+    is marked stale and the next lookup pulls only albums that Navidrome
+    reports as newly added.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._async_client = AsyncSubsonicClient(client)
+        self._lock = threading.Lock()
+        self._by_artist_title = {}
+        self._by_title = {}
+        self._album_song_counts = {}
+        self._song_count = 0
+        self._loaded = False
+        self._stale = False
+        self._built_at = 0
+        self._last_modified = 0
+
+    def mark_stale(self):
+        """Called after a Navidrome scan so the next lookup fetches new albums"""
+        self._stale = True
+
+    def ensure_fresh(self):
+        if not self._loaded or time.time() - self._built_at > FULL_REBUILD_INTERVAL:
+            self.refresh(full=True)
+        elif self._stale:
+            self.refresh()
+
+    def refresh(self, full=False):
+        """Rebuild the whole catalog, or only add albums added since the last refresh"""
+        with self._lock:
+            if full or not self._loaded:
+                self._build()
+            else:
+                self._update()
+            self._stale = False
+
+    def _build(self):
+        started = time.time()
+        by_artist_title, by_title, album_counts = {}, {}, {}
+        last_modified = self._fetch_last_modified()
+        count = 0
+        offset = 0
+        while True:
+            songs = self.client.search3(song_count=PAGE_SIZE, song_offset=offset).get('song', [])
+            for song in songs:
+                self._add_song(song, by_artist_title, by_title)
+                album_id = song.get('albumId')
+                if album_id:
+                    album_counts[album_id] = album_counts.get(album_id, 0) + 1
+            count += len(songs)
+            if len(songs) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+
+        self._by_artist_title = by_artist_title
+        self._by_title = by_title
+        self._album_song_counts = album_counts
+        self._song_count = count
+        self._last_modified = last_modified
+        self._loaded = True
+        self._built_at = time.time()
+        log.info(f"[CATALOG] Built catalog: {count} songs, {len(album_counts)} albums "
+                 f"in {time.time() - started:.2f}s")
+
+    def _update(self):
+        started = time.time()
+        indexes = self.client.get_indexes(if_modified_since=self._last_modified)
+        if indexes.get('lastModified'):
+            last_modified = int(indexes['lastModified'])
+            if last_modified <= self._last_modified:
+                log.info("[CATALOG] Library unchanged since last refresh")
+                return
+        else:
+            last_modified = self._last_modified
+
+        # Walk the newest albums until a whole page is already known
+        added = 0
+        offset = 0
+        while True:
+            albums = self.client.get_album_list2('newest', size=PAGE_SIZE, offset=offset)
+            changed = [
+                a['id'] for a in albums
+                if self._album_song_counts.get(a['id']) != int(a.get('songCount') or 0)
+            ]
+            # Fetch the changed albums concurrently over the connection pool
+            fetched = asyncio.run(self._async_client.gather([('getAlbum', {'id': a}) for a in changed]))
+            for album_id, result in zip(changed, fetched):
+                songs = result.get('album', {}).get('song', [])
+                for song in songs:
+                    if self._add_song(song, self._by_artist_title, self._by_title):
+                        added += 1
+                self._album_song_counts[album_id] = len(songs)
+            if not changed or len(albums) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+
+        self._song_count += added
+        self._last_modified = last_modified
+        log.info(f"[CATALOG] Incremental refresh: +{added} songs in {time.time() - started:.2f}s")
+
+    def _fetch_last_modified(self):
+        try:
+            return int(self.client.get_indexes().get('lastModified', 0))
+        except Exception as e:
+            log.warning(f"[CATALOG] Could not read lastModified: {e}")
+            return 0
+
+    @staticmethod
+    def _add_song(song, by_artist_title, by_title):
+        """Index one song entry, returns True if it was not indexed before"""
+        song_id = song.get('id')
+        title_key = normalize(song.get('title', ''))
+        if not song_id or not title_key:
+            return False
+        entries = by_title.setdefault(title_key, [])
+        if any(entry[1] == song_id for entry in entries):
+            return False
+        credits = artist_keys(song.get('artist', '')) + artist_keys(song.get('albumArtist', ''))
+        for key in credits:
+            by_artist_title.setdefault((key, title_key), song_id)
+        entries.append((credits, song_id))
+        return True
+
+    def lookup(self, artist, title):
+        """Return the Navidrome song ID for artist/title, or None"""
+        self.ensure_fresh()
+        return self._lookup(artist, title)
+
+    def _lookup(self, artist, title):
+        title_key = normalize(title)
+        if not title_key:
+            return None
+        wanted = artist_keys(artist)
+        for key in wanted:
+            song_id = self._by_artist_title.get((key, title_key))
+            if song_id:
+                return song_id
+        # Same title, artist credited differently (e.g. "A, B" vs "A feat. B")
+        for credits, song_id in self._by_title.get(title_key, ()):
+            for key in wanted:
+                if any(credit_overlaps(key, credit) for credit in credits):
+                    return song_id
+        return None
+
+    def resolve_many(self, song_info_list):
+        """Resolve a list of (artist, title) tuples in one pass, returns a list of IDs or None"""
+        self.ensure_fresh()
+        return [self._lookup(artist, title) for artist, title in song_info_list]
+
+    def __len__(self):
+        return self._song_count
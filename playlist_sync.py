@@ -0,0 +1,108 @@
+import logging
+import threading
+
+from subsonic_client import SubsonicError
+
+log = logging.getLogger(__name__)
+
+# songIdToAdd / songIndexToRemove values sent per request
+BATCH_SIZE = 200
+# Subsonic error code for a missing playlist
+NOT_FOUND = 70
+
+
+def plan_changes(current, desired):
+    """Return (indexes to remove from current, song IDs to append) that turn current into desired.
+
+    updatePlaylist can only remove by index and append at the end, so the songs
+    kept must be a prefix of `desired` appearing in order in `current`; the
+    longest such prefix is found greedily, and everything after it is
+    re-added. Appending songs or removing any of them costs only the changed
+    songs, but a song inserted at the front or in the middle means removing
+    and re-adding the whole tail after it. No plan does better through this
+    API (an LCS would keep songs in the wrong place), so for a reordered
+    playlist the update sends about as many IDs as creating it again.
+    """
+    kept = 0
+    remove = []
+    for index, song_id in enumerate(current):
+        if kept < len(desired) and desired[kept] == song_id:
+            kept += 1
+        else:
+            remove.append(index)
+    return remove, list(desired[kept:])
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class PlaylistSync:
+    """Creates and updates Navidrome playlists directly through the Subsonic API.
+
+    A playlist is identified by its name. Creating it sends the song IDs with
+    createPlaylist; later syncs diff against the current entries and send only
+    the changes through batched updatePlaylist calls.
+    """
+
+    def __init__(self, client, batch_size=BATCH_SIZE):
+        self.client = client
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._ids = {}
+
+    def _find(self, name):
+        """Current playlist (with entries) called name, or None"""
+        playlist_id = self._ids.get(name)
+        if playlist_id is not None:
+            try:
+                playlist = self.client.get_playlist(playlist_id)
+                if playlist.get('name') == name:
+                    return playlist
+            except SubsonicError as e:
+                if e.code != NOT_FOUND:
+                    raise
+            self._ids.pop(name, None)
+        for playlist in self.client.get_playlists():
+            if playlist.get('name') == name:
+                self._ids[name] = playlist['id']
+                return self.client.get_playlist(playlist['id'])
+        return None
+
+    def sync(self, name, song_ids, append=False):
+        """Make playlist `name` list song_ids in order, returns {'created', 'added', 'removed'}.
+
+        With append=True songs already in the playlist stay and only missing
+        ones are added at the end.
+        """
+        song_ids = list(song_ids)
+        with self._lock:
+            playlist = self._find(name)
+            if playlist is None:
+                first = song_ids[:self.batch_size]
+                created = self.client.create_playlist(name, first)
+                playlist_id = created.get('id')
+                if playlist_id is None:
+                    # Servers before API 1.14 return an empty body
+                    playlist_id = self._find(name)['id']
+                self._ids[name] = playlist_id
+                for batch in _batches(song_ids[len(first):], self.batch_size):
+                    self.client.update_playlist(playlist_id, song_ids_to_add=batch)
+                log.info(f"[PLAYLIST SYNC] Created '{name}' with {len(song_ids)} songs")
+                return {'created': True, 'added': len(song_ids), 'removed': 0}
+
+            current = [entry['id'] for entry in playlist.get('entry', [])]
+            if append:
+                listed = set(current)
+                song_ids = current + [song_id for song_id in song_ids if song_id not in listed]
+            remove, add = plan_changes(current, song_ids)
+
+            # Indexes refer to the playlist before each call, so remove from the end backwards
+            for batch in _batches(sorted(remove, reverse=True), self.batch_size):
+                self.client.update_playlist(playlist['id'], song_indexes_to_remove=batch)
+            for batch in _batches(add, self.batch_size):
+                self.client.update_playlist(playlist['id'], song_ids_to_add=batch)
+            log.info(f"[PLAYLIST SYNC] Updated '{name}': +{len(add)} -{len(remove)} "
+                     f"({len(song_ids)} songs)")
+            return {'created': False, 'added': len(add), 'removed': len(remove)}
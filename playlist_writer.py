@@ -0,0 +1,94 @@
+import collections
+import hashlib
+import os
+import re
+import tempfile
+
+# Characters that can't appear in a playlist filename on the usual filesystems
+UNSAFE_NAME_PATTERN = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+PlaylistEntry = collections.namedtuple('PlaylistEntry', 'path duration title')
+
+
+def playlist_filename(name):
+    return UNSAFE_NAME_PATTERN.sub('_', name).strip(' .') or 'playlist'
+
+
+def as_entry(item):
+    """PlaylistEntry for an entry or a bare relative path (unknown duration)"""
+    if isinstance(item, PlaylistEntry):
+        return item
+    return PlaylistEntry(item, None, os.path.splitext(os.path.basename(item))[0])
+
+
+def read_entries(m3u_path):
+    """Yield (path, extinf line or None) for each entry of an existing M3U file"""
+    extinf = None
+    with open(m3u_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.startswith('#EXTINF:'):
+                extinf = line
+            elif line and not line.startswith('#'):
+                yield line, extinf
+                extinf = None
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_m3u(m3u_path, name, entries, append=False):
+    """Write an extended M3U atomically, returns (changed, number of entries).
+
+    Entries are streamed to a temporary file next to the playlist, which then
+    replaces it, so Navidrome never sees a half-written file. Paths are
+    relative to the playlist's directory. With append=True the existing
+    entries are kept in order and only paths not listed yet are added; nothing
+    is written when there are none. A rewrite that produces the same bytes
+    leaves the existing file alone.
+    """
+    directory = os.path.dirname(m3u_path)
+    existing = os.path.exists(m3u_path)
+    kept = []
+    if append and existing:
+        kept = list(read_entries(m3u_path))
+        listed = {path for path, extinf in kept}
+        entries = [entry for entry in map(as_entry, entries) if entry.path not in listed]
+        if not entries:
+            return False, len(kept)
+
+    digest = hashlib.sha1()
+    count = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.m3u.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            def emit(text):
+                f.write(text)
+                digest.update(text.encode('utf-8'))
+
+            emit(f"#EXTM3U\n#PLAYLIST:{name}\n")
+            for path, extinf in kept:
+                emit(f"{extinf}\n{path}\n" if extinf else f"{path}\n")
+                count += 1
+            for entry in map(as_entry, entries):
+                duration = int(round(entry.duration)) if entry.duration else -1
+                emit(f"#EXTINF:{duration},{entry.title}\n{entry.path}\n")
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+
+        if existing and _file_digest(m3u_path) == digest.hexdigest():
+            os.remove(tmp_path)
+            return False, count
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, m3u_path)
+        return True, count
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
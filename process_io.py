@@ -0,0 +1,136 @@
+import codecs
+import os
+import re
+import selectors
+import threading
+
+# Bytes read from a pipe per call
+CHUNK_SIZE = 64 * 1024
+# Longer lines are cut; spotdl never prints one, a runaway process might
+MAX_LINE = 64 * 1024
+
+# Progress bars redraw with carriage returns, which end a line as well
+LINE_BREAK = re.compile(r'[\r\n]+')
+
+
+class LineSplitter:
+    """Turns chunks of bytes into complete text lines, whatever the chunk boundaries.
+
+    Decoding is incremental, so a character split over two chunks is not
+    mangled. Only the current partial line is kept, capped at `max_line`.
+    Blank lines are dropped.
+    """
+
+    def __init__(self, encoding='utf-8', max_line=MAX_LINE):
+        self.max_line = max_line
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self._partial = ''
+
+    def feed(self, data, final=False):
+        """Return the lines completed by `data`; final=True flushes the last one"""
+        parts = LINE_BREAK.split(self._partial + self._decoder.decode(data, final))
+        self._partial = parts.pop()
+        if final:
+            parts.append(self._partial)
+            self._partial = ''
+        # The kept partial line is at most max_line, but the chunk completing it can add as much again
+        lines = [part[i:i + self.max_line] for part in parts for i in range(0, len(part), self.max_line)]
+        while len(self._partial) > self.max_line:
+            lines.append(self._partial[:self.max_line])
+            self._partial = self._partial[self.max_line:]
+        return lines
+
+
+class OutputReader:
+    """Reads the stdout/stderr pipes of many processes from one thread, without blocking.
+
+    `poll()` waits for any pipe to have data, reads at most one chunk from
+    each ready pipe and returns ('line', key, text) events, then ('eof', key,
+    None) once every pipe of a process is closed. Nothing is buffered beyond
+    one partial line per pipe, so output the caller hasn't asked for stays in
+    the OS pipe, and a process that fills it blocks until the caller catches
+    up. `wake()` makes a waiting `poll()` return early from another thread.
+    """
+
+    def __init__(self):
+        self._selector = selectors.DefaultSelector()
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self._selector.register(self._wake_read, selectors.EVENT_READ)
+        self._open = {}
+        # wake() comes from other threads; it must not write to a descriptor close() gave back
+        self._wake_lock = threading.Lock()
+        self._closed = False
+
+    def add(self, key, process):
+        """Start reading the binary stdout/stderr pipes of a Popen object under `key`"""
+        for stream in (process.stdout, process.stderr):
+            if stream is None:
+                continue
+            os.set_blocking(stream.fileno(), False)
+            self._selector.register(stream, selectors.EVENT_READ, (key, LineSplitter()))
+            self._open[key] = self._open.get(key, 0) + 1
+
+    def wake(self):
+        with self._wake_lock:
+            if self._closed:
+                return
+            try:
+                os.write(self._wake_write, b'\0')
+            except BlockingIOError:
+                # Already woken
+                pass
+
+    def poll(self, timeout=None):
+        """Events from the pipes that have data, or [] after `timeout` seconds or a wake()"""
+        events = []
+        for selector_key, _ in self._selector.select(timeout):
+            if selector_key.fileobj == self._wake_read:
+                try:
+                    while os.read(self._wake_read, 4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                continue
+            key, splitter = selector_key.data
+            try:
+                chunk = os.read(selector_key.fd, CHUNK_SIZE)
+            except BlockingIOError:
+                continue
+            except OSError:
+                chunk = b''
+            events.extend(('line', key, line) for line in splitter.feed(chunk, final=not chunk))
+            if not chunk:
+                self._selector.unregister(selector_key.fileobj)
+                selector_key.fileobj.close()
+                self._open[key] -= 1
+                if not self._open[key]:
+                    del self._open[key]
+                    events.append(('eof', key, None))
+        return events
+
+    def close(self):
+        for selector_key in list(self._selector.get_map().values()):
+            self._selector.unregister(selector_key.fileobj)
+            if selector_key.fileobj != self._wake_read:
+                selector_key.fileobj.close()
+        self._selector.close()
+        with self._wake_lock:
+            self._closed = True
+            os.close(self._wake_read)
+            os.close(self._wake_write)
+
+
+def read_lines(process):
+    """Yield the output lines of one process as they arrive, stdout and stderr together"""
+    reader = OutputReader()
+    reader.add(None, process)
+    try:
+        while True:
+            for kind, _, line in reader.poll():
+                if kind == 'eof':
+                    return
+                yield line
+    finally:
+        reader.close()
@@ -0,0 +1,113 @@
+import re
+
+# Per-track states, in the order a track normally moves through them
+DOWNLOADING, CONVERTING, DOWNLOADED, SKIPPED, FAILED = range(5)
+STATE_NAMES = ('downloading', 'converting', 'downloaded', 'skipped', 'failed')
+FINISHED_STATES = (DOWNLOADED, SKIPPED, FAILED)
+
+FOUND_PATTERN = re.compile(r'Found\s+(\d+)\s+songs?\s+in\s+(.+?)\s+\((Playlist|Album)\)')
+# spotdl 4: Downloaded "Artist - Title": https://music.youtube.com/...
+QUOTED_PATTERN = re.compile(r'(Downloaded|Skipping|Failed to download)\s+"(.+?)\s+-\s+(.+?)"')
+FAILED_PATTERN = re.compile(r'(?:No results found for song|Failed to download)[:\s]+"?(.+?)\s+-\s+(.+?)"?(?:\s+\(|$)')
+CONVERTING_PATTERN = re.compile(r'(?:Converting|Embedding metadata)[:\s]+"?(.+?)\s+-\s+(.+?)"?(?:\s+\(|$)', re.IGNORECASE)
+# Older/unquoted formats, also understood by extract_playlist_info before
+ACTION_PATTERN = re.compile(r'(Downloading|Processing|Downloaded|Saved)[:\s]+(.+?)\s+-\s+(.+?)(?:\s+\(|$)', re.IGNORECASE)
+CHECKMARK_PATTERN = re.compile(r'✓\s+(.+?)\s+-\s+(.+?)(?:\s+\(|$)')
+SKIPPING_PATTERN = re.compile(r'Skipping\s+(.+?)\s+-\s+(.+?)(?:\s+\(|$)')
+
+ACTION_STATES = {
+    'downloading': DOWNLOADING,
+    'processing': DOWNLOADING,
+    'downloaded': DOWNLOADED,
+    'saved': DOWNLOADED,
+    'skipping': SKIPPED,
+    'failed to download': FAILED,
+}
+
+
+class SpotdlProgress:
+    """Incremental parser for spotdl output.
+
+    Feed it lines as they arrive. It keeps one small state code per
+    (artist, title) plus the playlist name and announced track count; raw
+    lines are only retained for failed tracks, in `errors`.
+    """
+
+    def __init__(self):
+        self.playlist_name = None
+        self.total = None
+        self.tracks = {}
+        self.errors = {}
+        self.counts = [0] * len(STATE_NAMES)
+
+    def feed(self, line):
+        """Parse one line, returns True if the progress summary changed"""
+        match = FOUND_PATTERN.search(line)
+        if match:
+            self.total = int(match.group(1))
+            self.playlist_name = match.group(2).strip()
+            return True
+
+        match = QUOTED_PATTERN.search(line)
+        if match:
+            return self._set(match.group(2), match.group(3), ACTION_STATES[match.group(1).lower()], line)
+
+        match = FAILED_PATTERN.search(line)
+        if match:
+            return self._set(match.group(1), match.group(2), FAILED, line)
+
+        match = CONVERTING_PATTERN.search(line)
+        if match:
+            return self._set(match.group(1), match.group(2), CONVERTING)
+
+        match = ACTION_PATTERN.search(line)
+        if match:
+            return self._set(match.group(2), match.group(3), ACTION_STATES[match.group(1).lower()])
+
+        match = CHECKMARK_PATTERN.search(line)
+        if match:
+            return self._set(match.group(1), match.group(2), SKIPPED)
+
+        if 'Skipping' in line and ' - ' in line:
+            match = SKIPPING_PATTERN.search(line)
+            if match:
+                return self._set(match.group(1), match.group(2), SKIPPED)
+        return False
+
+    def mark(self, artist, title, state):
+        """Record a track state that doesn't come from spotdl output, e.g. a track already owned"""
+        return self._set(artist, title, state)
+
+    def _set(self, artist, title, state, line=None):
+        key = (artist.strip().strip('"'), title.strip().strip('"'))
+        if state == FAILED and line is not None:
+            self.errors[key] = line
+        previous = self.tracks.get(key)
+        if previous == state:
+            return False
+        # A finished track doesn't go back to an in-progress state
+        if previous in FINISHED_STATES and state not in FINISHED_STATES:
+            return False
+        if previous is not None:
+            self.counts[previous] -= 1
+        self.tracks[key] = state
+        self.counts[state] += 1
+        return True
+
+    def song_info_list(self):
+        """(artist, title) of every track seen, in order, except the ones that failed"""
+        return [key for key, state in self.tracks.items() if state != FAILED]
+
+    def summary(self):
+        """Counts per state plus a completion percentage for /status.
+
+        `found` counts the tracks spotdl announced that its output hasn't
+        mentioned yet.
+        """
+        total = max(self.total or 0, len(self.tracks))
+        counts = {'found': total - len(self.tracks)}
+        counts.update(zip(STATE_NAMES, self.counts))
+        finished = sum(self.counts[state] for state in FINISHED_STATES)
+        counts['total'] = total
+        counts['percent'] = round(100.0 * finished / total, 1) if total else None
+        return counts
@@ -0,0 +1,104 @@
+import random
+import re
+import threading
+import time
+
+# Failure kinds, from most to least worth retrying later
+RATE_LIMITED, TRANSIENT, PERMANENT = 'rate_limited', 'transient', 'permanent'
+
+# spotdl/yt-dlp/spotipy wording when Spotify or YouTube throttle us
+RATE_LIMIT_PATTERN = re.compile(r'\b429\b|rate.?limit|too many requests', re.IGNORECASE)
+# Network and server hiccups that usually go away on their own
+TRANSIENT_PATTERN = re.compile(
+    r'timed? ?out|connection (?:reset|refused|aborted|error)|temporary failure|remote end closed'
+    r'|\b50[0234]\b|service unavailable|bad gateway|network is unreachable|\bssl|incomplete ?read',
+    re.IGNORECASE)
+# The track itself can't be downloaded; trying again gives the same answer
+PERMANENT_PATTERN = re.compile(
+    r'no results found|video unavailable|not available in your country|age.restricted'
+    r'|private video|copyright|has been removed',
+    re.IGNORECASE)
+# Progress lines carry track titles, which may contain any of the words above
+PROGRESS_PATTERN = re.compile(r'^\s*(?:Downloaded|Downloading|Skipping|Found|Processing|Converting|Embedding)\b')
+
+
+def classify(line):
+    """Failure kind a line of spotdl output reports, or None if it reports none"""
+    if PROGRESS_PATTERN.match(line):
+        return None
+    if RATE_LIMIT_PATTERN.search(line):
+        return RATE_LIMITED
+    if PERMANENT_PATTERN.search(line):
+        return PERMANENT
+    if TRANSIENT_PATTERN.search(line):
+        return TRANSIENT
+    return None
+
+
+def worst(kind, other):
+    """The kind that decides how to retry when a batch reports both"""
+    for candidate in (RATE_LIMITED, TRANSIENT, PERMANENT):
+        if candidate in (kind, other):
+            return candidate
+    return None
+
+
+class TokenBucket:
+    """Token bucket shared by every job: `rate` tokens per second, at most `burst` saved up.
+
+    `reserve()` always takes a token and returns how many seconds the caller
+    must wait before using it, so callers that arrive together are spaced out
+    instead of refused.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def drain(self):
+        """Spend every saved token, e.g. after a rate-limit error"""
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0)
+            self._updated = time.monotonic()
+
+
+class RetryPolicy:
+    """How often and how late failed spotdl targets are tried again.
+
+    Delays grow exponentially from `base_delay` (from `rate_limit_delay` after
+    a rate-limit error) up to `max_delay`, with jitter, and are never shorter
+    than the wait for a token from the shared bucket.
+    """
+
+    def __init__(self, bucket, max_attempts=4, base_delay=5.0, rate_limit_delay=60.0, max_delay=600.0):
+        self.bucket = bucket
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.rate_limit_delay = rate_limit_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, attempt, kind):
+        """Whether a target that failed on attempt `attempt` (0 is the first run) gets another one"""
+        return kind != PERMANENT and attempt + 1 < self.max_attempts
+
+    def delay(self, attempt, kind):
+        """Seconds to wait before attempt `attempt + 1`; reserves a token for it"""
+        if kind == RATE_LIMITED:
+            self.bucket.drain()
+        base = self.rate_limit_delay if kind == RATE_LIMITED else self.base_delay
+        backoff = min(self.max_delay, base * 2 ** attempt)
+        backoff = backoff / 2 + random.uniform(0, backoff / 2)
+        return max(backoff, self.bucket.reserve())
@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# Poll interval starts short and backs off while a scan is running
+MIN_POLL_INTERVAL = 0.25
+MAX_POLL_INTERVAL = 2.0
+# A scan with nothing to do may finish before it is ever seen running; servers
+# that don't report lastScan can't confirm such a scan, which fails after this
+IDLE_GRACE = 5.0
+
+
+class ScanCoordinator:
+    """Coalesces Navidrome scan requests from many jobs into as few scans as possible.
+
+    A request made while no scan is running starts one. Requests made while a
+    scan is running are folded into a single follow-up scan, because the files
+    they wrote may have been missed by the scan in flight. Every waiter is
+    woken as soon as the scan covering its request finishes.
+    """
+
+    def __init__(self, client, timeout=120, on_complete=None):
+        self.client = client
+        self.timeout = timeout
+        self._on_complete = on_complete
+        self._cond = threading.Condition()
+        self._generation = 0
+        self._completed = 0
+        self._results = {}
+        self._running = False
+        self._pending = False
+
+    def request_scan(self):
+        """Make sure a scan starting after this call will run, returns its generation"""
+        with self._cond:
+            if self._running:
+                self._pending = True
+                return self._generation + 1
+            self._generation += 1
+            self._running = True
+            threading.Thread(target=self._run, daemon=True).start()
+            return self._generation
+
+    def wait(self, generation, timeout=None):
+        """Block until the given scan generation finished, returns True if it completed"""
+        timeout = self.timeout * 2 if timeout is None else timeout
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._completed >= generation, timeout):
+                return False
+            return self._results.get(generation, self._results.get(self._completed, False))
+
+    def wait_current(self, timeout=None):
+        """Wait for the scan in flight, if any, without asking for another one"""
+        with self._cond:
+            generation = self._generation
+        return self.wait(generation, timeout)
+
+    def scan_and_wait(self, timeout=None):
+        return self.wait(self.request_scan(), timeout)
+
+    def is_scanning(self):
+        with self._cond:
+            return self._running
+
+    def _run(self):
+        while True:
+            with self._cond:
+                generation = self._generation
+            ok = self._scan_once()
+            if self._on_complete is not None:
+                try:
+                    self._on_complete()
+                except Exception as e:
+                    log.error(f"[SCAN] Completion callback failed: {e}")
+            with self._cond:
+                self._completed = generation
+                self._results[generation] = ok
+                # Only the latest results are ever asked for
+                for old in [g for g in self._results if g < generation - 10]:
+                    del self._results[old]
+                if self._pending:
+                    self._pending = False
+                    self._generation += 1
+                    self._cond.notify_all()
+                    continue
+                self._running = False
+                self._cond.notify_all()
+                return
+
+    def _scan_once(self):
+        started = time.time()
+        try:
+            baseline = self.client.get_scan_status()
+            status = self.client.start_scan()
+        except Exception as e:
+            log.error(f"[SCAN] Could not start scan: {e}")
+            return False
+        seen_scanning = bool(status.get('scanning'))
+        log.info(f"[SCAN] Scan started (library had {baseline.get('count', '?')} items)")
+
+        interval = MIN_POLL_INTERVAL
+        while time.time() - started < self.timeout:
+            time.sleep(interval)
+            interval = min(interval * 1.5, MAX_POLL_INTERVAL)
+            try:
+                status = self.client.get_scan_status()
+            except Exception as e:
+                log.warning(f"[SCAN] Exception while waiting: {e}")
+                continue
+            if status.get('scanning'):
+                seen_scanning = True
+                continue
+            # Not scanning: done if we saw it run or the scan left a trace
+            if (seen_scanning
+                    or status.get('lastScan') != baseline.get('lastScan')
+                    or status.get('count') != baseline.get('count')):
+                log.info(f"[SCAN] Scan completed in {time.time() - started:.1f}s "
+                         f"({status.get('count', '?')} items)")
+                return True
+            # Without lastScan, a scan that ran unseen and added nothing looks like one that never ran
+            if 'lastScan' not in status and time.time() - started > IDLE_GRACE:
+                log.warning("[SCAN] Scan was never seen running and left no trace, not counting it as complete")
+                return False
+
+        log.warning("[SCAN] Max wait time exceeded")
+        return False
+
+
+class ScanGroup:
+    """One scan for a batch of jobs, requested once every job of the batch is ready for it.
+
+    Each member either calls `defer(job_id, callback)` when it needs a scan,
+    or `leave(job_id)` when it ends without one. Once no member is left
+    running, a single scan runs and every deferred callback is called with its
+    result, one after another on the scan's thread. Deferred jobs don't hold a
+    worker while they wait, so a batch larger than the worker pool still ends.
+    """
+
+    def __init__(self, coordinator, members):
+        self.coordinator = coordinator
+        self._running = set(members)
+        self._deferred = []
+        self._lock = threading.Lock()
+
+    def defer(self, job_id, callback):
+        with self._lock:
+            self._running.discard(job_id)
+            self._deferred.append(callback)
+            callbacks = self._take_ready()
+        self._start(callbacks)
+
+    def leave(self, job_id):
+        with self._lock:
+            if job_id not in self._running:
+                return
+            self._running.discard(job_id)
+            callbacks = self._take_ready()
+        self._start(callbacks)
+
+    def _take_ready(self):
+        if self._running or not self._deferred:
+            return None
+        callbacks, self._deferred = self._deferred, []
+        return callbacks
+
+    def _start(self, callbacks):
+        if callbacks:
+            threading.Thread(target=self._run, args=(callbacks,), daemon=True).start()
+
+    def _run(self, callbacks):
+        log.info(f"[SCAN] Batch of {len(callbacks)} jobs ready, scanning once for all of them")
+        completed = self.coordinator.scan_and_wait()
+        for callback in callbacks:
+            try:
+                callback(completed)
+            except Exception as e:
+                log.exception(f"[SCAN] Deferred job failed after the batch scan: {e}")
@@ -0,0 +1,128 @@
+import heapq
+import itertools
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class DownloadScheduler:
+    """Runs queued jobs on a bounded pool of worker threads.
+
+    Jobs are taken in (priority, submission order); lower priority values run
+    first. run_job is called as run_job(job_id, cancel_event) on a worker
+    thread and should return once cancel_event is set.
+    """
+
+    def __init__(self, run_job, max_workers=2):
+        self._run_job = run_job
+        self._cond = threading.Condition()
+        self._queue = []
+        self._queued = set()
+        self._seq = itertools.count()
+        self._running = {}
+        self._cancel_callbacks = {}
+        self._workers = 0
+        self.max_workers = max(1, int(max_workers))
+        with self._cond:
+            self._spawn_workers()
+
+    def submit(self, job_id, priority=0):
+        """Queue a job, returns its position in the queue (0 = next to run)"""
+        with self._cond:
+            heapq.heappush(self._queue, (priority, next(self._seq), job_id))
+            self._queued.add(job_id)
+            self._cond.notify()
+            return self._position(job_id)
+
+    def cancel(self, job_id):
+        """Cancel a job, returns 'queued' or 'running' depending on where it was, else None"""
+        with self._cond:
+            if job_id in self._queued:
+                self._queued.discard(job_id)
+                self._queue = [entry for entry in self._queue if entry[2] != job_id]
+                heapq.heapify(self._queue)
+                return 'queued'
+            cancel_event = self._running.get(job_id)
+            if cancel_event is None:
+                return None
+            cancel_event.set()
+            callbacks = self._cancel_callbacks.pop(job_id, [])
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                log.error(f"[QUEUE] Cancel callback failed for job {job_id}: {e}")
+        return 'running'
+
+    def add_cancel_callback(self, job_id, callback):
+        """Register a callable (e.g. process.terminate) to run if the running job is cancelled"""
+        with self._cond:
+            cancel_event = self._running.get(job_id)
+            if cancel_event is None:
+                return
+            if not cancel_event.is_set():
+                self._cancel_callbacks.setdefault(job_id, []).append(callback)
+                return
+        callback()
+
+    def resize(self, max_workers):
+        """Change the number of concurrent jobs; running jobs are never interrupted"""
+        with self._cond:
+            self.max_workers = max(1, int(max_workers))
+            self._spawn_workers()
+            # Idle workers above the new limit exit on wake-up
+            self._cond.notify_all()
+            log.info(f"[QUEUE] Pool resized to {self.max_workers} workers")
+            return self.max_workers
+
+    def position(self, job_id):
+        """Return the 0-based queue position of a waiting job, or None"""
+        with self._cond:
+            return self._position(job_id)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_workers': self.max_workers,
+                'workers': self._workers,
+                'running': len(self._running),
+                'queued': len(self._queued),
+            }
+
+    def _position(self, job_id):
+        if job_id not in self._queued:
+            return None
+        for position, entry in enumerate(sorted(self._queue)):
+            if entry[2] == job_id:
+                return position
+        return None
+
+    def _spawn_workers(self):
+        while self._workers < self.max_workers:
+            self._workers += 1
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._workers > self.max_workers:
+                        self._workers -= 1
+                        return
+                    if self._queue:
+                        _, _, job_id = heapq.heappop(self._queue)
+                        self._queued.discard(job_id)
+                        cancel_event = threading.Event()
+                        self._running[job_id] = cancel_event
+                        break
+                    self._cond.wait()
+
+            try:
+                self._run_job(job_id, cancel_event)
+            except Exception as e:
+                log.exception(f"[QUEUE] Job {job_id} raised: {e}")
+            finally:
+                with self._cond:
+                    self._running.pop(job_id, None)
+                    self._cancel_callbacks.pop(job_id, None)
@@ -0,0 +1,226 @@
+import collections
+import heapq
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from process_io import OutputReader
+from retry import classify, worst, RATE_LIMITED, TRANSIENT, PERMANENT
+
+log = logging.getLogger(__name__)
+
+
+def popen_cli(command):
+    """Start a command with binary stdout/stderr pipes for OutputReader"""
+    return subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        stdin=subprocess.DEVNULL
+    )
+
+
+class AdaptiveConcurrency:
+    """Limit on spotdl processes across all jobs, adjusted by AIMD.
+
+    Each finished shard adds one process while the load average per core is
+    below `load_target`, and removes one above it. A rate-limit error halves the
+    limit as soon as it is seen and freezes it for `cooldown` seconds.
+    """
+
+    def __init__(self, maximum, initial=2, load_target=0.85, cooldown=60):
+        self.maximum = max(1, maximum)
+        self.limit = max(1, min(initial, self.maximum))
+        self.load_target = load_target
+        self.cooldown = cooldown
+        self.running = 0
+        self._cooldown_until = 0
+        self._cpus = os.cpu_count() or 1
+        self._lock = threading.Lock()
+
+    def try_acquire(self, held):
+        """Reserve a process slot; a run holding none always gets one, so no job starves"""
+        with self._lock:
+            if held and self.running >= self.limit:
+                return False
+            self.running += 1
+            return True
+
+    def throttle(self):
+        """Halve the limit after a rate-limit error; running processes finish, no new ones start"""
+        with self._lock:
+            cooling = time.time() < self._cooldown_until
+            self._cooldown_until = time.time() + self.cooldown
+            if cooling:
+                # Already halved for this burst of errors
+                return
+            self.limit = max(1, self.limit // 2)
+            log.warning(f"[SHARD] Rate limited, concurrency down to {self.limit}")
+
+    def release(self):
+        with self._lock:
+            self.running -= 1
+            if time.time() < self._cooldown_until:
+                return
+            try:
+                load = os.getloadavg()[0] / self._cpus
+            except OSError:
+                return
+            if load < self.load_target and self.limit < self.maximum:
+                self.limit += 1
+            elif load > self.load_target * 1.25 and self.limit > 1:
+                self.limit -= 1
+
+
+class ShardedRun:
+    """Runs spotdl over a list of targets split into batches, one process per batch.
+
+    Iterate `lines()` to get the merged output of every process as it arrives.
+    The pipes are read on the iterating thread, so a slow consumer slows spotdl
+    down instead of queueing its output. `returncode` is set once `lines()` is
+    exhausted. When a batch ends with targets left, `remaining(batch)` says
+    which ones (without it, the whole batch if the process failed) and only
+    those run again, after the delay `retry` gives for the failure seen in the
+    output. Targets out of attempts end up in `failed`, and make `returncode`
+    non-zero even if their process exited cleanly. Each batch's command
+    line is started with `popen`, e.g. on a warm worker instead of a new process.
+    """
+
+    def __init__(self, targets, command, concurrency, shard_size=50, on_change=None,
+                 retry=None, remaining=None, on_retry=None, popen=popen_cli):
+        self.command = command
+        self.popen = popen
+        self.concurrency = concurrency
+        self.on_change = on_change
+        self.retry = retry
+        self.remaining = remaining
+        self.on_retry = on_retry
+        self.returncode = 0
+        self.batches = [targets[i:i + shard_size] for i in range(0, len(targets), shard_size)]
+        self.finished = 0
+        self.failed = []
+        self._pending = collections.deque((index, batch, 0) for index, batch in enumerate(self.batches))
+        # (due, index, targets, attempt) of batches waiting out their backoff
+        self._delayed = []
+        self._running = {}
+        self._failures = {}
+        self._output = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Stop launching batches and terminate the running ones"""
+        with self._lock:
+            self._cancelled = True
+            self._delayed.clear()
+            processes = [process for process, batch, attempt in self._running.values()]
+        for process in processes:
+            process.terminate()
+        # Wakes lines() if it is only waiting for a retry to come due
+        if self._output is not None:
+            self._output.wake()
+
+    def stats(self):
+        return {
+            "total": len(self.batches),
+            "finished": self.finished,
+            "running": len(self._running),
+            "retrying": len(self._delayed),
+            "failed": len(self.failed),
+            "concurrency": self.concurrency.limit,
+        }
+
+    def _launch(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            due, index, batch, attempt = heapq.heappop(self._delayed)
+            self._pending.append((index, batch, attempt))
+        while self._pending and self.concurrency.try_acquire(len(self._running)):
+            index, batch, attempt = self._pending.popleft()
+            try:
+                process = self.popen(self.command(batch))
+            except OSError:
+                self.concurrency.release()
+                raise
+            with self._lock:
+                self._running[index] = (process, batch, attempt)
+                cancelled = self._cancelled
+            if cancelled:
+                process.terminate()
+            self._output.add(index, process)
+            log.info(f"[SHARD] Started batch {index + 1}/{len(self.batches)} ({len(batch)} targets, "
+                     f"{len(self._running)} running, limit {self.concurrency.limit}"
+                     f"{f', attempt {attempt + 1}' if attempt else ''})")
+            if self.on_change:
+                self.on_change(self.stats())
+
+    def _finish(self, index, batch, attempt, returncode):
+        """Retry what is left of an ended batch, or give up on it; returns True if it is done"""
+        failure = self._failures.pop(index, None)
+        if self._cancelled:
+            return True
+        if self.remaining is not None:
+            left = self.remaining(batch)
+            # Permanent failures were already left out by remaining()
+            kind = TRANSIENT if failure in (None, PERMANENT) else failure
+        else:
+            left = batch if returncode != 0 else []
+            kind = failure or TRANSIENT
+        if not left:
+            return True
+        if self.retry is not None and self.retry.should_retry(attempt, kind):
+            delay = self.retry.delay(attempt, kind)
+            heapq.heappush(self._delayed, (time.monotonic() + delay, index, left, attempt + 1))
+            log.warning(f"[SHARD] Batch {index + 1}: {len(left)}/{len(batch)} targets left ({kind}, "
+                        f"exit code {returncode}), retrying in {delay:.1f}s")
+            if self.on_retry:
+                self.on_retry(kind, len(left))
+            return False
+        log.warning(f"[SHARD] Batch {index + 1}: giving up on {len(left)} targets after {attempt + 1} attempts ({kind})")
+        self.failed.extend(left)
+        # spotdl exits 0 after songs it couldn't download, so a clean exit doesn't count
+        self.returncode = returncode or 1
+        return True
+
+    def lines(self):
+        self._output = OutputReader()
+        try:
+            while True:
+                if not self._cancelled:
+                    self._launch()
+                if not self._running and (self._cancelled or not self._delayed):
+                    break
+                timeout = max(0, self._delayed[0][0] - time.monotonic()) if self._delayed else None
+                for kind, index, payload in self._output.poll(timeout):
+                    if kind == 'line':
+                        failure = classify(payload)
+                        if failure is not None:
+                            if failure == RATE_LIMITED and self._failures.get(index) != RATE_LIMITED:
+                                # Once per batch: the other processes see the same limit
+                                self.concurrency.throttle()
+                            self._failures[index] = worst(self._failures.get(index), failure)
+                        yield payload
+                        continue
+
+                    # Both pipes closed: the process is exiting
+                    with self._lock:
+                        process, batch, attempt = self._running.pop(index)
+                    returncode = process.wait()
+                    self.concurrency.release()
+                    if self._finish(index, batch, attempt, returncode):
+                        self.finished += 1
+                    if self.on_change:
+                        self.on_change(self.stats())
+        finally:
+            # The consumer gave up early: don't leave processes or slots behind
+            if self._running:
+                self.cancel()
+                with self._lock:
+                    leftover = list(self._running.values())
+                    self._running.clear()
+                for process, batch, attempt in leftover:
+                    process.wait()
+                    self.concurrency.release()
+            self._output.close()
@@ -0,0 +1,200 @@
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+from shards import popen_cli
+
+log = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spotdl_worker.py')
+# Largest reply from a worker
+MAX_MESSAGE = 64 * 1024
+
+
+class _Worker:
+    """One spotdl_worker.py process and the socket it takes requests on"""
+
+    def __init__(self, engine, start_timeout):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, WORKER_SCRIPT, '--control', str(child.fileno()), '--engine', engine],
+                pass_fds=(child.fileno(),),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        finally:
+            child.close()
+        self.control = parent
+        # Importing spotdl and logging in to Spotify happen before the worker says it is ready
+        self.control.settimeout(start_timeout)
+        try:
+            hello = self.receive()
+        finally:
+            self.control.settimeout(None)
+        if not hello or not hello.get('ready'):
+            self.close()
+            raise RuntimeError((hello or {}).get('error') or f"worker exited with code {self.process.poll()}")
+
+    def receive(self):
+        """Next message from the worker, or None if it died"""
+        try:
+            data = self.control.recv(MAX_MESSAGE)
+        except OSError:
+            return None
+        return json.loads(data) if data else None
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        self.control.close()
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class WorkerRun:
+    """Popen look-alike for one command running on a pool worker.
+
+    `stdout` is a pipe of its own, closed by the worker when the command is
+    done; `wait()` then collects the exit code and hands the worker back.
+    """
+
+    stderr = None
+
+    def __init__(self, pool, worker, stdout):
+        self.pool = pool
+        self.worker = worker
+        self.stdout = stdout
+        self.returncode = None
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            if self.returncode is None:
+                reply = self.worker.receive()
+                if reply is None:
+                    # Killed (cancelled) or crashed: the worker is not reused
+                    self.worker.process.wait()
+                    self.returncode = self.worker.process.returncode or 1
+                else:
+                    self.returncode = reply['returncode']
+                    if reply.get('error'):
+                        log.warning(f"[WORKERS] Worker {self.worker.process.pid} raised: {reply['error']}")
+                self.pool._release(self.worker, healthy=reply is not None)
+            return self.returncode
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        # Downloads running inside the worker can't be interrupted any other way
+        self.worker.process.kill()
+
+    kill = terminate
+
+
+class SpotdlWorkerPool:
+    """Warm spotdl processes that run `spotdl ...` commands without starting Python each time.
+
+    `popen(command)` runs a spotdl command line on an idle worker and returns
+    a Popen look-alike, starting workers up to `size` as needed. It falls back
+    to running the CLI when no worker is free, or for good when workers can't
+    start (e.g. spotdl's API is not importable), so callers don't need to care.
+
+    Once a command runs on a worker there is no fallback: an exception in the
+    engine is logged and the command ends with exit code 1, like a failed CLI
+    run, and is retried as such. Cancelling a command kills its worker, since
+    a download in progress can't be interrupted in-process; the next command
+    starts a new one.
+    """
+
+    def __init__(self, size, engine='spotdl', start_timeout=120):
+        self.size = max(1, size)
+        self.engine = engine
+        self.start_timeout = start_timeout
+        self.broken = None
+        self._idle = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """Start every worker in the background, so the first jobs find them ready"""
+        def start_all():
+            started = []
+            for _ in range(self.size):
+                worker = self._checkout()
+                if worker is None:
+                    break
+                started.append(worker)
+            for worker in started:
+                self._release(worker)
+            if started:
+                log.info(f"[WORKERS] {len(started)} spotdl workers ready")
+        threading.Thread(target=start_all, name="spotdl-workers", daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self._count, 'idle': len(self._idle), 'broken': self.broken}
+
+    def popen(self, command):
+        if command[:1] != ['spotdl'] or self.broken:
+            return popen_cli(command)
+        worker = self._checkout()
+        if worker is None:
+            return popen_cli(command)
+        read_fd, write_fd = os.pipe()
+        try:
+            socket.send_fds(worker.control, [json.dumps({'args': command[1:]}).encode('utf-8')], [write_fd])
+        except OSError as e:
+            os.close(read_fd)
+            log.warning(f"[WORKERS] Worker {worker.process.pid} is gone ({e}), running the CLI")
+            self._release(worker, healthy=False)
+            return popen_cli(command)
+        finally:
+            os.close(write_fd)
+        return WorkerRun(self, worker, os.fdopen(read_fd, 'rb', buffering=0))
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._count -= len(idle)
+        for worker in idle:
+            worker.close()
+
+    def _checkout(self):
+        """An idle worker, a newly started one, or None if none is available"""
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive():
+                    return worker
+                self._count -= 1
+                worker.close()
+            if self.broken or self._count >= self.size:
+                return None
+            self._count += 1
+        try:
+            return _Worker(self.engine, self.start_timeout)
+        except Exception as e:
+            with self._lock:
+                self._count -= 1
+                if self.broken is None:
+                    self.broken = str(e)
+                    log.warning(f"[WORKERS] spotdl workers unavailable ({e}), running the spotdl CLI instead")
+            return None
+
+    def _release(self, worker, healthy=True):
+        if healthy and worker.alive():
+            with self._lock:
+                self._idle.append(worker)
+            return
+        with self._lock:
+            self._count -= 1
+        worker.close()
@@ -0,0 +1,172 @@
+"""Long-lived spotdl worker process, started and fed by spotdl_pool.SpotdlWorkerPool.
+
+Loads spotdl once, then runs requests sent over a Unix socket (`--control FD`).
+A request is the argument list of a `spotdl` command line, with the write end
+of a pipe attached; everything the request prints goes to that pipe, which is
+closed when it is done, and the exit code is sent back on the socket.
+
+`--engine spotdl` (default) runs downloads through spotdl's Python API, so the
+Spotify client, its token and caches, and the downloaders with their HTTP
+sessions are reused by every request. `--engine path/to/module.py:function`
+calls a `main(argv)`-style function in-process instead (e.g. the
+tools/fake_spotdl.py stand-in).
+"""
+import argparse
+import importlib
+import importlib.util
+import json
+import logging
+import os
+import socket
+import sys
+import traceback
+
+# Largest request or reply; 50 track URLs take about 3 KiB
+MAX_MESSAGE = 1024 * 1024
+DEFAULT_TEMPLATE = "{artists} - {title}.{output-ext}"
+
+
+def parse_command(argv):
+    """The subset of the spotdl command line the app uses"""
+    parser = argparse.ArgumentParser(prog='spotdl', add_help=False)
+    parser.add_argument('query', nargs='*')
+    parser.add_argument('--output')
+    parser.add_argument('--save-file')
+    parser.add_argument('--threads', type=int)
+    # Parsed so its value isn't taken for a query; SpotdlEngine leaves it to the config file
+    parser.add_argument('--max-retries', type=int)
+    parser.add_argument('--add-unavailable', action='store_true')
+    options, _ = parser.parse_known_args(argv)
+    options.save = bool(options.query) and options.query[0] == 'save'
+    if options.save:
+        options.query = options.query[1:]
+    return options
+
+
+class SpotdlEngine:
+    """spotdl's Python API, initialized once per worker.
+
+    Settings come from spotdl's own loader, like the CLI's: its defaults,
+    overridden by ~/.spotdl/config.json when that has `load_config`, then by
+    the options of each command. The Spotify client (token, metadata cache)
+    is process-wide in spotdl and set up here, so options that belong to it,
+    such as `--max-retries`, come from the config file only; downloaders,
+    which hold the YouTube and lyrics sessions, are kept per set of options.
+    """
+
+    def __init__(self):
+        from spotdl.utils.config import create_settings
+        from spotdl.utils.spotify import SpotifyClient
+        from spotdl.utils.search import get_simple_songs
+        from spotdl.download.downloader import Downloader
+        spotify_settings, self._settings, _ = create_settings(argparse.Namespace(config=False))
+        SpotifyClient.init(**spotify_settings)
+        self._get_songs = get_simple_songs
+        self._downloader_class = Downloader
+        self._downloaders = {}
+        # spotdl reports progress and errors through logging, which the CLI would print;
+        # that includes the "Found N songs in <list> (Playlist)" line the app parses
+        logging.basicConfig(stream=sys.stdout, level=logging.INFO, format='%(message)s')
+
+    def _downloader(self, options):
+        output = options.output or '.'
+        if '{' not in output:
+            output = os.path.join(output, DEFAULT_TEMPLATE)
+        key = (output, options.threads, options.add_unavailable)
+        if key not in self._downloaders:
+            settings = dict(self._settings, output=output, simple_tui=True,
+                            add_unavailable=options.add_unavailable)
+            if options.threads:
+                settings['threads'] = options.threads
+            self._downloaders[key] = self._downloader_class(settings)
+        return self._downloaders[key]
+
+    def _songs(self, query):
+        # The same search options `spotdl download` passes
+        settings = self._settings
+        return self._get_songs(query, use_ytm_data=settings['ytm_data'],
+                               playlist_numbering=settings['playlist_numbering'],
+                               albums_to_ignore=settings['ignore_albums'],
+                               album_type=settings['album_type'],
+                               playlist_retain_track_cover=settings['playlist_retain_track_cover'])
+
+    def __call__(self, argv):
+        options = parse_command(argv)
+        songs = self._songs(options.query)
+        if options.save:
+            with open(options.save_file, 'w', encoding='utf-8') as f:
+                json.dump([song.json for song in songs], f, ensure_ascii=False)
+            print(f"Saved {len(songs)} songs to {options.save_file}", flush=True)
+            return 0
+        for song, path in self._downloader(options).download_multiple_songs(songs):
+            if path is None:
+                print(f'Failed to download "{song.display_name}"', flush=True)
+        return 0
+
+
+def load_engine(spec):
+    if spec == 'spotdl':
+        return SpotdlEngine()
+    target, _, function = spec.rpartition(':')
+    if target.endswith('.py'):
+        module_spec = importlib.util.spec_from_file_location(os.path.basename(target)[:-3], target)
+        module = importlib.util.module_from_spec(module_spec)
+        module_spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(target)
+    return getattr(module, function)
+
+
+def send(control, message):
+    control.send(json.dumps(message).encode('utf-8'))
+
+
+def serve(control, engine):
+    """Run requests until the pool closes the socket"""
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    while True:
+        data, fds, _, _ = socket.recv_fds(control, MAX_MESSAGE, 1)
+        if not data:
+            return 0
+        request = json.loads(data)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd in fds:
+            os.dup2(fd, 1)
+            os.dup2(fd, 2)
+            os.close(fd)
+        error = None
+        try:
+            returncode = engine(list(request['args'])) or 0
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            traceback.print_exc()
+            returncode = 1
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            # Closes the request's pipe, which tells the pool its output is complete
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+        send(control, {'returncode': returncode, 'error': error})
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--control', type=int, required=True)
+    parser.add_argument('--engine', default='spotdl')
+    args = parser.parse_args(argv)
+    control = socket.socket(fileno=args.control)
+    try:
+        engine = load_engine(args.engine)
+    except Exception as e:
+        send(control, {'error': f"{type(e).__name__}: {e}"})
+        return 1
+    send(control, {'ready': True, 'pid': os.getpid()})
+    return serve(control, engine)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
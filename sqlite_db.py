@@ -0,0 +1,21 @@
+import os
+import sqlite3
+
+
+def open_db(db_path, schema, foreign_keys=False):
+    """Open a SQLite database shared by threads, in WAL mode, and create its schema.
+
+    The connection is not thread-safe by itself: callers serialize access
+    with their own lock.
+    """
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if foreign_keys:
+        conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(schema)
+    conn.commit()
+    return conn
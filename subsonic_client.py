@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import logging
+import random
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+log = logging.getLogger(__name__)
+
+API_VERSION = '1.16.1'
+CLIENT_NAME = 'spotdl'
+
+# Seconds per endpoint; bulk listings can take a while on large libraries
+ENDPOINT_TIMEOUTS = {
+    'ping': 5,
+    'getScanStatus': 5,
+    'startScan': 10,
+    'getIndexes': 30,
+    'search3': 60,
+    'getAlbumList2': 30,
+    'getAlbum': 15,
+    'getPlaylists': 15,
+    'getPlaylist': 30,
+    'createPlaylist': 30,
+    'updatePlaylist': 30,
+}
+DEFAULT_TIMEOUT = 10
+
+
+class SubsonicError(Exception):
+    """Error reported by the server in a subsonic-response with status="failed" """
+
+    def __init__(self, code, message):
+        super().__init__(f"Subsonic error {code}: {message}")
+        self.code = code
+
+
+class SubsonicClient:
+    """Subsonic/Navidrome API client over a keep-alive connection pool.
+
+    Authenticates with a token+salt pair computed once per client, always asks
+    for JSON and retries connection errors and 5xx responses with exponential
+    backoff. Safe to share between threads. `on_request(endpoint, seconds, outcome)`
+    is called after every HTTP attempt, with outcome "ok", "error" (Subsonic
+    error response), "http_error" (4xx/5xx status) or "failed" (no response).
+    """
+
+    def __init__(self, base_url, user, password, pool_size=10, retries=3, backoff=0.5, on_request=None):
+        self.base_url = base_url.rstrip('/')
+        self.retries = retries
+        self.backoff = backoff
+        self.on_request = on_request
+        salt = secrets.token_hex(8)
+        self._auth = {
+            'u': user,
+            't': hashlib.md5((password + salt).encode('utf-8')).hexdigest(),
+            's': salt,
+            'c': CLIENT_NAME,
+            'v': API_VERSION,
+            'f': 'json',
+        }
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, endpoint, **params):
+        """Call an endpoint and return the body of its subsonic-response"""
+        return self._request('GET', endpoint, params, retry=True)
+
+    def post(self, endpoint, **params):
+        """Call an endpoint with form-encoded parameters, for long lists such as song IDs.
+
+        Used for calls that change data, so only requests that never reached the
+        server (the connection was refused, or timed out while connecting) are
+        retried.
+        """
+        return self._request('POST', endpoint, params, retry=False)
+
+    def _request(self, method, endpoint, params, retry):
+        query = dict(self._auth)
+        url = f"{self.base_url}/rest/{endpoint}"
+        timeout = ENDPOINT_TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT)
+        if method == 'GET':
+            query.update(params)
+            data = None
+        else:
+            data = params
+
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            outcome = 'failed'
+            try:
+                response = self.session.request(method, url, params=query, data=data, timeout=timeout)
+                outcome = 'http_error'
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    outcome = 'error'
+                    body = _unwrap(response.json())
+                    outcome = 'ok'
+                    return body
+                error = requests.HTTPError(f"{response.status_code} from {endpoint}", response=response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                if self.on_request is not None:
+                    self.on_request(endpoint, time.perf_counter() - started, outcome)
+            # Without retry, only a request that never reached the server is sent again
+            if attempt == self.retries or not (retry or _not_sent(error)):
+                raise error
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            log.warning(f"[NAVIDROME] {endpoint} failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def ping(self):
+        return self.get('ping')
+
+    def start_scan(self, full=False):
+        params = {'fullScan': 'true'} if full else {}
+        return self.get('startScan', **params).get('scanStatus', {})
+
+    def get_scan_status(self):
+        return self.get('getScanStatus').get('scanStatus', {})
+
+    def get_indexes(self, if_modified_since=None):
+        params = {'ifModifiedSince': if_modified_since} if if_modified_since else {}
+        return self.get('getIndexes', **params).get('indexes', {})
+
+    def search3(self, query='', artist_count=0, album_count=0, song_count=20, song_offset=0):
+        result = self.get('search3', query=query, artistCount=artist_count, albumCount=album_count,
+                          songCount=song_count, songOffset=song_offset)
+        return result.get('searchResult3', {})
+
+    def get_album_list2(self, list_type='newest', size=500, offset=0):
+        result = self.get('getAlbumList2', type=list_type, size=size, offset=offset)
+        return result.get('albumList2', {}).get('album', [])
+
+    def get_album(self, album_id):
+        return self.get('getAlbum', id=album_id).get('album', {})
+
+    def get_playlists(self):
+        return self.get('getPlaylists').get('playlists', {}).get('playlist', [])
+
+    def get_playlist(self, playlist_id):
+        return self.get('getPlaylist', id=playlist_id).get('playlist', {})
+
+    def create_playlist(self, name, song_ids=()):
+        return self.post('createPlaylist', name=name, songId=list(song_ids)).get('playlist', {})
+
+    def update_playlist(self, playlist_id, song_ids_to_add=(), song_indexes_to_remove=()):
+        return self.post('updatePlaylist', playlistId=playlist_id, songIdToAdd=list(song_ids_to_add),
+                         songIndexToRemove=list(song_indexes_to_remove))
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncSubsonicClient:
+    """asyncio front end for the blocking SubsonicClient.
+
+    There is no async I/O underneath: every call runs the blocking client in
+    `run_in_executor` on a thread pool sized to the connection pool, so up to
+    pool_size calls (and threads) are in flight at once over kept-alive
+    connections.
+    """
+
+    def __init__(self, client, pool_size=10):
+        self.client = client
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='subsonic')
+
+    async def get(self, endpoint, **params):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.client.get(endpoint, **params))
+
+    async def gather(self, calls):
+        """Run many (endpoint, params) calls concurrently, returns results in order"""
+        return await asyncio.gather(*(self.get(endpoint, **params) for endpoint, params in calls))
+
+    async def get_album(self, album_id):
+        return (await self.get('getAlbum', id=album_id)).get('album', {})
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+def _not_sent(error):
+    """True if connecting failed, so the request can't have reached the server"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # A reset or dropped connection after connecting may come after the server got the request
+    if not isinstance(error, requests.ConnectionError) or error.response is not None:
+        return False
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _unwrap(payload):
+    body = payload.get('subsonic-response', {})
+    if body.get('status') != 'ok':
+        error = body.get('error', {})
+        raise SubsonicError(error.get('code'), error.get('message', 'unknown error'))
+    return body
@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlite_db import open_db
+from track_cache import canonical_url
+
+log = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS syncs (
+    url TEXT PRIMARY KEY,
+    interval REAL NOT NULL,
+    next_run REAL NOT NULL,
+    last_run REAL,
+    last_job TEXT
+);
+CREATE INDEX IF NOT EXISTS syncs_next_run ON syncs(next_run);
+"""
+
+
+class SyncSchedule:
+    """Playlists and albums re-synced every `interval` seconds, stored in SQLite.
+
+    A background thread sleeps until the earliest sync is due, then hands
+    every due URL to `submit(urls)` in one call, so they run as one batch.
+    `submit` returns a {url: job ID} dict. The next run is counted from when
+    the sync was due, not from when it ran, so nightly syncs don't drift.
+    """
+
+    def __init__(self, db_path, submit, default_interval=24 * 3600):
+        self.submit = submit
+        self.default_interval = default_interval
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        self._conn = open_db(db_path, SCHEMA)
+
+    def follow(self, url, interval=None, first_run=None):
+        """Add or update a sync, returns its record; the first run is due now unless given"""
+        url = canonical_url(url)
+        interval = float(interval or self.default_interval)
+        first_run = time.time() if first_run is None else first_run
+        with self._cond:
+            self._conn.execute(
+                "INSERT INTO syncs (url, interval, next_run) VALUES (?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET interval = excluded.interval, "
+                "next_run = MIN(next_run, excluded.next_run)",
+                (url, interval, first_run))
+            self._conn.commit()
+            self._cond.notify_all()
+        log.info(f"[SYNC] Following {url} every {interval / 3600:g}h")
+        return self.get(url)
+
+    def unfollow(self, url):
+        with self._cond:
+            removed = self._conn.execute("DELETE FROM syncs WHERE url = ?", (canonical_url(url),)).rowcount
+            self._conn.commit()
+        return bool(removed)
+
+    def run_now(self, url=None):
+        """Make one sync (or all of them) due immediately, returns how many"""
+        with self._cond:
+            if url is None:
+                count = self._conn.execute("UPDATE syncs SET next_run = ?", (time.time(),)).rowcount
+            else:
+                count = self._conn.execute(
+                    "UPDATE syncs SET next_run = ? WHERE url = ?", (time.time(), canonical_url(url))).rowcount
+            self._conn.commit()
+            self._cond.notify_all()
+        return count
+
+    def get(self, url):
+        with self._cond:
+            row = self._conn.execute(
+                "SELECT url, interval, next_run, last_run, last_job FROM syncs WHERE url = ?",
+                (canonical_url(url),)).fetchone()
+        return _record(row) if row else None
+
+    def list(self):
+        with self._cond:
+            rows = self._conn.execute(
+                "SELECT url, interval, next_run, last_run, last_job FROM syncs ORDER BY next_run, url").fetchall()
+        return [_record(row) for row in rows]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="sync-schedule", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _take_due(self):
+        """URLs due now with their next run moved forward, or the seconds until the next one is due"""
+        now = time.time()
+        rows = self._conn.execute(
+            "SELECT url, interval, next_run FROM syncs WHERE next_run <= ?", (now,)).fetchall()
+        if not rows:
+            row = self._conn.execute("SELECT MIN(next_run) FROM syncs").fetchone()
+            return [], None if row[0] is None else row[0] - now
+        updates = []
+        for url, interval, next_run in rows:
+            # Skip the runs missed while the app was down instead of running them all
+            missed = int((now - next_run) // interval) + 1
+            updates.append((next_run + missed * interval, now, url))
+        self._conn.executemany("UPDATE syncs SET next_run = ?, last_run = ? WHERE url = ?", updates)
+        self._conn.commit()
+        return [url for url, _, _ in rows], None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        return
+                    urls, wait = self._take_due()
+                    if urls:
+                        break
+                    self._cond.wait(wait)
+
+            log.info(f"[SYNC] {len(urls)} syncs due, submitting them as one batch")
+            try:
+                jobs = self.submit(urls)
+            except Exception as e:
+                log.exception(f"[SYNC] Could not submit the scheduled syncs: {e}")
+                continue
+            with self._cond:
+                self._conn.executemany(
+                    "UPDATE syncs SET last_job = ? WHERE url = ?",
+                    ((job_id, url) for url, job_id in jobs.items()))
+                self._conn.commit()
+
+
+def _record(row):
+    url, interval, next_run, last_run, last_job = row
+    return {
+        'url': url,
+        'interval': interval,
+        'next_run': datetime.fromtimestamp(next_run).isoformat(),
+        'last_run': datetime.fromtimestamp(last_run).isoformat() if last_run else None,
+        'last_job': last_job,
+    }
@@ -0,0 +1,76 @@
+import collections
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import mutagen
+from mutagen.easyid3 import EasyID3
+from mutagen.easymp4 import EasyMP4Tags
+
+log = logging.getLogger(__name__)
+
+Tags = collections.namedtuple('Tags', 'artist title album isrc duration')
+
+# Below this many files, starting worker processes costs more than parsing inline
+POOL_THRESHOLD = 64
+# Text fields read through mutagen's "easy" interface, which maps them to
+# ID3 frames, Vorbis comments and MP4 items alike
+TEXT_FIELDS = ('artist', 'title', 'album', 'isrc')
+
+# iTunes stores the ISRC as the freeform item com.apple.iTunes:ISRC
+EasyMP4Tags.RegisterFreeformKey('isrc', 'ISRC')
+
+
+def read_tags(path):
+    """Tags of an MP3, M4A, FLAC or Ogg file, or None if it can't be parsed.
+
+    Missing fields are None; duration is in seconds.
+    """
+    try:
+        tags, duration = _read(path)
+    except (mutagen.MutagenError, OSError, ValueError):
+        return None
+    fields = {name: _join(tags.get(name, [])) for name in TEXT_FIELDS} if tags else {}
+    fields['duration'] = duration
+    if not any(fields.values()):
+        return None
+    return Tags(*(fields.get(name) for name in Tags._fields))
+
+
+def read_many(paths, workers=None):
+    """read_tags() for every path, in order; large batches run on a process pool"""
+    paths = list(paths)
+    if len(paths) < POOL_THRESHOLD:
+        return [read_tags(path) for path in paths]
+    workers = workers or min(8, os.cpu_count() or 1)
+    try:
+        # spawn, not fork: the server process has threads (and locks) of its own
+        with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            return list(pool.map(read_tags, paths, chunksize=max(16, len(paths) // (workers * 4))))
+    except (BrokenProcessPool, OSError) as e:
+        log.warning(f"[TAGS] Process pool failed ({e}), reading {len(paths)} files inline")
+        return [read_tags(path) for path in paths]
+
+
+def _read(path):
+    """(easy tags or None, duration in seconds or None) of an audio file"""
+    try:
+        audio = mutagen.File(path, easy=True)
+    except mutagen.MutagenError:
+        # An MP3 without a decodable MPEG frame (truncated or still being written)
+        # can still carry a complete ID3 tag
+        if not path.lower().endswith('.mp3'):
+            raise
+        tags = EasyID3(path)
+        # TLEN, in milliseconds
+        return tags, int(tags['length'][0]) / 1000 if tags.get('length') else None
+    if audio is None:
+        return None, None
+    return audio.tags, getattr(audio.info, 'length', None) or None
+
+
+def _join(values):
+    values = [value.strip() for value in values if value and value.strip()]
+    return ', '.join(dict.fromkeys(values)) or None
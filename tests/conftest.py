@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The app is a set of top-level modules; the fakes live in tools/
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'tools')]
+
+import fake_navidrome  # noqa: E402
+
+# Environment of the app under test; app.py reads its settings at import
+APP_ENV = {
+    'SPOTDL_ENGINE': 'cli',
+    'MAX_CONCURRENT_DOWNLOADS': '2',
+    'FAKE_SPOTDL_TRACKS': '4',
+    'SPOTDL_RETRY_DELAY': '0.05',
+    'SPOTDL_RATE_LIMIT_DELAY': '0.05',
+    'SPOTDL_RETRY_RATE': '100',
+    'LOG_LEVEL': 'WARNING',
+    'LOG_FILE': '',
+    'NAVIDROME_USER': 'admin',
+    'NAVIDROME_PASSWORD': 'admin',
+}
+
+
+def add_track(music_dir, artist, title, album='Album'):
+    path = music_dir / artist / album / f"{artist} - {title}.mp3"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'')
+    return path
+
+
+@pytest.fixture
+def music_dir(tmp_path):
+    path = tmp_path / 'music'
+    path.mkdir()
+    return path
+
+
+@pytest.fixture
+def navidrome(music_dir):
+    """A fake Navidrome serving music_dir, with fast scans; yields (server, base_url)"""
+    server, url = fake_navidrome.start_in_thread(music_dir=str(music_dir), scan_seconds=0.05)
+    yield server, url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The app module, started once against a fake Navidrome, with tools/fake_spotdl.py as spotdl"""
+    state = tmp_path_factory.mktemp('app')
+    music = state / 'music'
+    bin_dir = state / 'bin'
+    music.mkdir()
+    bin_dir.mkdir()
+    shim = bin_dir / 'spotdl'
+    shim.write_text(f"#!/bin/sh\nexec \"{sys.executable}\" \"{os.path.join(ROOT, 'tools', 'fake_spotdl.py')}\" \"$@\"\n")
+    shim.chmod(0o755)
+
+    patch = pytest.MonkeyPatch()
+    for key, value in APP_ENV.items():
+        patch.setenv(key, value)
+    patch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    patch.setenv('MUSIC_DIR', str(music))
+    for name in ('LIBRARY_INDEX', 'JOB_STORE', 'TRACK_CACHE', 'SYNC_SCHEDULE'):
+        patch.setenv(f"{name}_PATH", str(state / f"{name.lower()}.sqlite"))
+
+    import app as app_module
+    from navidrome_catalog import NavidromeCatalog
+    from playlist_sync import PlaylistSync
+    from scan_coordinator import ScanCoordinator
+    from subsonic_client import SubsonicClient
+    server, url = fake_navidrome.start_in_thread(music_dir=str(music), scan_seconds=0.05)
+    app_module.navidrome = SubsonicClient(url, 'admin', 'admin')
+    app_module.navidrome_catalog = NavidromeCatalog(app_module.navidrome)
+    app_module.playlist_sync = PlaylistSync(app_module.navidrome)
+    app_module.scan_coordinator = ScanCoordinator(
+        app_module.navidrome, timeout=10, on_complete=app_module.navidrome_catalog.mark_stale)
+    app_module.create_app()
+    yield app_module
+    server.shutdown()
+    patch.undo()
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+import time
+
+from mutagen.easyid3 import EasyID3
+
+from conftest import ROOT
+from job_store import ACTIVE_STATUSES
+
+
+def test_importing_the_app_starts_no_threads():
+    code = "import threading, app; print(threading.active_count(), app.download_scheduler)"
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ['1', 'None']
+
+
+def test_event_streams_are_capped_and_time_limited(app, monkeypatch):
+    monkeypatch.setattr(app, 'EVENTS_MAX_STREAMS', 1)
+    monkeypatch.setattr(app, 'EVENTS_STREAM_SECONDS', 1)
+    client = app.app.test_client()
+
+    first = client.get('/events', buffered=False)
+    assert app.open_event_streams == 1
+    busy = client.get('/events')
+    assert b'event: busy' in busy.data
+    # The open stream ends by itself, which frees its slot
+    assert b'retry: 3000' in b''.join(first.response)
+    first.close()
+    assert app.open_event_streams == 0
+    with client.get('/events') as again:
+        assert b'event: busy' not in again.data
+    assert app.open_event_streams == 0
+
+
+def run_job(client, url):
+    download_id = client.post('/download', json={'url': url}).get_json()['download_id']
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        record = client.get(f'/status/{download_id}').get_json()
+        if record['status'] not in ACTIVE_STATUSES:
+            return record
+        time.sleep(0.05)
+    raise AssertionError(f"job {download_id} still {record['status']}")
+
+
+def test_job_where_every_song_is_missing_fails(app, monkeypatch):
+    monkeypatch.setenv('FAKE_SPOTDL_MISSING_EVERY', '1')
+    record = run_job(app.app.test_client(), 'https://open.spotify.com/playlist/allmissing')
+    assert record['status'] == 'failed'
+    assert record['progress']['failed'] == 4
+    assert not record.get('playlist_created')
+
+
+def test_job_with_some_missing_songs_is_partial(app, monkeypatch):
+    monkeypatch.setenv('FAKE_SPOTDL_MISSING_EVERY', '2')
+    record = run_job(app.app.test_client(), 'https://open.spotify.com/playlist/halfmissing')
+    assert record['status'] == 'partial'
+    assert (record['progress']['downloaded'], record['progress']['failed']) == (2, 2)
+    assert record['playlist_created']
+
+
+def test_m3u_entries_for_bare_paths_get_tag_duration_and_title(app):
+    folder = os.path.join(app.MUSIC_DIR, 'Karol G')
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, 'karol g provenza.mp3')
+    open(path, 'wb').close()
+    tag = EasyID3()
+    tag.update({'artist': 'Karol G', 'title': 'Provenza', 'length': '210000'})
+    tag.save(path)
+    open(os.path.join(folder, 'untagged.mp3'), 'wb').close()
+
+    success, message = app.create_playlist_in_navidrome(
+        'Tagged', ['Karol G/karol g provenza.mp3', 'Karol G/untagged.mp3'])
+    assert success, message
+    with open(os.path.join(app.MUSIC_DIR, 'Tagged.m3u'), encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines[2:] == ['#EXTINF:210,Karol G - Provenza', 'Karol G/karol g provenza.mp3',
+                         '#EXTINF:-1,untagged', 'Karol G/untagged.mp3']
@@ -0,0 +1,32 @@
+from events import EventBus
+
+
+def test_resume_returns_missed_events_in_order():
+    bus = EventBus()
+    bus.publish('created', 'a', {})
+    bus.publish('log', 'a', {'line': 'one'})
+    bus.publish('update', 'a', {'status': 'downloading'})
+    bus.publish('log', 'a', {'line': 'two'})
+    assert [(event_id, kind) for event_id, kind, _, _ in bus.wait(1)] == [(2, 'log'), (3, 'update'), (4, 'log')]
+    assert bus.wait(4, timeout=0) == []
+
+
+def test_log_lines_do_not_push_state_changes_out():
+    bus = EventBus(history=10, volatile_history=5)
+    bus.publish('update', 'a', {'status': 'downloading'})
+    for i in range(100):
+        bus.publish('log', 'a', {'line': str(i)})
+    events = bus.wait(0)
+    assert events[0][1] == 'update'
+    # Older log lines are gone, without a reset
+    assert [data['line'] for _, kind, _, data in events if kind == 'log'] == ['95', '96', '97', '98', '99']
+
+
+def test_client_behind_the_state_history_is_reset():
+    bus = EventBus(history=3)
+    for i in range(5):
+        bus.publish('update', str(i), {})
+    assert [kind for _, kind, _, _ in bus.wait(1)] == ['reset']
+    assert len(bus.wait(2)) == 3
+    # Ahead of the bus: the server restarted
+    assert [kind for _, kind, _, _ in bus.wait(50)] == ['reset']
@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from file_watcher import FileWatcher
+
+
+@pytest.fixture(params=['inotify', 'poll'])
+def watcher(request, music_dir):
+    return FileWatcher(str(music_dir), backend=request.param, poll_interval=0.05)
+
+
+def finish(music_dir, rel_path, data=b'audio'):
+    """Write a file under a temporary name and rename it into place, as spotdl does"""
+    path = music_dir / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.part')
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def test_session_gets_the_audio_files_finished_while_it_ran(watcher, music_dir):
+    finish(music_dir, 'before.mp3')
+    session = watcher.start_session('1')
+    finish(music_dir, 'Rosalía - Saoko.mp3')
+    (music_dir / 'cover.jpg').write_bytes(b'jpeg')
+    # A folder created while watching is watched from then on
+    finish(music_dir, 'Rosalía/Motomami/Rosalía - Candy.flac')
+    files = session.close()
+    assert sorted(files) == ['Rosalía - Saoko.mp3', 'Rosalía/Motomami/Rosalía - Candy.flac']
+    assert session.complete
+
+    finish(music_dir, 'after.mp3')
+    assert watcher.start_session('2').close() == []
+
+
+def test_files_finished_during_overlapping_jobs_must_be_claimed(watcher, music_dir):
+    first = watcher.start_session('1')
+    # Seen by the first job alone, or shared if the second starts before it is read: claimed either way
+    finish(music_dir, 'Bad Bunny - Tití Me Preguntó.mp3')
+    second = watcher.start_session('2')
+    finish(music_dir, 'Karol G - Provenza.mp3')
+    finish(music_dir, 'Bad Bunny - Me Porto Bonito.mp3')
+
+    assert second.close(claim=lambda path: path.startswith('Karol G')) == ['Karol G - Provenza.mp3']
+    # Polling finds files in directory order, not in the order they were finished
+    assert sorted(first.close(claim=lambda path: path.startswith('Bad Bunny'))) == [
+        'Bad Bunny - Me Porto Bonito.mp3', 'Bad Bunny - Tití Me Preguntó.mp3']
+
+
+def test_missing_music_dir_leaves_the_session_incomplete(tmp_path):
+    watcher = FileWatcher(str(tmp_path / 'missing'), backend='inotify')
+    session = watcher.start_session('1')
+    assert not session.complete
+    assert session.close() == []
@@ -0,0 +1,84 @@
+import os
+import time
+
+from library_index import LibraryIndex
+
+
+def write(music_dir, rel_path, data=b'audio'):
+    path = music_dir / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+def age(path, seconds=10):
+    """Push mtimes back, out of the window in which a directory is always rescanned"""
+    mtime = time.time() - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def make_index(music_dir, tmp_path, **options):
+    return LibraryIndex(str(music_dir), str(tmp_path / 'index.sqlite'), **options)
+
+
+def test_refresh_reports_added_modified_and_removed(music_dir, tmp_path):
+    write(music_dir, 'Rosalía/Motomami/Rosalía - Saoko.mp3')
+    write(music_dir, 'Rosalía/Motomami/cover.jpg')
+    index = make_index(music_dir, tmp_path)
+    assert index.refresh() == (['Rosalía/Motomami/Rosalía - Saoko.mp3'], [], [])
+    assert index.refresh() == ([], [], [])
+
+    write(music_dir, 'Rosalía/Motomami/Rosalía - Candy.flac')
+    (music_dir / 'Rosalía/Motomami/Rosalía - Saoko.mp3').unlink()
+    added, modified, removed = index.refresh()
+    assert (added, removed) == (['Rosalía/Motomami/Rosalía - Candy.flac'], ['Rosalía/Motomami/Rosalía - Saoko.mp3'])
+    assert index.all_files() == [('Rosalía/Motomami/Rosalía - Candy.flac', 'Rosalía - Candy.flac')]
+
+
+def test_unchanged_directories_are_not_listed_again(music_dir, tmp_path, monkeypatch):
+    for artist in ('A', 'B', 'C'):
+        age(write(music_dir, f"{artist}/{artist} - Song.mp3").parent)
+    age(music_dir)
+    index = make_index(music_dir, tmp_path)
+    index.refresh()
+    listed = []
+    scan_dir = index._scan_dir
+    monkeypatch.setattr(index, '_scan_dir', lambda abs_dir, rel_dir: listed.append(rel_dir) or scan_dir(abs_dir, rel_dir))
+    write(music_dir, 'B/B - New.mp3')
+    assert index.refresh()[0] == ['B/B - New.mp3']
+    assert listed == ['B']
+
+
+def test_file_overwritten_in_place_is_found_and_gets_new_tags(music_dir, tmp_path):
+    path = write(music_dir, 'A/A - Song.mp3')
+    age(path)
+    age(path.parent)
+    age(music_dir)
+    index = make_index(music_dir, tmp_path)
+    index.refresh()
+    index.refresh_tags(lambda paths: [('A', 'Old', None, None, 1.0) for path in paths])
+    since = time.time() - 1
+
+    # Rewriting the file keeps its directory's mtime
+    path.write_bytes(b'new audio')
+    assert index.refresh() == ([], ['A/A - Song.mp3'], [])
+    assert [item['filename'] for item in index.modified_since(since)] == ['A - Song.mp3']
+    assert index.refresh_tags(lambda paths: [('A', 'New', None, None, 2.0) for path in paths]) == 1
+    assert index.tagged_files()[0][3] == 'New'
+
+
+def test_recheck_is_bounded_and_rotates(music_dir, tmp_path):
+    paths = [write(music_dir, f"A/A - Song {i}.mp3") for i in range(5)]
+    for path in paths:
+        age(path)
+    age(paths[0].parent)
+    age(music_dir)
+    index = make_index(music_dir, tmp_path, recheck_files=2)
+    index.refresh()
+    paths[4].write_bytes(b'rewritten')
+    # The first refresh went over songs 0-1; then come 2-3 and 4
+    assert index.refresh()[1] == []
+    assert index.refresh()[1] == ['A/A - Song 4.mp3']
+
+    paths[0].write_bytes(b'rewritten')
+    assert index.refresh(recheck_all=True)[1] == ['A/A - Song 0.mp3']
@@ -0,0 +1,63 @@
+from matcher import EXACT_SCORE, ISRC_SCORE, TAG_SCORE, LibraryMatcher
+
+LIBRARY = [
+    ('Rosalía/Motomami/Rosalía - Saoko.mp3', 'Rosalía - Saoko.mp3'),
+    ('Rosalía/Motomami/Rosalía - Saoko (Remix).mp3', 'Rosalía - Saoko (Remix).mp3'),
+    # Renamed file: only its tags say what it is
+    ('Unknown/track01.mp3', 'track01.mp3', 'Bad Bunny, Chencho Corleone', 'Me Porto Bonito', 'Un Verano Sin Ti',
+     'USXYZ2200001', 203.0),
+    ('Misc/Karol G & Peso Pluma - Qlona.mp3', 'Karol G & Peso Pluma - Qlona.mp3'),
+]
+
+
+def path_of(matcher, result):
+    doc, score = result
+    return (matcher.paths[doc] if doc is not None else None), score
+
+
+def test_isrc_beats_tags_beats_exact_filename():
+    matcher = LibraryMatcher(LIBRARY)
+    assert path_of(matcher, matcher.match('Anyone', 'Anything', isrc='usxyz2200001 ')) == \
+        ('Unknown/track01.mp3', ISRC_SCORE)
+    assert path_of(matcher, matcher.match('Chencho Corleone', 'Me Porto Bonito')) == \
+        ('Unknown/track01.mp3', TAG_SCORE)
+    assert path_of(matcher, matcher.match('ROSALIA', 'Saoko')) == \
+        ('Rosalía/Motomami/Rosalía - Saoko.mp3', EXACT_SCORE)
+
+
+def test_fuzzy_match_needs_the_artist_and_most_of_the_title():
+    matcher = LibraryMatcher(LIBRARY)
+    path, score = path_of(matcher, matcher.match('Karol G', 'Qlona (feat. Peso Pluma)'))
+    assert path == 'Misc/Karol G & Peso Pluma - Qlona.mp3'
+    assert 0 < score < EXACT_SCORE
+    assert matcher.match('Shakira', 'Qlona') == (None, 0)
+    assert matcher.match('Karol G', 'Provenza') == (None, 0)
+
+
+def test_coverage_then_similarity_rank_fuzzy_candidates():
+    matcher = LibraryMatcher([
+        ('a/Rosalía - Saoko.mp3', 'Rosalía - Saoko.mp3'),
+        ('a/Rosalía - Saoko Papi Extended Club Remix.mp3', 'Rosalía - Saoko Papi Extended Club Remix.mp3'),
+        ('a/Rosalía - Saoko Papi Remix.mp3', 'Rosalía - Saoko Papi Remix.mp3'),
+    ])
+    # Both remixes cover every title word; the closer name wins over the longer one
+    assert path_of(matcher, matcher.match('Rosalía', 'Saoko Papi'))[0] == 'a/Rosalía - Saoko Papi Remix.mp3'
+    # Half the title words is still enough when nothing covers more
+    path, score = path_of(matcher, matcher.match('Rosalía', 'Saoko Chicken'))
+    assert path == 'a/Rosalía - Saoko.mp3'
+    assert 0.5 <= score < 1
+
+
+def test_match_many_uses_each_file_once():
+    matcher = LibraryMatcher(LIBRARY)
+    results = matcher.match_many([
+        ('Rosalía', 'Saoko'),
+        ('Rosalía', 'Saoko'),
+        ('Rosalía', 'Saoko'),
+        ('Bad Bunny', 'Me Porto Bonito', 'USXYZ2200001'),
+        ('Bad Bunny', 'Me Porto Bonito'),
+    ])
+    paths = [path_of(matcher, result)[0] for result in results]
+    # The second request gets the other file named the same after normalization; the third finds nothing left
+    assert paths == ['Rosalía/Motomami/Rosalía - Saoko.mp3', 'Rosalía/Motomami/Rosalía - Saoko (Remix).mp3',
+                     None, 'Unknown/track01.mp3', None]
@@ -0,0 +1,177 @@
+import socket
+import threading
+import time
+
+import pytest
+import requests
+
+from conftest import add_track
+import scan_coordinator
+from navidrome_catalog import NavidromeCatalog
+from scan_coordinator import ScanCoordinator, ScanGroup
+from subsonic_client import SubsonicClient, SubsonicError
+
+
+def make_client(url, password='admin', **options):
+    calls = []
+    client = SubsonicClient(url, 'admin', password, backoff=0.01,
+                            on_request=lambda endpoint, seconds, outcome: calls.append((endpoint, outcome)),
+                            **options)
+    return client, calls
+
+
+def test_client_reports_each_outcome(navidrome):
+    server, url = navidrome
+    client, calls = make_client(url)
+    assert client.ping()['status'] == 'ok'
+    assert calls == [('ping', 'ok')]
+
+    wrong, calls = make_client(url, password='nope')
+    with pytest.raises(SubsonicError) as error:
+        wrong.ping()
+    assert error.value.code == 40
+    assert calls == [('ping', 'error')]
+
+    # Outside /rest the server answers 404, which is not retried
+    missing, calls = make_client(url + '/missing')
+    with pytest.raises(requests.HTTPError):
+        missing.ping()
+    assert calls == [('ping', 'http_error')]
+
+
+def test_client_retries_connection_failures(navidrome):
+    server, url = navidrome
+    port = server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    client, calls = make_client(f"http://127.0.0.1:{port}", retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.ping()
+    assert calls == [('ping', 'failed')] * 3
+
+
+def test_scan_coordinator_folds_requests_into_one_follow_up(navidrome):
+    server, url = navidrome
+    server.library.scan_seconds = 0.3
+    coordinator = ScanCoordinator(make_client(url)[0], timeout=10)
+    first = coordinator.request_scan()
+    second = coordinator.request_scan()
+    third = coordinator.request_scan()
+    assert second == third == first + 1
+    assert coordinator.wait(third, timeout=10)
+    assert server.library.scan_count == 2
+    assert not coordinator.is_scanning()
+
+
+def test_scan_group_scans_once_when_every_member_is_done(navidrome):
+    server, url = navidrome
+    group = ScanGroup(ScanCoordinator(make_client(url)[0], timeout=10), ['a', 'b', 'c'])
+    results = []
+    done = threading.Event()
+
+    def callback(completed):
+        results.append(completed)
+        if len(results) == 2:
+            done.set()
+
+    group.defer('a', callback)
+    group.leave('b')
+    assert server.library.scan_count == 0
+    group.defer('c', callback)
+    assert done.wait(10)
+    assert results == [True, True]
+    assert server.library.scan_count == 1
+
+
+def test_catalog_builds_then_adds_new_albums_only(navidrome, music_dir):
+    server, url = navidrome
+    client = make_client(url)[0]
+    add_track(music_dir, 'Rosalía', 'Malamente', album='El Mal Querer')
+    add_track(music_dir, 'Bad Bunny', 'Tití Me Preguntó', album='Un Verano Sin Ti')
+    catalog = NavidromeCatalog(client)
+    coordinator = ScanCoordinator(client, timeout=10, on_complete=catalog.mark_stale)
+    assert coordinator.scan_and_wait()
+
+    assert catalog.lookup('Rosalia', 'Malamente') is not None
+    assert catalog.lookup('Bad Bunny feat. Someone', 'Titi Me Pregunto') is not None
+    assert catalog.lookup('Rosalía', 'Missing') is None
+    assert len(catalog) == 2
+
+    add_track(music_dir, 'Rosalía', 'Despechá', album='Motomami')
+    assert coordinator.scan_and_wait()
+    searches = server.library.requests['search3']
+    assert catalog.resolve_many([('Rosalía', 'Despechá'), ('Rosalía', 'Malamente')])[0] is not None
+    assert len(catalog) == 3
+    # Picked up from the new album, not by listing every song again
+    assert server.library.requests['search3'] == searches
+    assert server.library.requests['getAlbum'] == 1
+
+
+class StubScanClient:
+    """Scan status that never shows a scan running; lastScan changes after `finish_after` polls"""
+
+    def __init__(self, last_scan='2026-01-01T00:00:00Z', finish_after=None):
+        self.status = {'scanning': False, 'count': 10}
+        if last_scan:
+            self.status['lastScan'] = last_scan
+        self.finish_after = finish_after
+        self.polls = 0
+
+    def start_scan(self):
+        return dict(self.status)
+
+    def get_scan_status(self):
+        self.polls += 1
+        if self.finish_after is not None and self.polls > self.finish_after:
+            self.status['lastScan'] = '2026-01-01T00:01:00Z'
+        return dict(self.status)
+
+
+def test_unseen_scan_counts_only_once_last_scan_moves():
+    assert ScanCoordinator(StubScanClient(finish_after=3), timeout=10).scan_and_wait()
+    # lastScan never moves: not complete, however long it idles
+    assert not ScanCoordinator(StubScanClient(), timeout=1).scan_and_wait()
+
+
+def test_unseen_scan_without_last_scan_is_not_complete(monkeypatch):
+    monkeypatch.setattr(scan_coordinator, 'IDLE_GRACE', 0.3)
+    client = StubScanClient(last_scan=None)
+    started = time.monotonic()
+    assert not ScanCoordinator(client, timeout=10).scan_and_wait()
+    assert time.monotonic() - started < 5
+
+
+def test_post_is_retried_only_when_the_connection_is_refused(navidrome):
+    server, url = navidrome
+    port = server.server_address[1]
+    server.shutdown()
+    server.server_close()
+    client, calls = make_client(f"http://127.0.0.1:{port}", retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.post('createPlaylist', name='Mix', songId=['so-1'])
+    assert calls == [('createPlaylist', 'failed')] * 3
+
+
+def test_post_is_not_resent_after_the_server_dropped_the_connection():
+    # Accepts and reads the request, then closes the connection without answering
+    listener = socket.create_server(('127.0.0.1', 0))
+    received = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            received.append(conn.recv(65536))
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    client, calls = make_client(f"http://127.0.0.1:{listener.getsockname()[1]}", retries=2)
+    try:
+        with pytest.raises(requests.ConnectionError):
+            client.post('createPlaylist', name='Mix', songId=['so-1'])
+    finally:
+        listener.close()
+    assert calls == [('createPlaylist', 'failed')]
+    assert len(received) == 1
@@ -0,0 +1,70 @@
+from playlist_sync import PlaylistSync, plan_changes
+from subsonic_client import SubsonicClient
+
+
+def playlist_songs(server, name):
+    for playlist in server.library.playlists.values():
+        if playlist['name'] == name:
+            return playlist['songs']
+    return None
+
+
+def test_sync_creates_then_sends_only_changes(navidrome):
+    server, url = navidrome
+    sync = PlaylistSync(SubsonicClient(url, 'admin', 'admin'), batch_size=2)
+    songs = [f"so-{i}" for i in range(5)]
+
+    assert sync.sync('Mix', songs) == {'created': True, 'added': 5, 'removed': 0}
+    assert playlist_songs(server, 'Mix') == songs
+
+    assert sync.sync('Mix', songs + ['so-5']) == {'created': False, 'added': 1, 'removed': 0}
+    assert sync.sync('Mix', ['so-0', 'so-2', 'so-3', 'so-4', 'so-5']) == {'created': False, 'added': 0, 'removed': 1}
+    assert playlist_songs(server, 'Mix') == ['so-0', 'so-2', 'so-3', 'so-4', 'so-5']
+
+
+def test_append_keeps_songs_already_listed(navidrome):
+    server, url = navidrome
+    sync = PlaylistSync(SubsonicClient(url, 'admin', 'admin'))
+    sync.sync('Mix', ['so-1', 'so-2'])
+    result = sync.sync('Mix', ['so-3', 'so-1'], append=True)
+    assert result == {'created': False, 'added': 1, 'removed': 0}
+    assert playlist_songs(server, 'Mix') == ['so-1', 'so-2', 'so-3']
+
+
+def test_playlist_deleted_on_the_server_is_created_again(navidrome):
+    server, url = navidrome
+    sync = PlaylistSync(SubsonicClient(url, 'admin', 'admin'))
+    sync.sync('Mix', ['so-1'])
+    server.library.playlists.clear()
+    assert sync.sync('Mix', ['so-1', 'so-2'])['created'] is True
+    assert playlist_songs(server, 'Mix') == ['so-1', 'so-2']
+
+
+def apply(current, remove, add):
+    removed = set(remove)
+    return [song for index, song in enumerate(current) if index not in removed] + add
+
+
+def test_plan_for_tail_edits_touches_only_the_changed_songs():
+    current = ['a', 'b', 'c', 'd']
+    assert plan_changes(current, ['a', 'b', 'c', 'd', 'e']) == ([], ['e'])
+    assert plan_changes(current, ['a', 'b', 'c']) == ([3], [])
+    assert plan_changes(current, ['a', 'c', 'd']) == ([1], [])
+
+
+def test_plan_for_front_and_middle_inserts_re_adds_the_tail():
+    current = ['a', 'b', 'c', 'd']
+    front = ['x', 'a', 'b', 'c', 'd']
+    remove, add = plan_changes(current, front)
+    assert (remove, add) == ([0, 1, 2, 3], front)
+    middle = ['a', 'b', 'x', 'c', 'd']
+    remove, add = plan_changes(current, middle)
+    assert (remove, add) == ([2, 3], ['x', 'c', 'd'])
+    assert apply(current, remove, add) == middle
+
+
+def test_plan_handles_moves_and_duplicates():
+    for current, desired in ((['a', 'b', 'c'], ['c', 'a', 'b']),
+                             (['a', 'a', 'b'], ['a', 'b', 'b']),
+                             ([], ['a']), (['a'], [])):
+        assert apply(current, *plan_changes(current, desired)) == desired
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from playlist_writer import PlaylistEntry, playlist_filename, read_entries, write_m3u
+
+ENTRIES = [
+    PlaylistEntry('Rosalía/Motomami/Rosalía - Saoko.mp3', 137.4, 'Rosalía - Saoko'),
+    'Bad Bunny/Bad Bunny - Tití Me Preguntó.mp3',
+]
+
+
+def test_writes_extended_m3u(tmp_path):
+    path = str(tmp_path / 'Mix.m3u')
+    assert write_m3u(path, 'Mix', ENTRIES) == (True, 2)
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == (
+            "#EXTM3U\n#PLAYLIST:Mix\n"
+            "#EXTINF:137,Rosalía - Saoko\nRosalía/Motomami/Rosalía - Saoko.mp3\n"
+            "#EXTINF:-1,Bad Bunny - Tití Me Preguntó\nBad Bunny/Bad Bunny - Tití Me Preguntó.mp3\n")
+
+
+def test_same_content_leaves_the_file_alone(tmp_path):
+    path = str(tmp_path / 'Mix.m3u')
+    write_m3u(path, 'Mix', ENTRIES)
+    before = os.stat(path)
+    assert write_m3u(path, 'Mix', ENTRIES) == (False, 2)
+    after = os.stat(path)
+    assert (after.st_ino, after.st_mtime_ns) == (before.st_ino, before.st_mtime_ns)
+    assert write_m3u(path, 'Mix', ENTRIES[:1]) == (True, 1)
+
+
+def test_append_keeps_existing_entries_and_adds_only_new_ones(tmp_path):
+    path = str(tmp_path / 'Mix.m3u')
+    write_m3u(path, 'Mix', ENTRIES[:1])
+    assert write_m3u(path, 'Mix', ENTRIES, append=True) == (True, 2)
+    assert [entry for entry, extinf in read_entries(path)] == [
+        'Rosalía/Motomami/Rosalía - Saoko.mp3', 'Bad Bunny/Bad Bunny - Tití Me Preguntó.mp3']
+    # The kept entry's #EXTINF survives the rewrite
+    assert next(read_entries(path))[1] == '#EXTINF:137,Rosalía - Saoko'
+    assert write_m3u(path, 'Mix', ENTRIES, append=True) == (False, 2)
+
+
+def test_failed_write_keeps_the_old_playlist(tmp_path):
+    path = str(tmp_path / 'Mix.m3u')
+    write_m3u(path, 'Mix', ENTRIES)
+    with open(path, encoding='utf-8') as f:
+        before = f.read()
+
+    def entries():
+        yield ENTRIES[0]
+        raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        write_m3u(path, 'Mix', entries())
+    with open(path, encoding='utf-8') as f:
+        assert f.read() == before
+    assert os.listdir(tmp_path) == ['Mix.m3u']
+
+
+def test_playlist_filename_is_safe():
+    assert playlist_filename('AC/DC: Best of?') == 'AC_DC_ Best of_'
+    assert playlist_filename(' .. ') == 'playlist'
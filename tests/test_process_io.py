@@ -0,0 +1,101 @@
+import os
+import threading
+import types
+
+from process_io import LineSplitter, OutputReader
+
+
+def pipe_process(stderr=False):
+    """A Popen stand-in whose stdout (and stderr) are pipes; returns it and the write ends"""
+    reads, writes = zip(*(os.pipe() for _ in range(2 if stderr else 1)))
+    streams = [os.fdopen(fd, 'rb', buffering=0) for fd in reads]
+    return types.SimpleNamespace(stdout=streams[0], stderr=streams[1] if stderr else None), list(writes)
+
+
+def drain(reader, keys):
+    """Lines per key until every key reached EOF"""
+    lines = {key: [] for key in keys}
+    open_keys = set(keys)
+    while open_keys:
+        for kind, key, line in reader.poll(5):
+            if kind == 'eof':
+                open_keys.remove(key)
+            else:
+                lines[key].append(line)
+    return lines
+
+
+def test_character_split_across_chunks_is_decoded_whole():
+    splitter = LineSplitter()
+    data = 'Downloaded "Rosalía - DESPECHÁ"\n'.encode()
+    cut = data.index('í'.encode()) + 1
+    assert splitter.feed(data[:cut]) == []
+    assert splitter.feed(data[cut:]) == ['Downloaded "Rosalía - DESPECHÁ"']
+
+
+def test_carriage_return_redraws_are_separate_lines():
+    splitter = LineSplitter()
+    assert splitter.feed(b' 10%|#  |\r 50%|### |\r') == [' 10%|#  |', ' 50%|### |']
+    assert splitter.feed(b'100%|####|\r\nDone\n\n') == ['100%|####|', 'Done']
+
+
+def test_long_lines_are_cut_at_max_line():
+    splitter = LineSplitter(max_line=4)
+    assert splitter.feed(b'abcdefghij') == ['abcd', 'efgh']
+    assert splitter.feed(b'k\nxy') == ['ijk']
+    assert splitter.feed(b'', final=True) == ['xy']
+
+
+def test_final_flushes_partial_line_and_truncated_character():
+    splitter = LineSplitter()
+    assert splitter.feed(b'no newline') == []
+    assert splitter.feed('ñ'.encode()[:1], final=True) == ['no newline�']
+
+
+def test_reader_merges_pipes_and_reports_eof_per_process():
+    reader = OutputReader()
+    first, (out, err) = pipe_process(stderr=True)
+    second, (other,) = pipe_process()
+    reader.add('a', first)
+    reader.add('b', second)
+    data = 'Canción\r50%\n'.encode()
+    os.write(out, data[:5])
+    os.write(other, b'one\ntwo')
+    os.write(err, b'warning\n')
+    os.write(out, data[5:] + b'tail')
+    for fd in (out, err, other):
+        os.close(fd)
+    try:
+        lines = drain(reader, ['a', 'b'])
+    finally:
+        reader.close()
+    assert sorted(lines['a']) == ['50%', 'Canción', 'tail', 'warning']
+    assert lines['a'].index('Canción') < lines['a'].index('50%') < lines['a'].index('tail')
+    assert lines['b'] == ['one', 'two']
+
+
+def test_reader_keeps_a_long_line_bounded():
+    reader = OutputReader()
+    process, (out,) = pipe_process()
+    reader.add('a', process)
+    writer = threading.Thread(target=lambda: (os.write(out, b'x' * 200_000 + b'\n'), os.close(out)))
+    writer.start()
+    try:
+        lines = drain(reader, ['a'])['a']
+    finally:
+        writer.join()
+        reader.close()
+    assert ''.join(lines) == 'x' * 200_000
+    assert max(map(len, lines)) <= 64 * 1024
+
+
+def test_wake_ends_a_waiting_poll():
+    reader = OutputReader()
+    process, (out,) = pipe_process()
+    reader.add('a', process)
+    threading.Timer(0.05, reader.wake).start()
+    try:
+        assert reader.poll(5) == []
+    finally:
+        os.close(out)
+        reader.close()
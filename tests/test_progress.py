@@ -0,0 +1,59 @@
+from progress import SpotdlProgress, DOWNLOADED, FAILED, SKIPPED
+
+# Output of `spotdl <playlist URL> --simple-tui` (spotdl 4)
+SPOTDL_OUTPUT = """\
+Processing query: https://open.spotify.com/playlist/37i9dQZF1DX0XUsuxWHRQd
+Found 5 songs in Viernes Latino (Playlist)
+Downloaded "Bad Bunny - Tití Me Preguntó": https://music.youtube.com/watch?v=Cr8K88UcO5s
+Skipping Rosalía - DESPECHÁ (file already exists) (duplicate)
+LookupError: No results found for song: Arctic Monkeys - 505 (Live at the Royal Albert Hall)
+AudioProviderError: YT-DLP download error - https://music.youtube.com/watch?v=aaaaaaaaaaa
+"""
+
+
+def feed(progress, text):
+    return [progress.feed(line) for line in text.splitlines()]
+
+
+def test_spotdl_output_sets_name_total_and_track_states():
+    progress = SpotdlProgress()
+    changed = feed(progress, SPOTDL_OUTPUT)
+    assert changed == [False, True, True, True, True, False]
+    assert progress.playlist_name == 'Viernes Latino'
+    assert progress.tracks == {
+        ('Bad Bunny', 'Tití Me Preguntó'): DOWNLOADED,
+        ('Rosalía', 'DESPECHÁ'): SKIPPED,
+        ('Arctic Monkeys', '505'): FAILED,
+    }
+    assert progress.errors[('Arctic Monkeys', '505')].startswith('LookupError')
+    assert progress.song_info_list() == [('Bad Bunny', 'Tití Me Preguntó'), ('Rosalía', 'DESPECHÁ')]
+
+
+def test_summary_counts_announced_tracks_not_reported_yet_as_found():
+    progress = SpotdlProgress()
+    feed(progress, SPOTDL_OUTPUT)
+    summary = progress.summary()
+    assert summary['found'] == 2
+    assert (summary['downloaded'], summary['skipped'], summary['failed']) == (1, 1, 1)
+    assert summary['total'] == 5
+    assert summary['percent'] == 60.0
+
+
+def test_finished_track_does_not_go_back_to_downloading():
+    progress = SpotdlProgress()
+    progress.feed('Downloaded "Karol G - Provenza": https://music.youtube.com/watch?v=ca48oMV59LU')
+    assert not progress.feed('Downloading: Karol G - Provenza')
+    assert progress.tracks[('Karol G', 'Provenza')] == DOWNLOADED
+    assert progress.feed('Failed to download "Karol G - Provenza"')
+    assert progress.summary()['downloaded'] == 0
+    assert progress.summary()['failed'] == 1
+
+
+def test_noise_lines_change_nothing():
+    progress = SpotdlProgress()
+    assert not any(feed(progress, "\n".join([
+        'Processing query: https://open.spotify.com/track/6habFhsOp2NvshLv26DqMb',
+        '  5%|▌         | 1/20 [00:01<00:19]',
+        'Embedding metadata',
+    ])))
+    assert progress.summary()['percent'] is None
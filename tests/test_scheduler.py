@@ -0,0 +1,115 @@
+import threading
+import time
+
+from scheduler import DownloadScheduler
+
+
+class Jobs:
+    """run_job that records start order and cancels, and blocks each job until released"""
+
+    def __init__(self):
+        self.started = []
+        self.cancelled = []
+        self.release = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def __call__(self, job_id, cancel_event):
+        with self.changed:
+            self.started.append(job_id)
+            release = self.release.setdefault(job_id, threading.Event())
+            self.changed.notify_all()
+        while not release.wait(0.01):
+            if cancel_event.is_set():
+                self.cancelled.append(job_id)
+                return
+
+    def wait_started(self, count, timeout=5):
+        with self.changed:
+            assert self.changed.wait_for(lambda: len(self.started) >= count, timeout), self.started
+
+    def finish(self, job_id):
+        with self.lock:
+            self.release.setdefault(job_id, threading.Event()).set()
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_jobs_run_by_priority_then_submission_order():
+    jobs = Jobs()
+    scheduler = DownloadScheduler(jobs, max_workers=1)
+    scheduler.submit('busy')
+    jobs.wait_started(1)
+    assert scheduler.submit('late') == 0
+    assert scheduler.submit('urgent', priority=-1) == 0
+    assert scheduler.submit('later') == 2
+    assert scheduler.position('late') == 1
+    for job_id in ('busy', 'urgent', 'late', 'later'):
+        jobs.finish(job_id)
+    jobs.wait_started(4)
+    assert jobs.started == ['busy', 'urgent', 'late', 'later']
+    assert scheduler.position('later') is None
+
+
+def test_cancel_queued_and_running_jobs():
+    jobs = Jobs()
+    scheduler = DownloadScheduler(jobs, max_workers=1)
+    scheduler.submit('running')
+    jobs.wait_started(1)
+    scheduler.submit('queued')
+    called = []
+    scheduler.add_cancel_callback('running', lambda: called.append('running'))
+
+    assert scheduler.cancel('queued') == 'queued'
+    assert scheduler.cancel('unknown') is None
+    assert scheduler.cancel('running') == 'running'
+    assert called == ['running']
+    wait_for(lambda: scheduler.stats()['running'] == 0)
+    assert jobs.started == jobs.cancelled == ['running']
+    assert scheduler.stats()['queued'] == 0
+
+
+def test_callback_added_after_the_cancel_runs_at_once():
+    started = threading.Event()
+    release = threading.Event()
+
+    def run_job(job_id, cancel_event):
+        # Ignores the cancel until released, like a job between two steps
+        started.set()
+        release.wait(5)
+
+    scheduler = DownloadScheduler(run_job, max_workers=1)
+    scheduler.submit('job')
+    assert started.wait(5)
+    scheduler.cancel('job')
+    called = []
+    scheduler.add_cancel_callback('job', lambda: called.append('late'))
+    assert called == ['late']
+    release.set()
+
+
+def test_resize_adds_workers_and_retires_idle_ones():
+    jobs = Jobs()
+    scheduler = DownloadScheduler(jobs, max_workers=1)
+    for job_id in 'abc':
+        scheduler.submit(job_id)
+    jobs.wait_started(1)
+    time.sleep(0.05)
+    assert jobs.started == ['a']
+
+    assert scheduler.resize(3) == 3
+    jobs.wait_started(3)
+    assert scheduler.stats()['running'] == 3
+
+    scheduler.resize(1)
+    # Running jobs are never interrupted
+    assert scheduler.stats()['running'] == 3
+    for job_id in 'abc':
+        jobs.finish(job_id)
+    wait_for(lambda: scheduler.stats()['workers'] == 1)
+    assert scheduler.stats() == {'max_workers': 1, 'workers': 1, 'running': 0, 'queued': 0}
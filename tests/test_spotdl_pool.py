@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+import spotdl_pool
+from conftest import ROOT
+from process_io import read_lines
+from spotdl_pool import SpotdlWorkerPool
+
+FAKE_ENGINE = os.path.join(ROOT, 'tools', 'fake_spotdl.py') + ':main'
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    # Commands that would fall back to the CLI say so instead of running spotdl
+    monkeypatch.setattr(spotdl_pool, 'popen_cli', lambda command: ('cli', command))
+    monkeypatch.setenv('FAKE_SPOTDL_TRACKS', '3')
+    pool = SpotdlWorkerPool(1, FAKE_ENGINE, start_timeout=30)
+    yield pool
+    pool.close()
+
+
+def run(pool, *args):
+    process = pool.popen(['spotdl', *args])
+    lines = list(read_lines(process))
+    return process, lines, process.wait()
+
+
+def test_commands_reuse_one_warm_worker(pool, tmp_path):
+    first, lines, returncode = run(pool, 'https://open.spotify.com/playlist/abc', '--output', str(tmp_path))
+    assert returncode == 0
+    assert lines[0].startswith('Found 3 songs in Fake Playlist abc')
+    assert sum(line.startswith('Downloaded "') for line in lines) == 3
+    assert len(list(tmp_path.glob('*.mp3'))) == 3
+
+    second, lines, returncode = run(pool, 'save', 'https://open.spotify.com/album/xyz',
+                                    '--save-file', str(tmp_path / 'album.spotdl'))
+    assert (lines, returncode) == ([f"Saved 3 songs to {tmp_path / 'album.spotdl'}"], 0)
+    assert second.worker is first.worker
+    assert pool.stats() == {'workers': 1, 'idle': 1, 'broken': None}
+
+
+def test_busy_pool_and_other_commands_run_on_the_cli(pool, tmp_path):
+    busy = pool.popen(['spotdl', 'https://open.spotify.com/track/abc', '--output', str(tmp_path)])
+    assert pool.popen(['spotdl', 'https://open.spotify.com/track/def'])[0] == 'cli'
+    assert pool.popen(['ffmpeg', '-version'])[0] == 'cli'
+    list(read_lines(busy))
+    assert busy.wait() == 0
+
+
+def test_engine_failure_ends_the_command_but_keeps_the_worker(pool):
+    process, lines, returncode = run(pool)
+    assert (lines, returncode) == (['No query given'], 1)
+    assert process.worker.alive()
+    assert pool.stats()['idle'] == 1
+
+
+def test_cancel_kills_the_worker(pool, monkeypatch):
+    monkeypatch.setenv('FAKE_SPOTDL_DELAY', '5')
+    process = pool.popen(['spotdl', 'https://open.spotify.com/playlist/slow'])
+    process.terminate()
+    list(read_lines(process))
+    assert process.wait() != 0
+    assert not process.worker.alive()
+    assert pool.stats()['workers'] == 0
+
+
+def test_engine_that_cannot_load_falls_back_to_the_cli(monkeypatch):
+    monkeypatch.setattr(spotdl_pool, 'popen_cli', lambda command: ('cli', command))
+    pool = SpotdlWorkerPool(1, os.path.join(ROOT, 'missing.py') + ':main', start_timeout=30)
+    assert pool.popen(['spotdl', 'https://open.spotify.com/track/abc'])[0] == 'cli'
+    assert pool.stats()['broken']
+    assert pool.stats()['workers'] == 0
@@ -0,0 +1,82 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from sync_schedule import SyncSchedule
+
+HOUR = 3600
+START = datetime(2026, 3, 1, 3, 0).timestamp()
+URL = 'https://open.spotify.com/playlist/37i9dQZF1DX0XUsuxWHRQd'
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [START]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+def make_schedule(tmp_path, submit=lambda urls: {}):
+    return SyncSchedule(str(tmp_path / 'syncs.sqlite'), submit, default_interval=24 * HOUR)
+
+
+def next_run(schedule, url=URL):
+    return datetime.fromisoformat(schedule.get(url)['next_run']).timestamp()
+
+
+def test_next_run_counts_from_when_the_sync_was_due(tmp_path, clock):
+    schedule = make_schedule(tmp_path)
+    schedule.follow(URL + '?si=abc')
+    assert schedule._take_due() == ([URL], None)
+    assert next_run(schedule) == START + 24 * HOUR
+
+    # Ran ten minutes late: the next run stays on the nightly slot
+    clock[0] = START + 24 * HOUR + 600
+    assert schedule._take_due()[0] == [URL]
+    assert next_run(schedule) == START + 48 * HOUR
+    assert schedule._take_due() == ([], 48 * HOUR - 24 * HOUR - 600)
+
+
+def test_runs_missed_while_down_are_skipped(tmp_path, clock):
+    schedule = make_schedule(tmp_path)
+    schedule.follow(URL, interval=6 * HOUR)
+    clock[0] = START + 20 * HOUR
+    assert schedule._take_due()[0] == [URL]
+    assert next_run(schedule) == START + 24 * HOUR
+    assert schedule.get(URL)['last_run'] == datetime.fromtimestamp(START + 20 * HOUR).isoformat()
+
+
+def test_follow_again_keeps_the_earlier_run_and_run_now_moves_it(tmp_path, clock):
+    schedule = make_schedule(tmp_path)
+    schedule.follow(URL, first_run=START + HOUR)
+    schedule.follow(URL, interval=HOUR, first_run=START + 5 * HOUR)
+    assert (next_run(schedule), schedule.get(URL)['interval']) == (START + HOUR, HOUR)
+    assert schedule._take_due() == ([], HOUR)
+    assert schedule.run_now(URL) == 1
+    assert schedule._take_due()[0] == [URL]
+    assert schedule.unfollow(URL + '?si=x')
+    assert schedule._take_due() == ([], None)
+
+
+def test_due_syncs_are_submitted_as_one_batch(tmp_path):
+    batches = []
+    done = threading.Event()
+
+    def submit(urls):
+        batches.append(sorted(urls))
+        done.set()
+        return {url: str(index) for index, url in enumerate(sorted(urls), 1)}
+
+    schedule = make_schedule(tmp_path, submit)
+    schedule.follow(URL)
+    schedule.follow('https://open.spotify.com/album/4aawyAB9vmqN3uQ7FjRGTy')
+    schedule.follow('https://open.spotify.com/playlist/later', first_run=time.time() + HOUR)
+    schedule.start()
+    try:
+        assert done.wait(5)
+    finally:
+        schedule.stop()
+    assert batches == [['https://open.spotify.com/album/4aawyAB9vmqN3uQ7FjRGTy', URL]]
+    assert schedule.get(URL)['last_job'] == '2'
@@ -0,0 +1,74 @@
+import os
+import struct
+import subprocess
+import sys
+
+import pytest
+from mutagen.easyid3 import EasyID3
+from mutagen.flac import FLAC
+
+import tags
+from conftest import ROOT
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz: 417-byte frames of 1152 samples
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\0' * 413
+
+
+def write_mp3(path, frames=100, **fields):
+    with open(path, 'wb') as f:
+        f.write(MP3_FRAME * frames)
+    tag = EasyID3()
+    tag.update(fields)
+    tag.save(path)
+
+
+def write_flac(path, seconds=3, sample_rate=44100, **fields):
+    # STREAMINFO: block sizes, frame sizes (unknown), rate, channels - 1, bits - 1, samples, MD5
+    info = struct.pack('>HH3s3s', 4096, 4096, b'\0' * 3, b'\0' * 3)
+    info += ((sample_rate << 44) | (1 << 41) | (15 << 36) | seconds * sample_rate).to_bytes(8, 'big')
+    info += b'\0' * 16
+    with open(path, 'wb') as f:
+        f.write(b'fLaC' + bytes([0x80, 0, 0, len(info)]) + info)
+    audio = FLAC(path)
+    audio.add_tags()
+    for name, value in fields.items():
+        audio[name] = value
+    audio.save()
+
+
+def test_mp3_tags_and_duration_from_the_frames(tmp_path):
+    path = str(tmp_path / 'song.mp3')
+    write_mp3(path, artist=['Rosalía', 'J Balvin'], title='Con Altura', album='Con Altura',
+              isrc='USSM11902717')
+    result = tags.read_tags(path)
+    assert result[:4] == ('Rosalía, J Balvin', 'Con Altura', 'Con Altura', 'USSM11902717')
+    assert result.duration == pytest.approx(100 * 1152 / 44100, abs=0.1)
+
+
+def test_flac_vorbis_comments(tmp_path):
+    path = str(tmp_path / 'song.flac')
+    write_flac(path, seconds=3, ARTIST='Bad Bunny', TITLE='Tití Me Preguntó', isrc='QMFME2214385')
+    assert tags.read_tags(path) == ('Bad Bunny', 'Tití Me Preguntó', None, 'QMFME2214385', 3.0)
+
+
+def test_tag_only_mp3_written_by_fake_spotdl(tmp_path):
+    env = dict(os.environ, FAKE_SPOTDL_TRACKS='1')
+    subprocess.run([sys.executable, os.path.join(ROOT, 'tools', 'fake_spotdl.py'),
+                    'https://open.spotify.com/track/6habFhsOp2NvshLv26DqMb'],
+                   cwd=tmp_path, env=env, check=True, capture_output=True)
+    [path] = tmp_path.glob('*.mp3')
+    result = tags.read_tags(str(path))
+    assert path.name == f"{result.artist} - {result.title}.mp3"
+    assert result.isrc and result.album
+    # No MPEG frames to measure, so the duration comes from the TLEN frame
+    assert result.duration >= 120
+
+
+def test_unreadable_files_give_none_in_order(tmp_path):
+    good = str(tmp_path / 'good.mp3')
+    write_mp3(good, title='Malamente')
+    (tmp_path / 'cover.jpg').write_bytes(b'\xff\xd8\xff\xe0' + b'\0' * 64)
+    (tmp_path / 'empty.flac').write_bytes(b'')
+    paths = [str(tmp_path / 'cover.jpg'), good, str(tmp_path / 'missing.mp3'), str(tmp_path / 'empty.flac')]
+    results = tags.read_many(paths)
+    assert [result and result.title for result in results] == [None, 'Malamente', None, None]
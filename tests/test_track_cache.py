@@ -0,0 +1,16 @@
+from track_cache import canonical_url
+
+
+def test_spotify_links_to_the_same_item_share_a_key():
+    key = 'https://open.spotify.com/playlist/37i9dQZF1DX0XUsuxWHRQd'
+    assert canonical_url('https://open.spotify.com/intl-es/playlist/37i9dQZF1DX0XUsuxWHRQd?si=abc123') == key
+    assert canonical_url('spotify:playlist:37i9dQZF1DX0XUsuxWHRQd') == key
+
+
+def test_other_urls_keep_their_query_without_tracking_params():
+    first = canonical_url('https://www.youtube.com/watch?v=aaa&si=x1')
+    second = canonical_url('https://www.youtube.com/watch?v=bbb&utm_source=share')
+    assert first == 'https://www.youtube.com/watch?v=aaa'
+    assert second == 'https://www.youtube.com/watch?v=bbb'
+    assert canonical_url('https://WWW.youtube.com/watch?utm_medium=x&v=aaa') == first
+    assert canonical_url('https://music.youtube.com/playlist?list=PL1/') == 'https://music.youtube.com/playlist?list=PL1/'
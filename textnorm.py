@@ -0,0 +1,39 @@
+import re
+import unicodedata
+
+_BRACKETS = re.compile(r'[(\[][^)\]]*[)\]]')
+_SUFFIXES = re.compile(r'\s+-\s+(?:\d{4}\s+)?(?:remaster(?:ed)?|live|single version|radio edit|mono|stereo)\b.*$')
+_NON_WORD = re.compile(r'[^\w]+')
+_ARTIST_SPLIT = re.compile(r'\s*(?:,|&|;|/|\bfeat\.?|\bft\.?|\bfeaturing\b|\bx\b)\s*')
+
+
+def normalize(text):
+    """Lowercase, strip accents, bracketed suffixes and punctuation"""
+    if not text:
+        return ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.lower()
+    text = _BRACKETS.sub(' ', text)
+    text = _SUFFIXES.sub('', text)
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+
+def artist_keys(artist):
+    """Normalized forms of an artist string: the whole credit plus each individual artist"""
+    keys = []
+    whole = normalize(artist)
+    if whole:
+        keys.append(whole)
+    for part in _ARTIST_SPLIT.split((artist or '').lower()):
+        key = normalize(part)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+
+def credit_overlaps(a, b):
+    # Very short names ("a", "x") would be contained in almost anything
+    shorter, longer = sorted((a, b), key=len)
+    return len(shorter) > 2 and shorter in longer
@@ -0,0 +1,344 @@
+"""Minimal fake Subsonic/Navidrome server for local testing.
+
+Serves the JSON (f=json) endpoints spotdl-web uses. The song list comes from
+"Artist - Title.ext" filenames under --music-dir, re-read on every startScan,
+or from a JSON file of {"artist", "title", "album"} objects via --songs.
+Playlists are kept in memory.
+
+    python tools/fake_navidrome.py --port 4533 --music-dir /tmp/music
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.flac', '.wav', '.ogg')
+
+
+class NotFound(Exception):
+    """Answered with Subsonic error 70, like Navidrome for an unknown ID"""
+
+
+def _short_hash(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:12]
+
+
+def _iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+class FakeLibrary:
+    """Song list plus scan state, shared by all request threads"""
+
+    def __init__(self, music_dir=None, songs=None, scan_seconds=0.5, latency=0.0):
+        self.music_dir = music_dir
+        self.scan_seconds = scan_seconds
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.scanning = False
+        self.scan_count = 0
+        self.last_scan = None
+        self.last_modified = int(time.time() * 1000)
+        self.songs = []
+        self.albums = {}
+        self.playlists = {}
+        self.requests = {}
+        self._load(songs if songs is not None else self._read_music_dir())
+
+    def _read_music_dir(self):
+        songs = []
+        if not self.music_dir:
+            return songs
+        for root, dirs, files in os.walk(self.music_dir):
+            for name in files:
+                if not name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+                stem = os.path.splitext(name)[0]
+                artist, _, title = stem.partition(' - ')
+                if not title:
+                    artist, title = 'Unknown Artist', stem
+                rel_path = os.path.relpath(os.path.join(root, name), self.music_dir)
+                album = os.path.basename(root) if root != self.music_dir else 'Singles'
+                songs.append({'artist': artist, 'title': title, 'album': album, 'path': rel_path})
+        return songs
+
+    def _load(self, entries):
+        # IDs are derived from names and paths so they survive rescans like Navidrome's
+        songs, albums = [], {}
+        created = {album['id']: album['created'] for album in self.albums.values()}
+        now = time.time()
+        for entry in entries:
+            album_key = (entry.get('albumArtist', entry['artist']), entry.get('album', 'Singles'))
+            album = albums.get(album_key)
+            if album is None:
+                album_id = 'al-' + _short_hash('\0'.join(album_key))
+                album = {
+                    'id': album_id,
+                    'name': album_key[1],
+                    'artist': album_key[0],
+                    'songCount': 0,
+                    'created': created.get(album_id, now),
+                    'song': [],
+                }
+                albums[album_key] = album
+            path = entry.get('path', f"{entry['artist']} - {entry['title']}.mp3")
+            song = {
+                'id': entry.get('id') or 'so-' + _short_hash(path),
+                'title': entry['title'],
+                'artist': entry['artist'],
+                'album': album['name'],
+                'albumId': album['id'],
+                'path': path,
+                'duration': entry.get('duration', 180),
+                'isDir': False,
+            }
+            album['song'].append(song)
+            album['songCount'] += 1
+            songs.append(song)
+        with self.lock:
+            self.songs = songs
+            self.albums = {album['id']: album for album in albums.values()}
+
+    def start_scan(self):
+        with self.lock:
+            if self.scanning:
+                return
+            self.scanning = True
+
+        def scan():
+            time.sleep(self.scan_seconds)
+            if self.music_dir:
+                self._load(self._read_music_dir())
+            with self.lock:
+                self.scanning = False
+                self.scan_count += 1
+                self.last_scan = _iso(time.time())
+                self.last_modified = int(time.time() * 1000)
+
+        threading.Thread(target=scan, daemon=True).start()
+
+    def scan_status(self):
+        with self.lock:
+            status = {'scanning': self.scanning, 'count': len(self.songs), 'folderCount': len(self.albums)}
+            if self.last_scan:
+                status['lastScan'] = self.last_scan
+            return status
+
+
+class FakeSubsonicHandler(BaseHTTPRequestHandler):
+    library = None
+    user = 'admin'
+    password = 'admin'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def _handle(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        if self.command == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            for key, values in parse_qs(self.rfile.read(length).decode('utf-8')).items():
+                params.setdefault(key, []).extend(values)
+        if not parsed.path.startswith('/rest/'):
+            # Like Navidrome, which only serves the API under /rest
+            self.send_error(404)
+            return
+        endpoint = parsed.path.rsplit('/', 1)[-1]
+        if endpoint.endswith('.view'):
+            endpoint = endpoint[:-len('.view')]
+
+        library = self.library
+        with library.lock:
+            library.requests[endpoint] = library.requests.get(endpoint, 0) + 1
+        if library.latency:
+            time.sleep(library.latency)
+
+        if not self._authenticated(params):
+            return self._send({'status': 'failed', 'error': {'code': 40, 'message': 'Wrong username or password'}})
+        handler = getattr(self, f"api_{endpoint}", None)
+        if handler is None:
+            return self._send({'status': 'failed', 'error': {'code': 0, 'message': f"Unknown endpoint {endpoint}"}})
+        try:
+            body = handler(params)
+        except NotFound as e:
+            return self._send({'status': 'failed', 'error': {'code': 70, 'message': f"Not found: {e}"}})
+        except (KeyError, ValueError) as e:
+            return self._send({'status': 'failed', 'error': {'code': 10, 'message': f"Bad parameter: {e}"}})
+        self._send(dict({'status': 'ok'}, **body))
+
+    def _authenticated(self, params):
+        if params.get('u', [None])[0] != self.user:
+            return False
+        if 't' in params and 's' in params:
+            expected = hashlib.md5((self.password + params['s'][0]).encode('utf-8')).hexdigest()
+            return params['t'][0] == expected
+        return params.get('p', [None])[0] == self.password
+
+    def _send(self, body):
+        body.setdefault('version', '1.16.1')
+        data = json.dumps({'subsonic-response': body}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def api_ping(self, params):
+        return {}
+
+    def api_startScan(self, params):
+        self.library.start_scan()
+        return {'scanStatus': self.library.scan_status()}
+
+    def api_getScanStatus(self, params):
+        return {'scanStatus': self.library.scan_status()}
+
+    def api_getIndexes(self, params):
+        since = int(params.get('ifModifiedSince', ['0'])[0])
+        with self.library.lock:
+            last_modified = self.library.last_modified
+            if since >= last_modified:
+                return {'indexes': {'lastModified': last_modified}}
+            artists = sorted({song['artist'] for song in self.library.songs})
+        index = {}
+        for artist in artists:
+            index.setdefault(artist[:1].upper(), []).append({'id': f"ar-{artist}", 'name': artist})
+        return {'indexes': {
+            'lastModified': last_modified,
+            'index': [{'name': name, 'artist': entries} for name, entries in sorted(index.items())],
+        }}
+
+    def api_search3(self, params):
+        query = params.get('query', [''])[0].strip('"').lower()
+        count = int(params.get('songCount', ['20'])[0])
+        offset = int(params.get('songOffset', ['0'])[0])
+        with self.library.lock:
+            songs = [
+                s for s in self.library.songs
+                if not query or query in s['title'].lower() or query in s['artist'].lower()
+            ]
+        return {'searchResult3': {'song': songs[offset:offset + count]}}
+
+    def api_getAlbumList2(self, params):
+        size = int(params.get('size', ['10'])[0])
+        offset = int(params.get('offset', ['0'])[0])
+        with self.library.lock:
+            albums = sorted(self.library.albums.values(), key=lambda a: a['created'], reverse=True)
+        page = [
+            dict({k: v for k, v in album.items() if k not in ('song', 'created')}, created=_iso(album['created']))
+            for album in albums[offset:offset + size]
+        ]
+        return {'albumList2': {'album': page}}
+
+    def api_getAlbum(self, params):
+        with self.library.lock:
+            album = self.library.albums[params['id'][0]]
+        return {'album': dict(album, created=_iso(album['created']))}
+
+    def _playlist(self, playlist, entries=True):
+        with self.library.lock:
+            songs = {song['id']: song for song in self.library.songs}
+        body = {k: v for k, v in playlist.items() if k != 'songs'}
+        body.update(songCount=len(playlist['songs']), owner=self.user, public=False)
+        if entries:
+            body['entry'] = [songs.get(song_id, {'id': song_id}) for song_id in playlist['songs']]
+        return body
+
+    def api_getPlaylists(self, params):
+        with self.library.lock:
+            playlists = list(self.library.playlists.values())
+        return {'playlists': {'playlist': [self._playlist(p, entries=False) for p in playlists]}}
+
+    def api_getPlaylist(self, params):
+        with self.library.lock:
+            playlist = self.library.playlists.get(params['id'][0])
+        if playlist is None:
+            raise NotFound(params['id'][0])
+        return {'playlist': self._playlist(playlist)}
+
+    def api_createPlaylist(self, params):
+        song_ids = params.get('songId', [])
+        with self.library.lock:
+            if 'playlistId' in params:
+                # Replaces the songs of an existing playlist
+                playlist = self.library.playlists[params['playlistId'][0]]
+                playlist['songs'] = list(song_ids)
+            else:
+                playlist_id = f"pl-{len(self.library.playlists) + 1}"
+                playlist = {'id': playlist_id, 'name': params['name'][0], 'songs': list(song_ids)}
+                self.library.playlists[playlist_id] = playlist
+        return {'playlist': self._playlist(playlist)}
+
+    def api_updatePlaylist(self, params):
+        with self.library.lock:
+            playlist = self.library.playlists[params['playlistId'][0]]
+            if 'name' in params:
+                playlist['name'] = params['name'][0]
+            # Indexes refer to the list before this call, like Navidrome
+            remove = {int(i) for i in params.get('songIndexToRemove', [])}
+            playlist['songs'] = [s for i, s in enumerate(playlist['songs']) if i not in remove]
+            playlist['songs'].extend(params.get('songIdToAdd', []))
+        return {}
+
+    def api_deletePlaylist(self, params):
+        with self.library.lock:
+            del self.library.playlists[params['id'][0]]
+        return {}
+
+
+def make_server(host='127.0.0.1', port=0, user='admin', password='admin', **library_options):
+    """Build a fake server; port 0 picks a free port (see server.server_address)"""
+    handler = type('Handler', (FakeSubsonicHandler,), {
+        'library': FakeLibrary(**library_options),
+        'user': user,
+        'password': password,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.library = handler.library
+    return server
+
+
+def start_in_thread(**options):
+    """Start a fake server on a background thread, returns (server, base_url)"""
+    server = make_server(**options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=4533)
+    parser.add_argument('--user', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--music-dir', help='directory of "Artist - Title.ext" files to serve')
+    parser.add_argument('--songs', help='JSON file with a list of {"artist", "title", "album"} objects')
+    parser.add_argument('--scan-seconds', type=float, default=0.5, help='how long a scan takes')
+    parser.add_argument('--latency', type=float, default=0.0, help='added delay per request in seconds')
+    args = parser.parse_args()
+
+    songs = None
+    if args.songs:
+        with open(args.songs, encoding='utf-8') as f:
+            songs = json.load(f)
+    server = make_server(args.host, args.port, args.user, args.password, music_dir=args.music_dir,
+                         songs=songs, scan_seconds=args.scan_seconds, latency=args.latency)
+    print(f"Fake Navidrome on http://{args.host}:{args.port} with {len(server.library.songs)} songs", flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Stand-in for the spotdl CLI, for benchmarks and local testing.
+
+Accepts the same command lines the app uses (`spotdl URL... --output DIR ...`
+and `spotdl save URL --save-file FILE`), prints spotdl-style output and writes
+small "Artist - Title.mp3" files carrying an ID3v2.4 tag (artist, title, album,
+ISRC, length) in front of the placeholder audio. The track list is derived from the URL, so
+submitting the same URL twice skips files written the first time, and the
+track URLs listed by `save` download the same files as their playlist.
+
+Environment:
+    FAKE_SPOTDL_TRACKS         tracks per playlist/album URL (default 10)
+    FAKE_SPOTDL_DELAY          seconds spent per track (default 0)
+    FAKE_SPOTDL_BYTES          size of each written file (default 1024)
+    FAKE_SPOTDL_FAIL_EVERY     every Nth track fails its first attempt with an
+                               HTTP 429 error (default 0, never)
+    FAKE_SPOTDL_MISSING_EVERY  every Nth track is never found on YouTube
+                               (default 0, never)
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+
+# 22 characters like a real Spotify ID: the URL seed plus the track position
+TRACK_ID_PATTERN = re.compile(r'/track/([0-9a-f]{8}\d{14})\b')
+
+
+def track_info(track_id):
+    """(artist, title) for a fake track ID"""
+    seed, position = track_id[:8], int(track_id[8:])
+    return f"Fake Artist {seed[:4]}{position % 7}", f"Fake Song {seed} {position}"
+
+
+def track_isrc(track_id):
+    # CC + registrant + year/designation, 12 characters like a real ISRC
+    return f"QZ{track_id[:3].upper()}{int(track_id[8:]) % 10 ** 7:07d}"
+
+
+def track_duration(track_id):
+    return 120 + int(track_id[8:]) % 180
+
+
+def id3_tag(frames):
+    """ID3v2.4 tag with UTF-8 text frames from a {frame ID: text} dict"""
+    def syncsafe(n):
+        return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+    body = b''
+    for frame_id, text in frames.items():
+        data = b'\x03' + text.encode('utf-8')
+        body += frame_id.encode('ascii') + syncsafe(len(data)) + b'\0\0' + data
+    return b'ID3\x04\0\0' + syncsafe(len(body)) + body
+
+
+def tracks_for(url, count):
+    """Deterministic (track_id, artist, title) list for a URL"""
+    match = TRACK_ID_PATTERN.search(url)
+    if match:
+        return [(match.group(1),) + track_info(match.group(1))]
+    seed = hashlib.md5(url.encode('utf-8')).hexdigest()[:8]
+    if '/track/' in url:
+        count = 1
+    return [(track_id,) + track_info(track_id) for track_id in (f"{seed}{i:014d}" for i in range(count))]
+
+
+def collection_name(url):
+    kind = 'Playlist' if '/playlist/' in url else 'Album'
+    return kind, f"Fake {kind} {url.rstrip('/').rsplit('/', 1)[-1]}"
+
+
+def save(args, count):
+    """`spotdl save`: write the metadata of every track to a JSON .spotdl file"""
+    save_file = args[args.index('--save-file') + 1]
+    songs = []
+    for url in (a for a in args if a.startswith('http') or a.startswith('spotify:')):
+        tracks = tracks_for(url, count)
+        list_name = collection_name(url)[1] if '/playlist/' in url or '/album/' in url else None
+        for position, (track_id, artist, title) in enumerate(tracks, 1):
+            songs.append({
+                'name': title, 'artists': [artist], 'artist': artist,
+                'album_name': f"Fake Album {track_id[:8]}", 'song_id': track_id,
+                'duration': track_duration(track_id), 'isrc': track_isrc(track_id),
+                'url': f"https://open.spotify.com/track/{track_id}",
+                'list_name': list_name, 'list_url': url if list_name else None,
+                'list_position': position if list_name else None,
+                'list_length': len(tracks) if list_name else None,
+            })
+    with open(save_file, 'w') as f:
+        json.dump(songs, f)
+    print(f"Saved {len(songs)} songs to {save_file}", flush=True)
+    return 0
+
+
+def main(argv):
+    args = list(argv)
+    count = int(os.environ.get('FAKE_SPOTDL_TRACKS', '10'))
+    if args and args[0] == 'save':
+        return save(args[1:], count)
+    output = '.'
+    if '--output' in args:
+        output = args[args.index('--output') + 1]
+    urls = [a for a in args if a.startswith('http') or a.startswith('spotify:')]
+    if not urls:
+        print("No query given", flush=True)
+        return 1
+
+    delay = float(os.environ.get('FAKE_SPOTDL_DELAY', '0'))
+    size = int(os.environ.get('FAKE_SPOTDL_BYTES', '1024'))
+    fail_every = int(os.environ.get('FAKE_SPOTDL_FAIL_EVERY', '0'))
+    missing_every = int(os.environ.get('FAKE_SPOTDL_MISSING_EVERY', '0'))
+    # Remembers which tracks already failed once, per output directory
+    attempts_dir = os.path.join(tempfile.gettempdir(), 'fake-spotdl-' + hashlib.md5(os.path.abspath(output).encode()).hexdigest()[:8])
+
+    for url in urls:
+        tracks = tracks_for(url, count)
+        if '/playlist/' in url or '/album/' in url:
+            kind, name = collection_name(url)
+            print(f"Found {len(tracks)} songs in {name} ({kind})", flush=True)
+        for track_id, artist, title in tracks:
+            name = f"{artist} - {title}.mp3"
+            path = os.path.join(output, name)
+            if os.path.exists(path):
+                print(f"Skipping {artist} - {title} (file already exists) (duplicate)", flush=True)
+                continue
+            if delay:
+                time.sleep(delay)
+            position = int(track_id[8:]) + 1
+            if missing_every and position % missing_every == 0:
+                print(f"LookupError: No results found for song: {artist} - {title}", flush=True)
+                continue
+            if fail_every and position % fail_every == 0:
+                marker = os.path.join(attempts_dir, track_id)
+                if not os.path.exists(marker):
+                    os.makedirs(attempts_dir, exist_ok=True)
+                    open(marker, 'w').close()
+                    print(f'Failed to download "{artist} - {title}": HTTP Error 429: Too Many Requests', flush=True)
+                    continue
+            # Write under a temporary name and rename, like spotdl/ffmpeg do
+            tmp_path = path + '.part'
+            tag = id3_tag({'TPE1': artist, 'TIT2': title, 'TALB': f"Fake Album {track_id[:8]}",
+                           'TSRC': track_isrc(track_id), 'TLEN': str(track_duration(track_id) * 1000)})
+            with open(tmp_path, 'wb') as f:
+                f.write(tag + b'\0' * max(0, size - len(tag)))
+            os.replace(tmp_path, path)
+            print(f'Downloaded "{artist} - {title}": https://music.youtube.com/watch?v={hashlib.md5(name.encode()).hexdigest()[:11]}', flush=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
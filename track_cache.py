@@ -0,0 +1,123 @@
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+from sqlite_db import open_db
+
+SPOTIFY_URL_PATTERN = re.compile(r'open\.spotify\.com/(?:intl-\w+/)?(track|album|playlist)/([A-Za-z0-9]+)')
+SPOTIFY_URI_PATTERN = re.compile(r'spotify:(track|album|playlist):([A-Za-z0-9]+)')
+# Query parameters that only track who shared a link
+TRACKING_PARAMS = re.compile(r'si$|utm_\w+$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    track_id TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    title TEXT NOT NULL,
+    album TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS listings (
+    url TEXT PRIMARY KEY,
+    name TEXT,
+    tracks TEXT NOT NULL,
+    fetched REAL NOT NULL
+);
+"""
+
+
+def spotify_ref(url):
+    """Return (kind, id) for a Spotify track/album/playlist URL or URI, else None"""
+    match = SPOTIFY_URL_PATTERN.search(url) or SPOTIFY_URI_PATTERN.search(url)
+    return (match.group(1), match.group(2)) if match else None
+
+
+def canonical_url(url):
+    """Key under which submissions of the same URL are considered duplicates"""
+    ref = spotify_ref(url)
+    if ref:
+        return f"https://open.spotify.com/{ref[0]}/{ref[1]}"
+    # Tracking parameters (?si=...) don't change what gets downloaded; the rest
+    # of the query may (YouTube's ?v=), so it is kept
+    parts = urlsplit(url.strip())
+    query = '&'.join(param for param in parts.query.split('&')
+                     if param and not TRACKING_PARAMS.match(param.split('=', 1)[0]))
+    return urlunsplit((parts.scheme, parts.netloc.lower(), parts.path.rstrip('/'), query, parts.fragment))
+
+
+def track_url(track_id):
+    return f"https://open.spotify.com/track/{track_id}"
+
+
+class TrackCache:
+    """SQLite cache of Spotify track IDs to files in the music directory.
+
+    Also remembers the track list of each Spotify URL for `ttl` seconds, so
+    resubmitting a URL within that time needs no Spotify lookup at all. Paths
+    are relative to the music directory and are checked on disk before they
+    are trusted.
+    """
+
+    def __init__(self, music_dir, db_path, ttl=6 * 3600):
+        self.music_dir = music_dir
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = open_db(db_path, SCHEMA)
+
+    def listing(self, url, expired=False):
+        """Return (name, tracks) cached for a Spotify URL, or None if unknown or expired.
+
+        With expired=True the last known list is returned however old it is.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, tracks, fetched FROM listings WHERE url = ?", (canonical_url(url),)).fetchone()
+        if row is None or (not expired and time.time() - row[2] > self.ttl):
+            return None
+        return row[0], json.loads(row[1])
+
+    def save_listing(self, url, name, tracks):
+        """Store the track list of a URL; tracks are dicts with id, artist, title and album"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO listings (url, name, tracks, fetched) VALUES (?, ?, ?, ?)",
+                (canonical_url(url), name, json.dumps(tracks), time.time()))
+            self._conn.commit()
+
+    def owned(self, track_ids):
+        """Return {track_id: relative path} for the given tracks whose file still exists"""
+        track_ids = list(track_ids)
+        found, stale = {}, []
+        with self._lock:
+            for start in range(0, len(track_ids), 500):
+                chunk = track_ids[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT track_id, path FROM tracks WHERE track_id IN ({', '.join('?' * len(chunk))})",
+                    chunk).fetchall()
+                for track_id, path in rows:
+                    if os.path.exists(os.path.join(self.music_dir, path)):
+                        found[track_id] = path
+                    else:
+                        stale.append((track_id,))
+            if stale:
+                self._conn.executemany("DELETE FROM tracks WHERE track_id = ?", stale)
+                self._conn.commit()
+        return found
+
+    def remember(self, entries):
+        """Record (track_id, relative path, artist, title, album) tuples"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracks (track_id, path, artist, title, album, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((track_id, path, artist, title, album, now) for track_id, path, artist, title, album in entries))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()